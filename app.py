@@ -1,9 +1,30 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
-from db import db, init_db, Category, Product, Inventory, Transaction
-from datetime import datetime
+from db import (db, Category, Product, Inventory, Transaction, CategoryStockRollup, DEFAULT_REORDER_POINT,
+                adjust_stock, get_stock, apply_rollup_delta, bump_data_version, rebuild_category_rollup,
+                set_reorder_point, DailyMovement, record_movements, rebuild_daily_movements, retag_daily_movements,
+                StockCheckpoint, inventory_stats, inventory_stats_as_of, inventory_summary, take_stock_checkpoint,
+                parse_reorder_point, prune_tombstones, category_products_query, product_by_sku_query,
+                transaction_export_query)
+from pagination import parse_limit, parse_as_of, transaction_filters
+from importer import FORMATS, detect_format, import_products
+from search import MAX_QUERY_LENGTH, SEARCH_LIMIT, search_products
+from cache import cached_json, response_cache
+from events import KEEPALIVE_SECONDS, STREAM_RETRY_MS, STREAM_URL, queue_event, stock_events
+from migrations import migrate, pending_migrations
+from config import get_config
+from pool_metrics import pool_status
+from serializers import CATEGORY_FIELDS, PRODUCT_FIELDS, parse_fields
+from services import (EXPORT_CHUNK_SIZE, ExportFormatter, category_listing, change_feed_page, low_stock_page,
+                      movement_report, parse_changes_args, parse_movement_args, parse_transaction_page_args,
+                      post_transaction_batch, product_listing, queue_stock_event, transaction_page)
+from datetime import datetime, timedelta
+import click
 import os
+import queue
+import threading
+import time
 
 # Load environment variables
 load_dotenv()
@@ -12,38 +33,74 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
-# Configure database
-DATABASE_URL = os.environ.get('DATABASE_URL', 'postgresql://localhost/inventory_db')
-app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Configure database (engine/pool profile selected by FLASK_ENV)
+app_config = get_config()
+app.config.from_object(app_config)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = app_config.engine_options()
 db.init_app(app)
+stock_events.configure(app_config)
 
-# Flag to track if DB is initialized
-_db_initialized = False
+# Seconds a worker trusts its cached data version before re-reading it
+response_cache.ttl = float(os.environ.get('RESPONSE_CACHE_TTL', '1.0'))
+
+# Apply pending migrations at startup; disable when a release step runs `flask db-upgrade`
+AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', 'true').lower() not in ('0', 'false', 'no')
+
+# Seconds between bootstrap retries while the database is not ready
+DB_RETRY_SECONDS = float(os.environ.get('DB_RETRY_SECONDS', '5'))
+
+# Readiness flag, set once the schema is known to be current. Requests only
+# check this flag; schema work happens at startup, via `flask db-upgrade`, or
+# in a throttled retry while the flag is still down.
+_db_ready = False
+_last_bootstrap = 0.0
+_bootstrap_lock = threading.Lock()
+
+def bootstrap_database(apply_migrations=True):
+    """Apply (or just check for) pending migrations and update the readiness flag"""
+    global _db_ready, _last_bootstrap
+    _last_bootstrap = time.monotonic()
+    try:
+        with app.app_context():
+            if apply_migrations:
+                applied = migrate()
+                if applied:
+                    print(f"Applied migrations: {', '.join(applied)}")
+                _db_ready = True
+            else:
+                pending = pending_migrations()
+                if pending:
+                    print(f"Warning: {len(pending)} pending migrations, run `flask --app app db-upgrade`")
+                _db_ready = not pending
+    except Exception as e:
+        print(f"Warning: Could not initialize database: {e}")
+        _db_ready = False
+    return _db_ready
+
+def retry_bootstrap():
+    """Re-run the bootstrap at most once per DB_RETRY_SECONDS, from one thread at a time"""
+    if time.monotonic() - _last_bootstrap < DB_RETRY_SECONDS or not _bootstrap_lock.acquire(blocking=False):
+        return _db_ready
+    try:
+        if not _db_ready:
+            bootstrap_database(apply_migrations=AUTO_MIGRATE)
+    finally:
+        _bootstrap_lock.release()
+    return _db_ready
 
-def ensure_db_initialized():
-    """Safely initialize database on first request"""
-    global _db_initialized
-    if not _db_initialized:
-        try:
-            init_db(app)
-            _db_initialized = True
-            print("Database initialized successfully")
-        except Exception as e:
-            print(f"Warning: Could not initialize database: {e}")
-            _db_initialized = False
-
-# Initialize DB on first request (not on module load)
 @app.before_request
-def before_request():
-    """Ensure database is initialized before each request"""
-    ensure_db_initialized()
+def require_database():
+    """Answer API calls with 503 until the database is ready, retrying the bootstrap now and then"""
+    if _db_ready or not request.path.startswith('/api/') or request.endpoint in ('health', 'readiness', 'pool_metrics'):
+        return None
+    if not retry_bootstrap():
+        return jsonify({'error': 'Database not ready'}), 503
 
 # Home route
 @app.route('/')
 def index():
     """Render main dashboard page"""
-    return render_template('index.html')
+    return render_template('index.html', stream_url=STREAM_URL)
 
 # Health check endpoint
 @app.route('/api/health', methods=['GET'])
@@ -51,13 +108,32 @@ def health():
     """Health check endpoint"""
     return jsonify({'status': 'ok', 'message': 'Server is running'}), 200
 
+# Readiness probe
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    """Report whether the database is ready, retrying the bootstrap if it is not"""
+    if not retry_bootstrap():
+        return jsonify({'status': 'unavailable', 'message': 'Database not ready'}), 503
+    return jsonify({'status': 'ok', 'message': 'Database ready'}), 200
+
+# Connection pool telemetry
+@app.route('/api/metrics/pool', methods=['GET'])
+def pool_metrics():
+    """Report connection pool occupancy and checkout wait times"""
+    return jsonify(pool_status(db.engine)), 200
+
 # Categories endpoints
 @app.route('/api/categories', methods=['GET'])
+@cached_json
 def get_categories_endpoint():
-    """Get all categories"""
+    """Get all categories (``fields=`` selects a sparse fieldset)"""
     try:
-        categories = Category.query.all()
-        return jsonify([cat.to_dict() for cat in categories]), 200
+        try:
+            fields = parse_fields(request.args.get('fields'), CATEGORY_FIELDS, extra=['product_count'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify(category_listing(fields)), 200
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -81,6 +157,10 @@ def create_category_endpoint():
             description=data.get('description', '')
         )
         db.session.add(category)
+        db.session.flush()  # Get the category ID for its rollup row
+        db.session.add(CategoryStockRollup(category_id=category.id))
+        queue_event('category_created', {'category_id': category.id})
+        bump_data_version()
         db.session.commit()
         
         return jsonify(category.to_dict()), 201
@@ -98,10 +178,13 @@ def delete_category_endpoint(category_id):
             return jsonify({'error': 'Category not found'}), 404
         
         # Check if category has products
-        if category.products:
+        if db.session.scalar(category_products_query(category_id)):
             return jsonify({'error': 'Cannot delete category with existing products'}), 400
         
         db.session.delete(category)
+        CategoryStockRollup.query.filter_by(category_id=category_id).delete()
+        queue_event('category_deleted', {'category_id': category_id})
+        bump_data_version()
         db.session.commit()
         
         return jsonify({'message': 'Category deleted successfully'}), 200
@@ -112,11 +195,54 @@ def delete_category_endpoint(category_id):
 
 # Products endpoints
 @app.route('/api/products', methods=['GET'])
+@cached_json
 def get_products_endpoint():
-    """Get all products"""
+    """Get all products (``fields=`` selects a sparse fieldset).
+
+    ``as_of`` (date or datetime) lists the products that existed then, with
+    their stock at that moment rebuilt from the nearest checkpoint.
+    """
     try:
-        products = Product.query.all()
-        return jsonify([prod.to_dict() for prod in products]), 200
+        try:
+            fields = parse_fields(request.args.get('fields'), PRODUCT_FIELDS, extra=['inventory'])
+            as_of = parse_as_of(request.args.get('as_of'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify(product_listing(fields, as_of)), 200
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/products/search', methods=['GET'])
+@cached_json
+def search_products_endpoint():
+    """Search products by SKU prefix or name, best matches first.
+
+    Query params: ``q``, ``limit`` and ``offset`` (``next_offset`` of the
+    previous page).
+    """
+    try:
+        q = (request.args.get('q') or '').strip()
+        if not q:
+            return jsonify({'error': 'Search query is required'}), 400
+        if len(q) > MAX_QUERY_LENGTH:
+            return jsonify({'error': f'Search query too long. Maximum: {MAX_QUERY_LENGTH}'}), 400
+        try:
+            limit = parse_limit(request.args.get('limit'), default=SEARCH_LIMIT)
+            offset = int(request.args.get('offset') or 0)
+            if offset < 0:
+                raise ValueError('offset cannot be negative')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        products, has_more = search_products(q, limit, offset)
+        return jsonify({
+            'query': q,
+            'products': products,
+            'next_offset': offset + limit if has_more else None,
+            'has_more': has_more
+        }), 200
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -133,7 +259,7 @@ def create_product_endpoint():
             return jsonify({'error': 'Missing required fields'}), 400
         
         # Check if SKU exists
-        existing_sku = Product.query.filter_by(sku=data['sku']).first()
+        existing_sku = db.session.scalar(product_by_sku_query(data['sku']))
         if existing_sku:
             return jsonify({'error': 'Product with this Product Code already exists'}), 400
         
@@ -142,6 +268,11 @@ def create_product_endpoint():
         if not category:
             return jsonify({'error': 'Category not found'}), 400
         
+        try:
+            reorder_point = parse_reorder_point(data.get('reorder_point', DEFAULT_REORDER_POINT))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         product = Product(
             name=data['name'],
             sku=data['sku'],
@@ -153,8 +284,11 @@ def create_product_endpoint():
         db.session.flush()  # Get the product ID before committing
         
         # Create inventory record
-        inventory = Inventory(product_id=product.id)
+        inventory = Inventory(product_id=product.id, reorder_point=reorder_point)
         db.session.add(inventory)
+        apply_rollup_delta(product.category_id, products=1)
+        queue_event('product_created', {'product_id': product.id, 'category_id': product.category_id})
+        bump_data_version()
         db.session.commit()
         
         product.inventory = inventory
@@ -164,6 +298,86 @@ def create_product_endpoint():
         print(f"Error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/products/import', methods=['POST'])
+def import_products_endpoint():
+    """Bulk upsert products from a CSV or NDJSON upload.
+
+    The file is sent either as multipart ``file`` or as the raw request body;
+    ``format`` (csv|ndjson) defaults to a guess from the file name or content
+    type, and ``create_categories=true`` creates unknown category names.
+    """
+    try:
+        upload = request.files.get('file')
+        if upload is not None:
+            stream = upload.stream
+            fmt = request.args.get('format') or detect_format(upload.filename, upload.mimetype)
+        else:
+            stream = request.stream
+            fmt = request.args.get('format') or detect_format(content_type=request.content_type)
+        create_categories = request.args.get('create_categories', 'false').lower() in ('1', 'true', 'yes')
+        
+        try:
+            report = import_products(stream, fmt, create_categories=create_categories)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify(report), 200
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/products/<product_id>', methods=['PUT'])
+def update_product_endpoint(product_id):
+    """Update a product"""
+    try:
+        product = Product.query.get(product_id)
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+        
+        data = request.get_json() or {}
+        if 'category_id' in data and not Category.query.get(data['category_id']):
+            return jsonify({'error': 'Category not found'}), 400
+        try:
+            reorder_point = parse_reorder_point(data['reorder_point']) if 'reorder_point' in data else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        quantity = get_stock(product.id, for_update=True)
+        old_category_id, old_price = product.category_id, product.price
+        
+        if 'name' in data:
+            product.name = data['name']
+        if 'description' in data:
+            product.description = data['description']
+        if 'price' in data:
+            product.price = float(data['price'])
+        if 'category_id' in data:
+            product.category_id = data['category_id']
+        
+        # Keep the rollup's valuation (and product placement) in step with the edit
+        if product.category_id != old_category_id:
+            apply_rollup_delta(old_category_id, products=-1, quantity=-quantity, value=-quantity * old_price)
+            apply_rollup_delta(product.category_id, products=1, quantity=quantity, value=quantity * product.price)
+            retag_daily_movements(product.id, product.category_id)
+        elif product.price != old_price:
+            apply_rollup_delta(product.category_id, value=quantity * (product.price - old_price))
+        
+        if reorder_point is not None:
+            set_reorder_point(product.id, reorder_point)
+        
+        queue_event('product_updated', {'product_id': product.id, 'category_id': product.category_id,
+                                        'previous_category_id': old_category_id})
+        bump_data_version()
+        db.session.commit()
+        
+        db.session.refresh(product)
+        return jsonify(product.to_dict()), 200
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/products/<product_id>', methods=['DELETE'])
 def delete_product_endpoint(product_id):
     """Delete a product"""
@@ -172,7 +386,14 @@ def delete_product_endpoint(product_id):
         if not product:
             return jsonify({'error': 'Product not found'}), 404
         
+        quantity = get_stock(product.id, for_update=True)
+        apply_rollup_delta(product.category_id, products=-1, quantity=-quantity, value=-quantity * product.price)
+        # Its transactions go with it, so do their movement totals
+        DailyMovement.query.filter_by(product_id=product.id).delete()
+        StockCheckpoint.query.filter_by(product_id=product.id).delete()
+        queue_event('product_deleted', {'product_id': product.id, 'category_id': product.category_id})
         db.session.delete(product)
+        bump_data_version()
         db.session.commit()
         
         return jsonify({'message': 'Product deleted successfully'}), 200
@@ -183,15 +404,54 @@ def delete_product_endpoint(product_id):
 
 # Transactions endpoints
 @app.route('/api/transactions', methods=['GET'])
+@cached_json
 def get_transactions_endpoint():
-    """Get all transactions"""
+    """Get a page of transactions, newest first.
+
+    Query params: ``limit``, ``cursor`` (from the previous page's ``next_cursor``),
+    ``product_id``, ``type``, ``from``, ``to``, ``fields`` (sparse fieldset) and
+    ``expand=product`` to embed each transaction's product.
+    """
     try:
-        transactions = Transaction.query.options(db.joinedload(Transaction.product)).order_by(Transaction.created_at.desc()).all()
-        return jsonify([trans.to_dict() for trans in transactions]), 200
+        try:
+            limit, fields, expand, conditions = parse_transaction_page_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify(transaction_page(limit, fields, expand, conditions)), 200
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/transactions/export', methods=['GET'])
+def export_transactions_endpoint():
+    """Stream the transaction ledger, oldest first, as NDJSON or CSV.
+
+    Accepts the same ``product_id``, ``type``, ``from`` and ``to`` filters as the
+    list endpoint. Rows come from a server-side cursor and are written as they
+    arrive, so memory stays flat however large the export.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ['ndjson', 'csv']:
+        return jsonify({'error': 'Invalid format. Use ndjson or csv'}), 400
+    try:
+        conditions = transaction_filters(Transaction, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    query = transaction_export_query(conditions).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    
+    def generate():
+        formatter = ExportFormatter(fmt)
+        yield formatter.header()
+        for partition in db.session.execute(query).partitions():
+            yield formatter.format(partition)
+    
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=transactions.{fmt}'
+    })
+
 @app.route('/api/transactions', methods=['POST'])
 def create_transaction_endpoint():
     """Create a new transaction"""
@@ -220,28 +480,29 @@ def create_transaction_endpoint():
         except ValueError:
             return jsonify({'error': 'Invalid quantity value'}), 400
         
-        # Check inventory for EXIT
-        if data['type'] == 'EXIT':
-            if product.inventory.quantity < quantity:
-                return jsonify({'error': f'Insufficient inventory. Available: {product.inventory.quantity}'}), 400
+        # Update inventory with one conditional UPDATE; the row count decides success
+        delta = quantity if data['type'] == 'ENTRY' else -quantity
+        if not adjust_stock(product.id, delta):
+            db.session.rollback()
+            return jsonify({'error': f'Insufficient inventory. Available: {get_stock(product.id)}'}), 400
+        apply_rollup_delta(product.category_id, quantity=delta, value=delta * product.price)
         
         # Create transaction
+        now = datetime.utcnow()
         transaction = Transaction(
             product_id=data['product_id'],
             type=data['type'],
             quantity=quantity,
             reason=data.get('reason', ''),
-            notes=data.get('notes', '')
+            notes=data.get('notes', ''),
+            created_at=now,
+            updated_at=now
         )
         db.session.add(transaction)
+        record_movements([(now, product.id, product.category_id, data['type'], quantity)])
+        queue_stock_event(product.id, product.category_id, get_stock(product.id), delta, delta * product.price)
         
-        # Update inventory
-        if data['type'] == 'ENTRY':
-            product.inventory.quantity += quantity
-        else:
-            product.inventory.quantity -= quantity
-        product.inventory.last_updated = datetime.utcnow()
-        
+        bump_data_version()
         db.session.commit()
         
         return jsonify(transaction.to_dict()), 201
@@ -250,52 +511,193 @@ def create_transaction_endpoint():
         print(f"Error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/transactions/batch', methods=['POST'])
+def create_transactions_batch_endpoint():
+    """Post many transactions at once.
+
+    Accepts a JSON array of movements, or ``{"transactions": [...], "mode": ...}``.
+    ``mode=atomic`` (default) rejects the whole batch if any item is invalid;
+    ``mode=partial`` posts the valid items and reports per-item errors.
+    """
+    try:
+        body, status = post_transaction_batch(request.get_json(), request.args.get('mode', 'atomic'))
+        return jsonify(body), status
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # Inventory stats endpoint
 @app.route('/api/inventory/stats', methods=['GET'])
+@cached_json
 def get_inventory_stats_endpoint():
-    """Get comprehensive inventory statistics"""
+    """Get comprehensive inventory statistics.
+
+    Totals come from the category stock rollup; pass ``include_products=false``
+    to skip the per-product detail list, or ``as_of`` for the figures at a
+    past date (valued at current prices).
+    """
     try:
-        # Get all data
-        categories = Category.query.all()
-        products = Product.query.all()
-        
-        total_products = len(products)
-        total_quantity = sum(p.inventory.quantity for p in products if p.inventory)
-        total_price = sum(p.price * p.inventory.quantity for p in products if p.inventory)
-        
-        # Build categories with products
-        categories_data = []
-        for cat in categories:
-            cat_products = [p for p in products if p.category_id == cat.id]
-            cat_total_qty = sum(p.inventory.quantity for p in cat_products if p.inventory)
-            
-            categories_data.append({
-                'id': cat.id,
-                'name': cat.name,
-                'description': cat.description,
-                'product_count': len(cat_products),
-                'total_quantity': cat_total_qty,
-                'products': [
-                    {
-                        'id': p.id,
-                        'name': p.name,
-                        'price': p.price,
-                        'quantity': p.inventory.quantity if p.inventory else 0
-                    }
-                    for p in cat_products
-                ]
-            })
+        include_products = request.args.get('include_products', 'true').lower() not in ('0', 'false', 'no')
+        try:
+            as_of = parse_as_of(request.args.get('as_of'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if as_of is not None:
+            return jsonify(inventory_stats_as_of(as_of, include_products)), 200
         
-        return jsonify({
-            'total_products': total_products,
-            'total_quantity': total_quantity,
-            'total_price': round(total_price, 2),
-            'categories': categories_data
-        }), 200
+        return jsonify(inventory_stats(include_products)), 200
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/inventory/summary', methods=['GET'])
+@cached_json
+def get_inventory_summary_endpoint():
+    """Get quick inventory summary from the global rollup row"""
+    try:
+        return jsonify(inventory_summary()), 200
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/inventory/low-stock', methods=['GET'])
+@cached_json
+def get_low_stock_endpoint():
+    """Get a page of products below their reorder point, ordered by product id"""
+    try:
+        try:
+            limit = parse_limit(request.args.get('limit'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify(low_stock_page(request.args.get('cursor'), limit)), 200
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/inventory/movements', methods=['GET'])
+@cached_json
+def get_inventory_movements_endpoint():
+    """Get ENTRY/EXIT quantities and counts per time bucket from the daily movement rollup.
+
+    Query params: ``bucket`` (day|week|month), ``from`` and ``to`` (dates,
+    ``to`` inclusive), ``category_id``/``product_id`` filters and
+    ``by=category|product`` for one series per category or product.
+    """
+    try:
+        try:
+            report_args = parse_movement_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify(movement_report(**report_args)), 200
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes_endpoint():
+    """Rows changed since a change feed cursor, for incremental client sync.
+
+    ``since`` is the ``next_since`` of the previous page (0 for a full sync)
+    and ``tables`` optionally narrows the feed (e.g. ``categories,products``).
+    Each change carries the row's current data, or ``deleted: true`` for a
+    delete. A cursor older than pruned deletes gets 410: sync again from 0.
+    """
+    try:
+        try:
+            since, limit, tables = parse_changes_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        body, status = change_feed_page(since, limit, tables)
+        return jsonify(body), status
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# Streams one worker process serves; each holds one of its threads for as long as it is
+# open, so the rest stay free for requests (production streams come from the `stream` process)
+STREAM_MAX_PER_WORKER = int(os.environ.get('STREAM_MAX_PER_WORKER', '2'))
+
+@app.route('/api/stream/stock', methods=['GET'])
+def stream_stock_endpoint():
+    """Server-Sent Events stream of committed stock and catalog changes.
+
+    ``stock`` events carry a product's new quantity and its category's
+    quantity/value deltas; ``product_*``/``category_*`` events announce
+    catalog changes and ``resync`` asks the client to reload everything.
+    The stream never touches the database, so connected dashboards cost
+    nothing between changes. A worker serves at most ``STREAM_MAX_PER_WORKER``
+    streams and answers 503 beyond that.
+    """
+    subscriber = stock_events.subscribe(limit=STREAM_MAX_PER_WORKER)
+    if subscriber is None:
+        return jsonify({'error': 'Too many open streams on this worker'}), 503, {'Retry-After': '30'}
+    stock_events.listen()
+    
+    def generate():
+        yield f'retry: {STREAM_RETRY_MS}\n\n'
+        while True:
+            try:
+                yield subscriber.get(timeout=KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+    
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Runs even when the client goes away before the first chunk is sent
+    response.call_on_close(lambda: stock_events.unsubscribe(subscriber))
+    return response
+
+# CLI commands
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Apply pending schema migrations"""
+    applied = migrate()
+    print(f"Applied {len(applied)} migrations" + (f": {', '.join(applied)}" if applied else ''))
+
+@app.cli.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults to a guess from the file name')
+@click.option('--create-categories', is_flag=True, help='Create categories that do not exist yet')
+def import_products_command(path, fmt, create_categories):
+    """Bulk upsert products from a CSV or NDJSON file"""
+    with open(path, 'rb') as f:
+        report = import_products(f, fmt or detect_format(path), create_categories=create_categories)
+    print(f"Processed {report['processed']} rows: {report['created']} created, "
+          f"{report['updated']} updated, {report['failed']} failed")
+    for error in report['errors']:
+        print(f"  line {error['line']}: {error['error']}")
+
+@app.cli.command('rebuild-rollup')
+def rebuild_rollup_command():
+    """Recompute the category stock rollup from scratch"""
+    count = rebuild_category_rollup()
+    print(f"Rebuilt stock rollup for {count} categories")
+
+@app.cli.command('rebuild-movements')
+def rebuild_movements_command():
+    """Recompute the daily movement rollup from the transaction ledger"""
+    count = rebuild_daily_movements()
+    print(f"Rebuilt {count} daily movement rows")
+
+@app.cli.command('prune-changes')
+@click.option('--days', default=30, show_default=True, help='Keep delete markers this many days')
+def prune_changes_command(days):
+    """Drop old delete markers from the change feed (clients further behind resync in full)"""
+    count = prune_tombstones(datetime.utcnow() - timedelta(days=days))
+    print(f"Pruned {count} delete markers")
+
+@app.cli.command('checkpoint-stock')
+def checkpoint_stock_command():
+    """Write a stock checkpoint run (schedule this, e.g. nightly)"""
+    count = take_stock_checkpoint()
+    print(f"Checkpointed stock of {count} products")
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -306,5 +708,8 @@ def server_error(error):
     print(f"Server error: {error}")
     return jsonify({'error': 'Internal server error'}), 500
 
+# Prepare the schema once per process, outside the request path
+bootstrap_database(apply_migrations=AUTO_MIGRATE)
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,742 @@
+"""
+Async serving mode: the app.py API on an async SQLAlchemy engine, for ASGI servers.
+
+    uvicorn app_async:app --workers 2
+    hypercorn app_async:app
+
+Handlers await the database (asyncpg on PostgreSQL, aiosqlite on SQLite)
+instead of holding a worker for every round trip, so one process keeps
+hundreds of requests in flight against a remote database. Models, queries
+and the request-independent handler logic are shared with app.py through
+db.py and services.py; helpers written against a sync session run on the
+async session's sync facade via ``run_sync``.
+Schema migrations stay with ``flask --app app db-upgrade``.
+"""
+from quart import Quart, Response, jsonify, make_response, render_template, request
+from sqlalchemy import delete, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+from sqlalchemy.pool import NullPool
+from dotenv import load_dotenv
+from db import (Category, Product, Inventory, Transaction, CategoryStockRollup, DEFAULT_REORDER_POINT,
+                adjust_stock, get_stock, apply_rollup_delta, bump_data_version, get_data_version, set_reorder_point,
+                parse_reorder_point, DailyMovement, record_movements, retag_daily_movements, StockCheckpoint,
+                inventory_stats, inventory_stats_as_of, inventory_summary, category_products_query,
+                product_by_sku_query, transaction_export_query)
+from pagination import parse_limit, parse_as_of, transaction_filters
+from importer import detect_format, import_products
+from search import MAX_QUERY_LENGTH, SEARCH_LIMIT, search_products
+from cache import make_etag, response_cache
+from events import KEEPALIVE_SECONDS, STREAM_RETRY_MS, STREAM_URL, queue_event, stock_events
+from migrations import MIGRATIONS, schema_migrations
+from config import get_config
+from pool_metrics import pool_status
+from serializers import CATEGORY_FIELDS, PRODUCT_FIELDS, parse_fields
+from services import (EXPORT_CHUNK_SIZE, ExportFormatter, category_listing, change_feed_page, low_stock_page,
+                      movement_report, parse_changes_args, parse_movement_args, parse_transaction_page_args,
+                      post_transaction_batch, product_listing, queue_stock_event, transaction_page)
+from datetime import datetime
+from functools import wraps
+import asyncio
+import os
+import tempfile
+import time
+
+# Load environment variables
+load_dotenv()
+
+app = Quart(__name__)
+
+app_config = get_config()
+response_cache.ttl = float(os.environ.get('RESPONSE_CACHE_TTL', '1.0'))
+
+# Uploads larger than this are spooled to a temporary file while they arrive
+IMPORT_SPOOL_SIZE = 1024 * 1024
+
+
+def async_database_url(uri):
+    """The async driver URL for ``DATABASE_URL`` plus the connect arguments it needs"""
+    url = make_url(uri)
+    connect_args = {}
+    if url.get_backend_name() == 'sqlite':
+        return url.set(drivername='sqlite+aiosqlite'), connect_args
+    # asyncpg takes TLS as a connect argument and knows no libpq URL options
+    query = dict(url.query)
+    sslmode = query.pop('sslmode', None)
+    query.pop('channel_binding', None)
+    if sslmode:
+        connect_args['ssl'] = sslmode
+    return url.set(drivername='postgresql+asyncpg', query=query), connect_args
+
+
+def async_engine_options(config, connect_args):
+    """create_async_engine options for the same pool profile app.py uses"""
+    if config.SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        return {'connect_args': connect_args}
+    if config.DB_PGBOUNCER:
+        # PgBouncer in transaction mode cannot keep asyncpg's prepared statements
+        return {'poolclass': NullPool, 'pool_pre_ping': config.DB_POOL_PRE_PING,
+                'connect_args': dict(connect_args, statement_cache_size=0,
+                                     prepared_statement_cache_size=0)}
+    if config.DB_STATEMENT_TIMEOUT_MS:
+        connect_args = dict(connect_args, server_settings={'statement_timeout': str(config.DB_STATEMENT_TIMEOUT_MS)})
+    return {
+        'pool_size': config.DB_POOL_SIZE,
+        'max_overflow': config.DB_MAX_OVERFLOW,
+        'pool_timeout': config.DB_POOL_TIMEOUT,
+        'pool_recycle': config.DB_POOL_RECYCLE,
+        'pool_pre_ping': config.DB_POOL_PRE_PING,
+        'connect_args': connect_args,
+    }
+
+
+database_url, connect_args = async_database_url(app_config.SQLALCHEMY_DATABASE_URI)
+engine = create_async_engine(database_url, **async_engine_options(app_config, connect_args))
+async_session = async_sessionmaker(engine, expire_on_commit=False)
+
+# Stock events reach this process through LISTEN on a psycopg2 connection of its own
+stock_events.configure(app_config)
+
+
+async def run(session, helper, *args, **kwargs):
+    """Call a db.py or services.py helper on the sync facade of an async session"""
+    return await session.run_sync(lambda sync_session: helper(*args, session=sync_session, **kwargs))
+
+
+async def to_dict(session, obj):
+    """``obj.to_dict()`` where lazy-loaded relationships can still be fetched"""
+    return await session.run_sync(lambda sync_session: obj.to_dict())
+
+
+async def load_product(session, product_id):
+    """A product with its inventory row, freshly read"""
+    return (await session.execute(
+        select(Product).options(selectinload(Product.inventory)).where(Product.id == product_id)
+        .execution_options(populate_existing=True)
+    )).scalar_one_or_none()
+
+
+def cached_json(view):
+    """Async counterpart of ``cache.cached_json``, sharing its versioned response cache"""
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        version = response_cache.fresh_version()
+        if version is None:
+            async with async_session() as session:
+                version = response_cache.update_version(await run(session, get_data_version))
+        key = request.full_path
+        etag = make_etag(version, key)
+
+        if etag in request.if_none_match:
+            response = Response('', status=304)
+        else:
+            body = response_cache.get(key, version)
+            if body is None:
+                response = await make_response(await view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response_cache.set(key, version, await response.get_data())
+            else:
+                response = Response(body, status=200, mimetype='application/json')
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
+
+
+# Seconds between schema re-checks while the database is not ready
+DB_RETRY_SECONDS = float(os.environ.get('DB_RETRY_SECONDS', '5'))
+
+# Readiness flag, set once the schema is known to be current
+_db_ready = False
+_last_check = 0.0
+_check_lock = asyncio.Lock()
+
+async def check_database():
+    """Update the readiness flag from ``schema_migrations``; this mode never migrates"""
+    global _db_ready, _last_check
+    _last_check = time.monotonic()
+    try:
+        async with engine.connect() as conn:
+            applied = set((await conn.execute(select(schema_migrations.c.version))).scalars())
+        pending = [m for m in MIGRATIONS if m[0] not in applied]
+        if pending:
+            print(f"Warning: {len(pending)} pending migrations, run `flask --app app db-upgrade`")
+        _db_ready = not pending
+    except Exception as e:
+        print(f"Warning: Could not initialize database: {e}")
+        _db_ready = False
+    return _db_ready
+
+@app.before_serving
+async def startup():
+    await check_database()
+
+@app.after_serving
+async def shutdown():
+    await engine.dispose()
+
+async def recheck_database():
+    """Re-run the schema check at most once per DB_RETRY_SECONDS, from one task at a time"""
+    if time.monotonic() - _last_check < DB_RETRY_SECONDS or _check_lock.locked():
+        return _db_ready
+    async with _check_lock:
+        if not _db_ready:
+            await check_database()
+    return _db_ready
+
+@app.before_request
+async def require_database():
+    """Answer API calls with 503 until the database is ready, re-checking the schema now and then"""
+    if _db_ready or not request.path.startswith('/api/') or request.endpoint in ('health', 'readiness', 'pool_metrics'):
+        return None
+    if not await recheck_database():
+        return jsonify({'error': 'Database not ready'}), 503
+
+@app.after_request
+async def allow_cross_origin(response):
+    """Allow any origin, like Flask-CORS's defaults in app.py"""
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    if request.method == 'OPTIONS':
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = request.headers.get('Access-Control-Request-Headers', '*')
+    return response
+
+# Home route
+@app.route('/')
+async def index():
+    """Render main dashboard page"""
+    return await render_template('index.html', stream_url=STREAM_URL)
+
+@app.route('/api/health', methods=['GET'])
+async def health():
+    """Health check endpoint"""
+    return jsonify({'status': 'ok', 'message': 'Server is running'}), 200
+
+@app.route('/api/ready', methods=['GET'])
+async def readiness():
+    """Report whether the database is ready, re-checking the schema if it is not"""
+    if not await recheck_database():
+        return jsonify({'status': 'unavailable', 'message': 'Database not ready'}), 503
+    return jsonify({'status': 'ok', 'message': 'Database ready'}), 200
+
+@app.route('/api/metrics/pool', methods=['GET'])
+async def pool_metrics():
+    """Report connection pool occupancy"""
+    return jsonify(pool_status(engine.sync_engine)), 200
+
+# Categories endpoints
+@app.route('/api/categories', methods=['GET'])
+@cached_json
+async def get_categories_endpoint():
+    """Get all categories (``fields=`` selects a sparse fieldset)"""
+    async with async_session() as session:
+        try:
+            try:
+                fields = parse_fields(request.args.get('fields'), CATEGORY_FIELDS, extra=['product_count'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            return jsonify(await run(session, category_listing, fields)), 200
+        except Exception as e:
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+@app.route('/api/categories', methods=['POST'])
+async def create_category_endpoint():
+    """Create a new category"""
+    async with async_session() as session:
+        try:
+            data = await request.get_json()
+
+            if not data or 'name' not in data:
+                return jsonify({'error': 'Category name is required'}), 400
+
+            existing = await session.scalar(select(Category.id).where(Category.name == data['name']))
+            if existing:
+                return jsonify({'error': 'Category already exists'}), 400
+
+            category = Category(
+                name=data['name'],
+                description=data.get('description', '')
+            )
+            session.add(category)
+            await session.flush()  # Get the category ID for its rollup row
+            session.add(CategoryStockRollup(category_id=category.id))
+            queue_event('category_created', {'category_id': category.id}, session=session.sync_session)
+            await run(session, bump_data_version)
+            await session.commit()
+
+            return jsonify(category.to_dict()), 201
+        except Exception as e:
+            await session.rollback()
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+@app.route('/api/categories/<category_id>', methods=['DELETE'])
+async def delete_category_endpoint(category_id):
+    """Delete a category"""
+    async with async_session() as session:
+        try:
+            category = await session.get(Category, category_id)
+            if not category:
+                return jsonify({'error': 'Category not found'}), 404
+
+            has_products = await session.scalar(category_products_query(category_id))
+            if has_products:
+                return jsonify({'error': 'Cannot delete category with existing products'}), 400
+
+            await session.delete(category)
+            await session.execute(delete(CategoryStockRollup).where(CategoryStockRollup.category_id == category_id))
+            queue_event('category_deleted', {'category_id': category_id}, session=session.sync_session)
+            await run(session, bump_data_version)
+            await session.commit()
+
+            return jsonify({'message': 'Category deleted successfully'}), 200
+        except Exception as e:
+            await session.rollback()
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+# Products endpoints
+@app.route('/api/products', methods=['GET'])
+@cached_json
+async def get_products_endpoint():
+    """Get all products (``fields=`` sparse fieldset, ``as_of`` for stock at a past moment)"""
+    async with async_session() as session:
+        try:
+            try:
+                fields = parse_fields(request.args.get('fields'), PRODUCT_FIELDS, extra=['inventory'])
+                as_of = parse_as_of(request.args.get('as_of'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            return jsonify(await run(session, product_listing, fields, as_of)), 200
+        except Exception as e:
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+@app.route('/api/products/search', methods=['GET'])
+@cached_json
+async def search_products_endpoint():
+    """Search products by SKU prefix or name, best matches first"""
+    async with async_session() as session:
+        try:
+            q = (request.args.get('q') or '').strip()
+            if not q:
+                return jsonify({'error': 'Search query is required'}), 400
+            if len(q) > MAX_QUERY_LENGTH:
+                return jsonify({'error': f'Search query too long. Maximum: {MAX_QUERY_LENGTH}'}), 400
+            try:
+                limit = parse_limit(request.args.get('limit'), default=SEARCH_LIMIT)
+                offset = int(request.args.get('offset') or 0)
+                if offset < 0:
+                    raise ValueError('offset cannot be negative')
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            products, has_more = await run(session, search_products, q, limit, offset)
+            return jsonify({
+                'query': q,
+                'products': products,
+                'next_offset': offset + limit if has_more else None,
+                'has_more': has_more
+            }), 200
+        except Exception as e:
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+@app.route('/api/products', methods=['POST'])
+async def create_product_endpoint():
+    """Create a new product"""
+    async with async_session() as session:
+        try:
+            data = await request.get_json()
+
+            required_fields = ['name', 'sku', 'price', 'category_id']
+            if not all(field in data for field in required_fields):
+                return jsonify({'error': 'Missing required fields'}), 400
+
+            if await session.scalar(product_by_sku_query(data['sku'])):
+                return jsonify({'error': 'Product with this Product Code already exists'}), 400
+
+            if not await session.get(Category, data['category_id']):
+                return jsonify({'error': 'Category not found'}), 400
+
+            try:
+                reorder_point = parse_reorder_point(data.get('reorder_point', DEFAULT_REORDER_POINT))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            product = Product(
+                name=data['name'],
+                sku=data['sku'],
+                price=float(data['price']),
+                category_id=data['category_id'],
+                description=data.get('description', '')
+            )
+            session.add(product)
+            await session.flush()  # Get the product ID before committing
+
+            inventory = Inventory(product_id=product.id, reorder_point=reorder_point)
+            session.add(inventory)
+            await run(session, apply_rollup_delta, product.category_id, products=1)
+            queue_event('product_created', {'product_id': product.id, 'category_id': product.category_id},
+                        session=session.sync_session)
+            await run(session, bump_data_version)
+            await session.commit()
+
+            product = await load_product(session, product.id)
+            return jsonify(product.to_dict()), 201
+        except Exception as e:
+            await session.rollback()
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+@app.route('/api/products/import', methods=['POST'])
+async def import_products_endpoint():
+    """Bulk upsert products from a CSV or NDJSON upload (multipart ``file`` or raw body)"""
+    async with async_session() as session:
+        try:
+            upload = None
+            if request.mimetype == 'multipart/form-data':
+                upload = (await request.files).get('file')
+            if upload is not None:
+                stream = upload.stream
+                fmt = request.args.get('format') or detect_format(upload.filename, upload.mimetype)
+            else:
+                # Copy the body as it arrives instead of buffering it whole
+                stream = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE)
+                async for chunk in request.body:
+                    stream.write(chunk)
+                stream.seek(0)
+                fmt = request.args.get('format') or detect_format(content_type=request.content_type)
+            create_categories = request.args.get('create_categories', 'false').lower() in ('1', 'true', 'yes')
+
+            try:
+                report = await run(session, import_products, stream, fmt, create_categories=create_categories)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            finally:
+                stream.close()
+
+            return jsonify(report), 200
+        except Exception as e:
+            await session.rollback()
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+@app.route('/api/products/<product_id>', methods=['PUT'])
+async def update_product_endpoint(product_id):
+    """Update a product"""
+    async with async_session() as session:
+        try:
+            product = await load_product(session, product_id)
+            if not product:
+                return jsonify({'error': 'Product not found'}), 404
+
+            data = await request.get_json() or {}
+            if 'category_id' in data and not await session.get(Category, data['category_id']):
+                return jsonify({'error': 'Category not found'}), 400
+            try:
+                reorder_point = parse_reorder_point(data['reorder_point']) if 'reorder_point' in data else None
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            quantity = await run(session, get_stock, product.id, for_update=True)
+            old_category_id, old_price = product.category_id, product.price
+
+            if 'name' in data:
+                product.name = data['name']
+            if 'description' in data:
+                product.description = data['description']
+            if 'price' in data:
+                product.price = float(data['price'])
+            if 'category_id' in data:
+                product.category_id = data['category_id']
+
+            # Keep the rollup's valuation (and product placement) in step with the edit
+            if product.category_id != old_category_id:
+                await run(session, apply_rollup_delta, old_category_id, products=-1, quantity=-quantity,
+                          value=-quantity * old_price)
+                await run(session, apply_rollup_delta, product.category_id, products=1, quantity=quantity,
+                          value=quantity * product.price)
+                await run(session, retag_daily_movements, product.id, product.category_id)
+            elif product.price != old_price:
+                await run(session, apply_rollup_delta, product.category_id,
+                          value=quantity * (product.price - old_price))
+
+            if reorder_point is not None:
+                await run(session, set_reorder_point, product.id, reorder_point)
+
+            queue_event('product_updated', {'product_id': product.id, 'category_id': product.category_id,
+                                            'previous_category_id': old_category_id}, session=session.sync_session)
+            await run(session, bump_data_version)
+            await session.commit()
+
+            product = await load_product(session, product_id)
+            return jsonify(product.to_dict()), 200
+        except Exception as e:
+            await session.rollback()
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+@app.route('/api/products/<product_id>', methods=['DELETE'])
+async def delete_product_endpoint(product_id):
+    """Delete a product"""
+    async with async_session() as session:
+        try:
+            product = await load_product(session, product_id)
+            if not product:
+                return jsonify({'error': 'Product not found'}), 404
+
+            quantity = await run(session, get_stock, product.id, for_update=True)
+            await run(session, apply_rollup_delta, product.category_id, products=-1, quantity=-quantity,
+                      value=-quantity * product.price)
+            # Its transactions go with it, so do their movement totals
+            await session.execute(delete(DailyMovement).where(DailyMovement.product_id == product.id))
+            await session.execute(delete(StockCheckpoint).where(StockCheckpoint.product_id == product.id))
+            queue_event('product_deleted', {'product_id': product.id, 'category_id': product.category_id},
+                        session=session.sync_session)
+            await session.delete(product)
+            await run(session, bump_data_version)
+            await session.commit()
+
+            return jsonify({'message': 'Product deleted successfully'}), 200
+        except Exception as e:
+            await session.rollback()
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+# Transactions endpoints
+@app.route('/api/transactions', methods=['GET'])
+@cached_json
+async def get_transactions_endpoint():
+    """Get a page of transactions, newest first (same parameters as app.py)"""
+    async with async_session() as session:
+        try:
+            try:
+                limit, fields, expand, conditions = parse_transaction_page_args(request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            return jsonify(await run(session, transaction_page, limit, fields, expand, conditions)), 200
+        except Exception as e:
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+@app.route('/api/transactions/export', methods=['GET'])
+async def export_transactions_endpoint():
+    """Stream the transaction ledger, oldest first, as NDJSON or CSV"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ['ndjson', 'csv']:
+        return jsonify({'error': 'Invalid format. Use ndjson or csv'}), 400
+    try:
+        conditions = transaction_filters(Transaction, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = transaction_export_query(conditions).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+
+    async def generate():
+        formatter = ExportFormatter(fmt)
+        yield formatter.header()
+        async with async_session() as session:
+            result = await session.stream(query)
+            async for partition in result.partitions():
+                yield formatter.format(partition)
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(generate(), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=transactions.{fmt}'
+    })
+    response.timeout = None  # a large export may outlive the default response timeout
+    return response
+
+@app.route('/api/transactions', methods=['POST'])
+async def create_transaction_endpoint():
+    """Create a new transaction"""
+    async with async_session() as session:
+        try:
+            data = await request.get_json()
+
+            required_fields = ['product_id', 'type', 'quantity']
+            if not all(field in data for field in required_fields):
+                return jsonify({'error': 'Missing required fields'}), 400
+
+            product = await session.get(Product, data['product_id'])
+            if not product:
+                return jsonify({'error': 'Product not found'}), 404
+
+            if data['type'] not in ['ENTRY', 'EXIT']:
+                return jsonify({'error': 'Invalid transaction type'}), 400
+
+            try:
+                quantity = int(data['quantity'])
+                if quantity <= 0:
+                    return jsonify({'error': 'Quantity must be greater than 0'}), 400
+            except ValueError:
+                return jsonify({'error': 'Invalid quantity value'}), 400
+
+            # Update inventory with one conditional UPDATE; the row count decides success
+            delta = quantity if data['type'] == 'ENTRY' else -quantity
+            if not await run(session, adjust_stock, product.id, delta):
+                await session.rollback()  # expires product, so look it up by the request's id
+                available = await run(session, get_stock, data['product_id'])
+                return jsonify({'error': f'Insufficient inventory. Available: {available}'}), 400
+            await run(session, apply_rollup_delta, product.category_id, quantity=delta, value=delta * product.price)
+
+            now = datetime.utcnow()
+            transaction = Transaction(
+                product_id=data['product_id'],
+                type=data['type'],
+                quantity=quantity,
+                reason=data.get('reason', ''),
+                notes=data.get('notes', ''),
+                created_at=now,
+                updated_at=now
+            )
+            session.add(transaction)
+            await run(session, record_movements, [(now, product.id, product.category_id, data['type'], quantity)])
+            queue_stock_event(product.id, product.category_id, await run(session, get_stock, product.id),
+                              delta, delta * product.price, session=session.sync_session)
+
+            await run(session, bump_data_version)
+            await session.commit()
+
+            return jsonify(await to_dict(session, transaction)), 201
+        except Exception as e:
+            await session.rollback()
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+@app.route('/api/transactions/batch', methods=['POST'])
+async def create_transactions_batch_endpoint():
+    """Post many transactions at once (``mode=atomic`` or ``partial``, as in app.py)"""
+    async with async_session() as session:
+        try:
+            body, status = await run(session, post_transaction_batch, await request.get_json(),
+                                     request.args.get('mode', 'atomic'))
+            return jsonify(body), status
+        except Exception as e:
+            await session.rollback()
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+# Inventory endpoints
+@app.route('/api/inventory/stats', methods=['GET'])
+@cached_json
+async def get_inventory_stats_endpoint():
+    """Get inventory statistics per category from the stock rollup (``as_of`` for a past moment)"""
+    async with async_session() as session:
+        try:
+            include_products = request.args.get('include_products', 'true').lower() not in ('0', 'false', 'no')
+            try:
+                as_of = parse_as_of(request.args.get('as_of'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            if as_of is not None:
+                return jsonify(await run(session, inventory_stats_as_of, as_of, include_products)), 200
+
+            return jsonify(await run(session, inventory_stats, include_products)), 200
+        except Exception as e:
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+@app.route('/api/inventory/summary', methods=['GET'])
+@cached_json
+async def get_inventory_summary_endpoint():
+    """Get quick inventory summary from the global rollup row"""
+    async with async_session() as session:
+        try:
+            return jsonify(await run(session, inventory_summary)), 200
+        except Exception as e:
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+@app.route('/api/inventory/low-stock', methods=['GET'])
+@cached_json
+async def get_low_stock_endpoint():
+    """Get a page of products below their reorder point, ordered by product id"""
+    async with async_session() as session:
+        try:
+            try:
+                limit = parse_limit(request.args.get('limit'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            return jsonify(await run(session, low_stock_page, request.args.get('cursor'), limit)), 200
+        except Exception as e:
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+@app.route('/api/inventory/movements', methods=['GET'])
+@cached_json
+async def get_inventory_movements_endpoint():
+    """Get ENTRY/EXIT quantities and counts per time bucket from the daily movement rollup"""
+    async with async_session() as session:
+        try:
+            try:
+                report_args = parse_movement_args(request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            return jsonify(await run(session, movement_report, **report_args)), 200
+        except Exception as e:
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+@app.route('/api/changes', methods=['GET'])
+async def get_changes_endpoint():
+    """Rows changed since a change feed cursor, for incremental client sync"""
+    async with async_session() as session:
+        try:
+            try:
+                since, limit, tables = parse_changes_args(request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            body, status = await run(session, change_feed_page, since, limit, tables)
+            return jsonify(body), status
+        except Exception as e:
+            print(f"Error: {e}")
+            return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stream/stock', methods=['GET'])
+async def stream_stock_endpoint():
+    """Server-Sent Events stream of committed stock and catalog changes (see app.py)"""
+    stock_events.listen()
+
+    async def generate():
+        subscriber = stock_events.subscribe_async()
+        try:
+            yield f'retry: {STREAM_RETRY_MS}\n\n'
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+        finally:
+            stock_events.unsubscribe(subscriber)
+
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.timeout = None  # streams stay open for as long as the dashboard does
+    return response
+
+# Error handlers
+@app.errorhandler(404)
+async def not_found(error):
+    return jsonify({'error': 'Not found'}), 404
+
+@app.errorhandler(500)
+async def server_error(error):
+    print(f"Server error: {error}")
+    return jsonify({'error': 'Internal server error'}), 500
+
+if __name__ == '__main__':
+    app.run(debug=True, host='0.0.0.0', port=5000)
@@ -4,8 +4,11 @@ from datetime import datetime
 import os
 import uuid
 import sqlite3
+import threading
 import json
 from dotenv import load_dotenv
+from pagination import parse_limit, parse_datetime, encode_cursor, decode_cursor
+from serializers import PRODUCT_FIELDS, parse_fields
 
 # Load environment variables
 load_dotenv()
@@ -20,7 +23,7 @@ DB_PATH = os.environ.get('DB_PATH', '/tmp/inventory.db') if os.environ.get('VERC
 def init_db():
     """Initialize SQLite database with tables"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = _connect()
         cursor = conn.cursor()
         
         # Create categories table
@@ -75,21 +78,117 @@ def init_db():
             )
         ''')
         
+        # Indexes backing keyset pagination of the transaction ledger
+        cursor.execute('CREATE INDEX IF NOT EXISTS ix_transactions_created_at_id ON transactions (created_at, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS ix_transactions_product_created_at_id ON transactions (product_id, created_at, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS ix_transactions_type_created_at_id ON transactions (type, created_at, id)')
+        
+        # Indexes backing the product listing, optionally narrowed to a category
+        cursor.execute('CREATE INDEX IF NOT EXISTS ix_products_created_at_id ON products (created_at, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS ix_products_category_created_at_id ON products (category_id, created_at, id)')
+        
+        # Trigram full-text shadow of product names and SKUs for search, kept in sync by
+        # triggers. It maps rows by products.rowid, so rebuild it after a VACUUM.
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+        fts_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                name, sku, content='products', content_rowid='rowid', tokenize='trigram'
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+                INSERT INTO products_fts (rowid, name, sku) VALUES (new.rowid, new.name, new.sku);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+                INSERT INTO products_fts (products_fts, rowid, name, sku) VALUES ('delete', old.rowid, old.name, old.sku);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, sku ON products BEGIN
+                INSERT INTO products_fts (products_fts, rowid, name, sku) VALUES ('delete', old.rowid, old.name, old.sku);
+                INSERT INTO products_fts (rowid, name, sku) VALUES (new.rowid, new.name, new.sku);
+            END
+        ''')
+        # Name prefix search for terms too short for trigrams
+        cursor.execute('CREATE INDEX IF NOT EXISTS ix_products_name_nocase ON products (name COLLATE NOCASE)')
+        if not fts_exists:
+            # Index the products created before search existed
+            cursor.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+        
         conn.commit()
-        conn.close()
+        conn.dispose()
     except Exception as e:
         print(f"Database initialization error: {e}")
 
+# Connection tuning, applied once per connection
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 20000))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+# Prepared statements kept per connection, keyed by SQL text
+SQLITE_CACHED_STATEMENTS = int(os.environ.get('SQLITE_CACHED_STATEMENTS', 256))
+
+class ReusableConnection(sqlite3.Connection):
+    """A connection that outlives the request using it.
+
+    ``close()`` only rolls back whatever was left uncommitted, so the
+    thread's next request reuses the open connection, its page cache and
+    its prepared statements. ``release_connection`` does the same after
+    every request, whichever way the route returned.
+    """
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def dispose(self):
+        super().close()
+
+_local = threading.local()
+
+def _connect():
+    """Open a tuned connection"""
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        cached_statements=SQLITE_CACHED_STATEMENTS,
+        factory=ReusableConnection
+    )
+    conn.row_factory = sqlite3.Row
+    # WAL lets dashboard reads run while a transaction is being posted
+    conn.execute('PRAGMA journal_mode=WAL')
+    # Durable at checkpoints; a power loss can only drop the last commits, never corrupt
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+    conn.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA foreign_keys=ON')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
 def get_db_connection():
-    """Get SQLite database connection"""
+    """Get this thread's SQLite database connection, opening it on first use"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = getattr(_local, 'conn', None)
+        # A forked worker must not share its parent's connection
+        if conn is None or _local.pid != os.getpid():
+            conn = _connect()
+            _local.conn = conn
+            _local.pid = os.getpid()
         return conn
     except Exception as e:
         print(f"Database connection error: {e}")
         raise
 
+@app.teardown_request
+def release_connection(error=None):
+    """Roll back anything a request left uncommitted on this thread's connection"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid() and conn.in_transaction:
+        conn.rollback()
+
 # Initialize database on startup
 with app.app_context():
     init_db()
@@ -171,9 +270,7 @@ def delete_category(category_id):
             return jsonify({'error': 'Category not found'}), 404
         
         # Check if category has products
-        cursor.execute('SELECT COUNT(*) as count FROM products WHERE category_id = ?', (category_id,))
-        result = cursor.fetchone()
-        if result['count'] > 0:
+        if category_has_products(cursor, category_id):
             conn.close()
             return jsonify({'error': 'Cannot delete category with existing products'}), 400
         
@@ -186,25 +283,191 @@ def delete_category(category_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def category_has_products(cursor, category_id):
+    """Whether any product belongs to the category (one index probe, no count)"""
+    cursor.execute('SELECT 1 FROM products WHERE category_id = ? LIMIT 1', (category_id,))
+    return cursor.fetchone() is not None
+
 # Products endpoints
+def fetch_products(cursor, fields=None, category_id=None, limit=None, after=None):
+    """Products with their stock from a single LEFT JOIN, newest first.
+
+    ``fields`` projects product columns (``inventory`` embeds the stock
+    record), ``after`` is a decoded ``(created_at, id)`` keyset cursor.
+    Fetches ``limit + 1`` rows when limited so callers can tell whether
+    another page exists.
+    """
+    fields = fields or PRODUCT_FIELDS + ['inventory']
+    product_fields = [f for f in fields if f in PRODUCT_FIELDS]
+    # Column names come from the PRODUCT_FIELDS whitelist
+    columns = [f'p.{f}' for f in product_fields] + ['p.created_at AS _created_at', 'p.id AS _id']
+    join = ''
+    if 'inventory' in fields:
+        columns += ['i.id AS _inventory_id', 'COALESCE(i.quantity, 0) AS _quantity', 'i.last_updated AS _last_updated']
+        join = 'LEFT JOIN inventory i ON i.product_id = p.id'
+    
+    clauses = []
+    params = []
+    if category_id:
+        clauses.append('p.category_id = ?')
+        params.append(category_id)
+    if after:
+        clauses.append('(p.created_at, p.id) < (?, ?)')
+        params.extend([after[0].isoformat(), after[1]])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    sql = f"SELECT {', '.join(columns)} FROM products p {join} {where} ORDER BY p.created_at DESC, p.id DESC"
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit + 1)
+    
+    cursor.execute(sql, params)
+    products = []
+    for row in cursor.fetchall():
+        product = {f: row[f] for f in product_fields}
+        if 'inventory' in fields:
+            product['inventory'] = {
+                'id': row['_inventory_id'],
+                'product_id': row['_id'],
+                'quantity': row['_quantity'],
+                'last_updated': row['_last_updated']
+            }
+        products.append((product, row['_created_at'], row['_id']))
+    return products
+
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    """Get all products with inventory"""
+    """Get products with inventory, newest first.
+
+    Supports ``fields=`` and ``category_id=``. Without ``limit=`` or
+    ``cursor=`` every product is returned as a plain array, as app.py does;
+    with either, the body is a keyset page ``{products, next_cursor,
+    has_more}`` of ``limit`` products (default 50), where ``cursor`` is the
+    previous page's ``next_cursor`` (also sent in the ``X-Next-Cursor`` header).
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        try:
+            fields = parse_fields(request.args.get('fields'), PRODUCT_FIELDS, extra=['inventory'])
+            paged = bool(request.args.get('limit') or request.args.get('cursor'))
+            limit = parse_limit(request.args.get('limit')) if paged else None
+            after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        cursor.execute('SELECT * FROM products ORDER BY created_at DESC')
-        products = [dict(row) for row in cursor.fetchall()]
+        conn = get_db_connection()
+        rows = fetch_products(conn.cursor(), fields, request.args.get('category_id'), limit, after)
+        conn.close()
         
-        # Get inventory for each product
-        for product in products:
-            cursor.execute('SELECT * FROM inventory WHERE product_id = ?', (product['id'],))
-            inv_row = cursor.fetchone()
-            product['inventory'] = dict(inv_row) if inv_row else {'quantity': 0, 'last_updated': None}
+        if not paged:
+            return jsonify([product for product, _, _ in rows]), 200
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = None
+        if has_more:
+            _, created_at, product_id = rows[-1]
+            next_cursor = encode_cursor(datetime.fromisoformat(created_at), product_id)
+        
+        response = jsonify({
+            'products': [product for product, _, _ in rows],
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        })
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Trigrams need at least three characters per search term
+MIN_SEARCH_TERM = 3
+SEARCH_LIMIT = 20
+# Name matches ranked per search; bm25 costs grow with every match ranked, and
+# a term common enough to exceed this ranks about the same on any of them
+SEARCH_CANDIDATES = 1000
+
+def fts_match_expression(q):
+    """FTS5 query requiring every term of ``q`` long enough to be trigram-indexed"""
+    terms = [term for term in q.split() if len(term) >= MIN_SEARCH_TERM]
+    return ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+def fetch_search_results(cursor, q, limit, offset=0):
+    """Products matching ``q``: SKU prefix matches first, then name matches by rank.
+
+    Fetches ``limit + 1`` rows so callers can tell whether another page exists.
+    """
+    # SKU prefix as a range on the unique SKU index
+    sku_range = (q, q + '\U0010ffff')
+    match = fts_match_expression(q)
+    candidates = max(SEARCH_CANDIDATES, offset + limit + 1)
+    if match:
+        # Substring matches on the trigram index, ranked by bm25 (lower is better)
+        name_matches = '''
+            SELECT rid, 1 AS grp, score FROM (
+                SELECT rowid AS rid, bm25(products_fts) AS score FROM products_fts
+                WHERE products_fts MATCH ? AND NOT (sku >= ? AND sku < ?) LIMIT ?
+            )
+        '''
+        name_params = [match, *sku_range, candidates]
+    else:
+        # Terms too short for trigrams: case-insensitive name prefix on the NOCASE index
+        name_matches = '''
+            SELECT rid, 1 AS grp, 0.0 AS score FROM (
+                SELECT rowid AS rid FROM products
+                WHERE name >= ? COLLATE NOCASE AND name < ? COLLATE NOCASE
+                  AND NOT (sku >= ? AND sku < ?)
+                LIMIT ?
+            )
+        '''
+        name_params = [q, q + '\U0010ffff', *sku_range, candidates]
+    
+    cursor.execute(f'''
+        SELECT p.id, p.name, p.sku, p.price, p.description, p.category_id,
+               COALESCE(i.quantity, 0) AS quantity
+        FROM (
+            SELECT rowid AS rid, 0 AS grp, 0.0 AS score FROM products WHERE sku >= ? AND sku < ?
+            UNION ALL
+            {name_matches}
+        ) m
+        JOIN products p ON p.rowid = m.rid
+        LEFT JOIN inventory i ON i.product_id = p.id
+        ORDER BY m.grp, CASE WHEN m.grp = 0 THEN p.sku END, m.score, p.name, p.id
+        LIMIT ? OFFSET ?
+    ''', [*sku_range, *name_params, limit + 1, offset])
+    return cursor.fetchall()
+
+@app.route('/api/products/search', methods=['GET'])
+def search_products():
+    """Search products by SKU prefix or name, best matches first (``q``, ``limit``, ``offset``)"""
+    try:
+        q = (request.args.get('q') or '').strip()
+        if not q:
+            return jsonify({'error': 'Search query is required'}), 400
+        try:
+            limit = parse_limit(request.args.get('limit'), default=SEARCH_LIMIT)
+            offset = int(request.args.get('offset') or 0)
+            if offset < 0:
+                raise ValueError('offset cannot be negative')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        rows = fetch_search_results(cursor, q, limit, offset)
         conn.close()
-        return jsonify(products), 200
+        
+        has_more = len(rows) > limit
+        products = []
+        for row in rows[:limit]:
+            product = dict(row)
+            product['inventory'] = {'quantity': product.pop('quantity')}
+            products.append(product)
+        
+        return jsonify({
+            'query': q,
+            'products': products,
+            'next_offset': offset + limit if has_more else None,
+            'has_more': has_more
+        }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -245,7 +508,7 @@ def create_product():
             conn.close()
             if 'sku' in str(e):
                 return jsonify({'error': 'Product with this Product Code already exists'}), 400
-            elif 'category_id' in str(e):
+            elif 'category_id' in str(e) or 'FOREIGN KEY' in str(e):
                 return jsonify({'error': 'Category not found'}), 404
             return jsonify({'error': str(e)}), 400
         
@@ -295,16 +558,73 @@ def delete_product(product_id):
         return jsonify({'error': str(e)}), 500
 
 # Transactions endpoints
+def fetch_transactions(cursor, limit, product_id=None, transaction_type=None, start=None, end=None, after=None):
+    """Transactions newest first, ``limit + 1`` rows so callers can tell whether another page exists.
+
+    ``start`` is inclusive and ``end`` exclusive; ``after`` is a decoded
+    ``(created_at, id)`` keyset cursor.
+    """
+    clauses = []
+    params = []
+    if product_id:
+        clauses.append('product_id = ?')
+        params.append(product_id)
+    if transaction_type:
+        clauses.append('type = ?')
+        params.append(transaction_type)
+    if start:
+        clauses.append('created_at >= ?')
+        params.append(start.isoformat())
+    if end:
+        clauses.append('created_at < ?')
+        params.append(end.isoformat())
+    if after:
+        clauses.append('(created_at, id) < (?, ?)')
+        params.extend([after[0].isoformat(), after[1]])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    cursor.execute(f'SELECT * FROM transactions {where} ORDER BY created_at DESC, id DESC LIMIT ?',
+                   params + [limit + 1])
+    return [dict(row) for row in cursor.fetchall()]
+
+def fetch_stock(cursor, product_id):
+    """Current stock of a product, None when it has no inventory row"""
+    cursor.execute('SELECT quantity FROM inventory WHERE product_id = ?', (product_id,))
+    row = cursor.fetchone()
+    return row['quantity'] if row else None
+
 @app.route('/api/transactions', methods=['GET'])
 def get_transactions():
-    """Get all transactions"""
+    """Get a page of transactions, newest first"""
     try:
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            transaction_type = request.args.get('type')
+            if transaction_type and transaction_type not in ['ENTRY', 'EXIT']:
+                return jsonify({'error': 'Invalid transaction type'}), 400
+            start = parse_datetime(request.args.get('from'))
+            end = parse_datetime(request.args.get('to'), end_of_day=True)
+            after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM transactions ORDER BY created_at DESC')
-        transactions = [dict(row) for row in cursor.fetchall()]
+        transactions = fetch_transactions(cursor, limit, request.args.get('product_id'), transaction_type,
+                                          start, end, after)
         conn.close()
-        return jsonify(transactions), 200
+        
+        has_more = len(transactions) > limit
+        transactions = transactions[:limit]
+        next_cursor = None
+        if has_more:
+            last = transactions[-1]
+            next_cursor = encode_cursor(datetime.fromisoformat(last['created_at']), last['id'])
+        
+        return jsonify({
+            'transactions': transactions,
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -334,37 +654,41 @@ def create_transaction():
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Check if product exists and get current inventory
+        # Check if product exists
         cursor.execute('SELECT id FROM products WHERE id = ?', (data['product_id'],))
         if not cursor.fetchone():
             conn.close()
             return jsonify({'error': 'Product not found'}), 404
         
-        cursor.execute('SELECT quantity FROM inventory WHERE product_id = ?', (data['product_id'],))
-        inv_row = cursor.fetchone()
-        current_qty = inv_row['quantity'] if inv_row else 0
-        
-        # Check inventory for EXIT
-        if data['type'] == 'EXIT' and current_qty < quantity:
-            conn.close()
-            return jsonify({'error': f'Insufficient inventory. Available: {current_qty}'}), 400
-        
         # Create transaction
         transaction_id = str(uuid.uuid4())
         now = datetime.utcnow().isoformat()
+        delta = quantity if data['type'] == 'ENTRY' else -quantity
         
         try:
+            # Update inventory with one conditional UPDATE; the row count decides success
+            update_stock = '''
+                UPDATE inventory SET quantity = quantity + ?, last_updated = ?
+                WHERE product_id = ? AND quantity + ? >= 0
+            '''
+            cursor.execute(update_stock, (delta, now, data['product_id'], delta))
+            if cursor.rowcount != 1 and delta > 0:
+                # An entry for a product without a stock row creates the row
+                cursor.execute('INSERT OR IGNORE INTO inventory (id, product_id, quantity, last_updated) '
+                               'VALUES (?, ?, 0, ?)', (str(uuid.uuid4()), data['product_id'], now))
+                cursor.execute(update_stock, (delta, now, data['product_id'], delta))
+            if cursor.rowcount != 1:
+                conn.rollback()
+                available = fetch_stock(cursor, data['product_id']) or 0
+                conn.close()
+                return jsonify({'error': f'Insufficient inventory. Available: {available}'}), 400
+            
             cursor.execute('''
                 INSERT INTO transactions (id, product_id, type, quantity, reason, notes, created_at, updated_at)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (transaction_id, data['product_id'], data['type'], quantity, 
                   data.get('reason', ''), data.get('notes', ''), now, now))
             
-            # Update inventory
-            new_qty = current_qty + quantity if data['type'] == 'ENTRY' else current_qty - quantity
-            cursor.execute('UPDATE inventory SET quantity = ?, last_updated = ? WHERE product_id = ?',
-                          (new_qty, now, data['product_id']))
-            
             conn.commit()
         except Exception as e:
             conn.close()
@@ -393,14 +717,9 @@ def get_inventory_stats():
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Get all products with inventory
-        cursor.execute('''
-            SELECT p.*, i.quantity 
-            FROM products p 
-            LEFT JOIN inventory i ON p.id = i.product_id
-            ORDER BY p.created_at DESC
-        ''')
-        products = [dict(row) for row in cursor.fetchall()]
+        # Get all products with inventory through the shared joined query
+        products = [product for product, _, _ in
+                    fetch_products(cursor, ['id', 'name', 'price', 'category_id', 'inventory'])]
         
         # Get all categories
         cursor.execute('SELECT * FROM categories ORDER BY created_at DESC')
@@ -408,14 +727,19 @@ def get_inventory_stats():
         
         # Calculate stats
         total_products = len(products)
-        total_quantity = sum(p.get('quantity', 0) or 0 for p in products)
-        total_price = sum(p['price'] * (p.get('quantity', 0) or 0) for p in products)
+        total_quantity = sum(p['inventory']['quantity'] for p in products)
+        total_price = sum(p['price'] * p['inventory']['quantity'] for p in products)
+        
+        # Group products by category in one pass
+        products_by_category = {}
+        for p in products:
+            products_by_category.setdefault(p['category_id'], []).append(p)
         
         # Build categories with products
         categories_data = []
         for cat in categories:
-            cat_products = [p for p in products if p['category_id'] == cat['id']]
-            cat_total_qty = sum(p.get('quantity', 0) or 0 for p in cat_products)
+            cat_products = products_by_category.get(cat['id'], [])
+            cat_total_qty = sum(p['inventory']['quantity'] for p in cat_products)
             
             categories_data.append({
                 'id': cat['id'],
@@ -428,7 +752,7 @@ def get_inventory_stats():
                         'id': p['id'],
                         'name': p['name'],
                         'price': p['price'],
-                        'quantity': p.get('quantity', 0) or 0
+                        'quantity': p['inventory']['quantity']
                     }
                     for p in cat_products
                 ]
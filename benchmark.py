@@ -0,0 +1,710 @@
+"""
+Endpoint benchmarks on a seeded synthetic dataset.
+
+    python benchmark.py                                   # small dataset, every target
+    python benchmark.py --scale large --concurrency 1,16 --output results.json
+    python benchmark.py --categories 100 --products 100000 --transactions 10000000
+    python benchmark.py --targets app --database-url postgresql://localhost/inventory_bench
+    python benchmark.py --compare baseline.json results.json
+
+The dataset is generated from ``--seed``, so every run at a given scale sees
+the same rows. It is built once per scale under ``--data-dir``. Each target
+(``app``, ``app_sqlite`` and the ``routes/`` blueprints) then runs in its own
+process, through the Flask test client, on a fresh copy of that database.
+Every route of a target is exercised by at least one scenario. Routes
+without one are listed as ``uncovered`` in the results.
+
+For each scenario and concurrency level, results record latency
+percentiles, throughput and the process's peak RSS. GET requests bypass the
+response cache unless ``--cache warm`` is given. ``--compare`` diffs two
+result files and exits non-zero when a scenario regressed by more than
+``--threshold``.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, inspect
+from db import db
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import types
+import uuid
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# categories, products, transactions
+SCALES = {
+    'small': (10, 1000, 20000),
+    'medium': (50, 20000, 1000000),
+    'large': (100, 100000, 10000000),
+}
+TARGETS = ['app', 'app_sqlite', 'routes']
+SEED_TABLES = ['categories', 'products', 'transactions', 'inventory']
+SEED_CHUNK_SIZE = 10000
+
+# Transactions span [START, START + days); products are created in the 30 days before
+START = datetime(2024, 1, 1)
+PRODUCT_PERIOD = timedelta(days=30)
+
+# Scenarios flagged heavy (full listings) run a tenth of --requests
+HEAVY_FRACTION = 10
+
+
+def row_id(kind, index):
+    """Deterministic UUID-shaped id, so a run can name seeded rows without reading them back"""
+    return str(uuid.UUID(int=(kind << 96) | index))
+
+
+def category_id(index):
+    return row_id(1, index)
+
+
+def product_id(index):
+    return row_id(2, index)
+
+
+def product_sku(index):
+    return f'BENCH-{index:07d}'
+
+
+def generate_dataset(scale, seed, days):
+    """Yield ``(table, rows)`` chunks of the synthetic dataset, in foreign key order.
+
+    Stock never goes negative: an EXIT is only drawn when the product's
+    running balance covers it, and ``inventory`` holds the final balances.
+    """
+    categories, products, transactions = scale
+    rng = random.Random(seed)
+
+    yield 'categories', [{
+        'id': category_id(i),
+        'name': f'Category {i:03d}',
+        'description': f'Synthetic category {i}',
+        'created_at': START - PRODUCT_PERIOD,
+        'updated_at': START - PRODUCT_PERIOD,
+    } for i in range(categories)]
+
+    step = PRODUCT_PERIOD / max(products, 1)
+    prices = [round(rng.uniform(1, 500), 2) for _ in range(products)]
+    for offset in range(0, products, SEED_CHUNK_SIZE):
+        yield 'products', [{
+            'id': product_id(i),
+            'name': f'Product {i} {rng.choice(["Widget", "Gadget", "Bolt", "Cable", "Panel", "Sensor"])}',
+            'sku': product_sku(i),
+            'price': prices[i],
+            'description': '',
+            'category_id': category_id(i % categories),
+            'created_at': START - PRODUCT_PERIOD + step * i,
+            'updated_at': START - PRODUCT_PERIOD + step * i,
+        } for i in range(offset, min(offset + SEED_CHUNK_SIZE, products))]
+
+    balances = [0] * products
+    step = timedelta(days=days) / max(transactions, 1)
+    for offset in range(0, transactions, SEED_CHUNK_SIZE):
+        rows = []
+        for i in range(offset, min(offset + SEED_CHUNK_SIZE, transactions)):
+            index = rng.randrange(products)
+            quantity = rng.randint(1, 20)
+            if balances[index] >= quantity and rng.random() < 0.45:
+                kind = 'EXIT'
+                balances[index] -= quantity
+            else:
+                kind = 'ENTRY'
+                balances[index] += quantity
+            created_at = START + step * i
+            rows.append({
+                'id': row_id(4, i),
+                'product_id': product_id(index),
+                'type': kind,
+                'quantity': quantity,
+                'reason': 'Purchase Order' if kind == 'ENTRY' else 'Sale',
+                'notes': '',
+                'created_at': created_at,
+                'updated_at': created_at,
+            })
+        yield 'transactions', rows
+
+    updated_at = START + timedelta(days=days)
+    for offset in range(0, products, SEED_CHUNK_SIZE):
+        rows = []
+        for i in range(offset, min(offset + SEED_CHUNK_SIZE, products)):
+            reorder_point = 10 + i % 20
+            rows.append({
+                'id': row_id(3, i),
+                'product_id': product_id(i),
+                'quantity': balances[i],
+                'reorder_point': reorder_point,
+                'below_reorder': balances[i] < reorder_point,
+                'last_updated': updated_at,
+            })
+        yield 'inventory', rows
+
+
+def seed_app_database(url, scale, seed, days):
+    """Load the dataset into the SQLAlchemy schema, then let app.py's migrations derive the rest"""
+    engine = create_engine(url)
+    if 'products' in inspect(engine).get_table_names():
+        with engine.connect() as conn:
+            if conn.exec_driver_sql('SELECT 1 FROM products LIMIT 1').first():
+                raise SystemExit(f'Refusing to seed {engine.url!r}: it already holds products')
+    db.metadata.create_all(engine, tables=[db.metadata.tables[name] for name in SEED_TABLES])
+    with engine.connect() as conn:
+        for table, rows in generate_dataset(scale, seed, days):
+            conn.execute(db.metadata.tables[table].insert(), rows)
+            conn.commit()
+    engine.dispose()
+
+    # Rollups, checkpoints and the change feed are built by the migrations run on import
+    os.environ['DATABASE_URL'] = url
+    import app
+    if not app._db_ready:
+        raise SystemExit('Migrations failed on the seeded database')
+
+
+def seed_sqlite_app_database(scale, seed, days):
+    """Load the dataset into app_sqlite's schema (``inventory.db`` in the working directory)"""
+    import app_sqlite
+    conn = app_sqlite.get_db_connection()
+    columns = {}
+    for table, rows in generate_dataset(scale, seed, days):
+        if table not in columns:
+            present = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+            columns[table] = [column for column in rows[0] if column in present]
+        names = columns[table]
+        conn.executemany(
+            f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+            [tuple(row[c].isoformat() if isinstance(row[c], datetime) else row[c] for c in names)
+             for row in rows])
+        conn.commit()
+
+
+class BenchContext:
+    """What scenarios need to address seeded rows, plus a counter for unique names"""
+
+    def __init__(self, scale, seed, days):
+        self.categories, self.products, self.transactions = scale
+        self.rng = random.Random(seed + 1)
+        self.midpoint = START + timedelta(days=days / 2)
+        self._nonce = itertools.count()
+
+    def category_id(self):
+        return category_id(self.rng.randrange(self.categories))
+
+    def product_index(self):
+        return self.rng.randrange(self.products)
+
+    def product_id(self):
+        return product_id(self.product_index())
+
+    def nonce(self):
+        return f'{os.getpid()}-{next(self._nonce)}'
+
+
+def scenario(name, method, rule, build, heavy=False, first_chunk=False):
+    """A benchmarked request: ``build(ctx, client)`` returns the test client's ``open`` arguments.
+
+    ``build`` runs untimed, so it may issue setup requests (e.g. create the row
+    a DELETE removes). ``first_chunk`` times only the first body chunk, for
+    endless streams.
+    """
+    return {'name': name, 'method': method, 'rule': rule, 'build': build, 'heavy': heavy,
+            'first_chunk': first_chunk}
+
+
+def _create_category(ctx, client):
+    response = client.post('/api/categories', json={'name': f'Bench {ctx.nonce()}'})
+    return response.get_json()['id']
+
+
+def _create_product(ctx, client):
+    response = client.post('/api/products', json={'name': 'Bench product', 'sku': f'NEW-{ctx.nonce()}',
+                                                  'price': 9.99, 'category_id': ctx.category_id()})
+    return response.get_json()['id']
+
+
+def _create_transaction(ctx, client):
+    response = client.post('/api/transactions', json={'product_id': ctx.product_id(), 'type': 'ENTRY',
+                                                      'quantity': 1})
+    return response.get_json()['id']
+
+
+def _import_body(ctx):
+    """100 existing products re-imported with new prices (the upsert's update path)"""
+    lines = ['name,sku,price,category_id']
+    for _ in range(100):
+        index = ctx.product_index()
+        lines.append(f'Product {index},{product_sku(index)},{ctx.rng.randint(1, 500)},'
+                     f'{category_id(index % ctx.categories)}')
+    return '\n'.join(lines) + '\n'
+
+
+SCENARIOS = [
+    scenario('dashboard page', 'GET', '/', lambda ctx, client: {'path': '/'}),
+    scenario('health', 'GET', '/api/health', lambda ctx, client: {'path': '/api/health'}),
+    scenario('readiness', 'GET', '/api/ready', lambda ctx, client: {'path': '/api/ready'}),
+    scenario('pool metrics', 'GET', '/api/metrics/pool', lambda ctx, client: {'path': '/api/metrics/pool'}),
+
+    scenario('categories', 'GET', '/api/categories', lambda ctx, client: {'path': '/api/categories'}),
+    scenario('categories with counts', 'GET', '/api/categories',
+             lambda ctx, client: {'path': '/api/categories', 'query_string': {'fields': 'id,name,product_count'}}),
+    scenario('create category', 'POST', '/api/categories',
+             lambda ctx, client: {'path': '/api/categories', 'json': {'name': f'Bench {ctx.nonce()}'}}),
+    scenario('category', 'GET', '/api/categories/<category_id>',
+             lambda ctx, client: {'path': f'/api/categories/{ctx.category_id()}'}),
+    scenario('update category', 'PUT', '/api/categories/<category_id>',
+             lambda ctx, client: {'path': f'/api/categories/{ctx.category_id()}',
+                                  'json': {'description': f'Updated {ctx.nonce()}'}}),
+    scenario('delete category', 'DELETE', '/api/categories/<category_id>',
+             lambda ctx, client: {'path': f'/api/categories/{_create_category(ctx, client)}'}),
+
+    scenario('products', 'GET', '/api/products', lambda ctx, client: {'path': '/api/products'}, heavy=True),
+    scenario('products sparse', 'GET', '/api/products',
+             lambda ctx, client: {'path': '/api/products', 'query_string': {'fields': 'id,name,sku'}}, heavy=True),
+    scenario('products as_of', 'GET', '/api/products',
+             lambda ctx, client: {'path': '/api/products', 'query_string': {
+                 'fields': 'id,inventory', 'as_of': ctx.midpoint.isoformat()}}, heavy=True),
+    scenario('product', 'GET', '/api/products/<product_id>',
+             lambda ctx, client: {'path': f'/api/products/{ctx.product_id()}'}),
+    scenario('search by sku prefix', 'GET', '/api/products/search',
+             lambda ctx, client: {'path': '/api/products/search',
+                                  'query_string': {'q': product_sku(ctx.product_index())[:10]}}),
+    scenario('search by name', 'GET', '/api/products/search',
+             lambda ctx, client: {'path': '/api/products/search', 'query_string': {'q': 'gadget'}}),
+    scenario('create product', 'POST', '/api/products',
+             lambda ctx, client: {'path': '/api/products', 'json': {
+                 'name': 'Bench product', 'sku': f'NEW-{ctx.nonce()}', 'price': 9.99,
+                 'category_id': ctx.category_id()}}),
+    scenario('import 100 products', 'POST', '/api/products/import',
+             lambda ctx, client: {'path': '/api/products/import', 'data': _import_body(ctx),
+                                  'content_type': 'text/csv'}),
+    scenario('update product', 'PUT', '/api/products/<product_id>',
+             lambda ctx, client: {'path': f'/api/products/{ctx.product_id()}',
+                                  'json': {'price': ctx.rng.randint(1, 500)}}),
+    scenario('delete product', 'DELETE', '/api/products/<product_id>',
+             lambda ctx, client: {'path': f'/api/products/{_create_product(ctx, client)}'}),
+
+    scenario('transactions page', 'GET', '/api/transactions',
+             lambda ctx, client: {'path': '/api/transactions', 'query_string': {'limit': 50}}),
+    scenario('transactions with products', 'GET', '/api/transactions',
+             lambda ctx, client: {'path': '/api/transactions', 'query_string': {'limit': 50, 'expand': 'product'}}),
+    scenario('product history', 'GET', '/api/transactions',
+             lambda ctx, client: {'path': '/api/transactions',
+                                  'query_string': {'limit': 50, 'product_id': ctx.product_id()}}),
+    scenario('transactions in a day', 'GET', '/api/transactions',
+             lambda ctx, client: {'path': '/api/transactions', 'query_string': {
+                 'limit': 50, 'type': 'EXIT', 'from': ctx.midpoint.date().isoformat(),
+                 'to': ctx.midpoint.date().isoformat()}}),
+    scenario('transaction', 'GET', '/api/transactions/<transaction_id>',
+             lambda ctx, client: {'path': f'/api/transactions/{row_id(4, ctx.rng.randrange(ctx.transactions))}'}),
+    scenario('export product ledger', 'GET', '/api/transactions/export',
+             lambda ctx, client: {'path': '/api/transactions/export',
+                                  'query_string': {'format': 'csv', 'product_id': ctx.product_id()}}),
+    scenario('create transaction', 'POST', '/api/transactions',
+             lambda ctx, client: {'path': '/api/transactions', 'json': {
+                 'product_id': ctx.product_id(), 'type': 'ENTRY', 'quantity': 1, 'reason': 'Benchmark'}}),
+    scenario('batch of 50 transactions', 'POST', '/api/transactions/batch',
+             lambda ctx, client: {'path': '/api/transactions/batch', 'json': [
+                 {'product_id': ctx.product_id(), 'type': 'ENTRY', 'quantity': 1} for _ in range(50)]}),
+    scenario('delete transaction', 'DELETE', '/api/transactions/<transaction_id>',
+             lambda ctx, client: {'path': f'/api/transactions/{_create_transaction(ctx, client)}'}),
+
+    scenario('inventory stats', 'GET', '/api/inventory/stats',
+             lambda ctx, client: {'path': '/api/inventory/stats'}, heavy=True),
+    scenario('inventory stats totals', 'GET', '/api/inventory/stats',
+             lambda ctx, client: {'path': '/api/inventory/stats', 'query_string': {'include_products': 'false'}}),
+    scenario('inventory stats as_of', 'GET', '/api/inventory/stats',
+             lambda ctx, client: {'path': '/api/inventory/stats', 'query_string': {
+                 'include_products': 'false', 'as_of': ctx.midpoint.isoformat()}}, heavy=True),
+    scenario('inventory summary', 'GET', '/api/inventory/summary',
+             lambda ctx, client: {'path': '/api/inventory/summary'}),
+    scenario('low stock page', 'GET', '/api/inventory/low-stock',
+             lambda ctx, client: {'path': '/api/inventory/low-stock', 'query_string': {'limit': 50}}),
+    scenario('transactions summary', 'GET', '/api/inventory/transactions-summary',
+             lambda ctx, client: {'path': '/api/inventory/transactions-summary'}),
+    scenario('weekly movements', 'GET', '/api/inventory/movements',
+             lambda ctx, client: {'path': '/api/inventory/movements', 'query_string': {'bucket': 'week'}}),
+    scenario('monthly movements by category', 'GET', '/api/inventory/movements',
+             lambda ctx, client: {'path': '/api/inventory/movements',
+                                  'query_string': {'bucket': 'month', 'by': 'category'}}),
+
+    scenario('change feed from start', 'GET', '/api/changes',
+             lambda ctx, client: {'path': '/api/changes', 'query_string': {'since': 0, 'limit': 500}}),
+    scenario('stock stream connect', 'GET', '/api/stream/stock',
+             lambda ctx, client: {'path': '/api/stream/stock', 'buffered': False}, first_chunk=True),
+]
+
+
+def reset_peak_rss():
+    """Restart the peak RSS high-water mark (Linux); False if only the process lifetime peak is available"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def send(client, spec, kwargs):
+    """Issue one request and read its body; returns ``(status, seconds)``"""
+    started = time.perf_counter()
+    response = client.open(method=spec['method'], **kwargs)
+    if spec['first_chunk']:
+        next(iter(response.response), None)
+    else:
+        response.get_data()
+    elapsed = time.perf_counter() - started
+    response.close()
+    return response.status_code, elapsed
+
+
+def build_request(ctx, spec, client, cold):
+    kwargs = spec['build'](ctx, client)
+    if cold and spec['method'] == 'GET' and not spec['first_chunk']:
+        # A unique query string misses the response cache; handlers ignore the parameter
+        kwargs['query_string'] = dict(kwargs.get('query_string') or {}, _bench=ctx.nonce())
+    return kwargs
+
+
+def run_scenario(flask_app, ctx, spec, requests, concurrency, warmup, cold=True):
+    """Time ``requests`` calls of one scenario spread over ``concurrency`` threads"""
+    client = flask_app.test_client()
+    for _ in range(warmup):
+        send(client, spec, build_request(ctx, spec, client, cold))
+
+    counter = itertools.count()
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker():
+        client = flask_app.test_client()
+        while next(counter) < requests:
+            status, elapsed = send(client, spec, build_request(ctx, spec, client, cold))
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    peak_scope = 'scenario' if reset_peak_rss() else 'process'
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda seconds: round(seconds * 1000, 3) if seconds is not None else None
+    return {
+        'scenario': spec['name'],
+        'method': spec['method'],
+        'rule': spec['rule'],
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+        'status_counts': {str(status): count for status, count in sorted(statuses.items())},
+        'latency_ms': {
+            'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': ms(percentile(latencies, 0.50)),
+            'p90': ms(percentile(latencies, 0.90)),
+            'p95': ms(percentile(latencies, 0.95)),
+            'p99': ms(percentile(latencies, 0.99)),
+            'max': ms(latencies[-1] if latencies else None),
+        },
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else None,
+        'peak_rss_kb': peak_rss_kb(),
+        'peak_rss_scope': peak_scope,
+    }
+
+
+def load_target(target):
+    """Import a target's Flask app; the database location comes from the environment set by the driver"""
+    if target == 'app':
+        import app
+        return app.app
+    if target == 'app_sqlite':
+        import app_sqlite
+        return app_sqlite.app
+
+    # models.py takes its `db` from `app` and declares the same tables as db.py, so the
+    # blueprints get a stand-in `app` module with a db of their own; this worker
+    # process never imports app.py
+    from flask import Flask
+    from flask_sqlalchemy import SQLAlchemy
+    from config import get_config
+    stand_in = types.ModuleType('app')
+    stand_in.db = SQLAlchemy()
+    sys.modules['app'] = stand_in
+    from routes.categories import categories_bp
+    from routes.inventory import inventory_bp
+    from routes.products import products_bp
+    from routes.transactions import transactions_bp
+    app_config = get_config()
+    routes_app = Flask('routes')
+    routes_app.config.from_object(app_config)
+    routes_app.config['SQLALCHEMY_ENGINE_OPTIONS'] = app_config.engine_options()
+    stand_in.db.init_app(routes_app)
+    for blueprint in (categories_bp, inventory_bp, products_bp, transactions_bp):
+        routes_app.register_blueprint(blueprint)
+    return routes_app
+
+
+def route_keys(flask_app):
+    return {(method, rule.rule) for rule in flask_app.url_map.iter_rules() if rule.endpoint != 'static'
+            for method in rule.methods - {'HEAD', 'OPTIONS'}}
+
+
+def run_target(args, scale):
+    """Benchmark one target in this process; returns its result record"""
+    record = {'target': args.target, 'scenarios': [], 'uncovered': []}
+    # A target that cannot load fails the whole run rather than leaving a gap in the results
+    flask_app = load_target(args.target)
+
+    routes = route_keys(flask_app)
+    covered = set()
+    ctx = BenchContext(scale, args.seed, args.days)
+    for spec in SCENARIOS:
+        if (spec['method'], spec['rule']) not in routes:
+            continue
+        covered.add((spec['method'], spec['rule']))
+        requests = max(1, args.requests // HEAVY_FRACTION) if spec['heavy'] else args.requests
+        for concurrency in args.concurrency:
+            result = run_scenario(flask_app, ctx, spec, requests, concurrency, args.warmup,
+                                  cold=args.cache == 'cold')
+            record['scenarios'].append(result)
+            print(f"  {args.target:<10} {spec['name']:<32} c={concurrency:<3} "
+                  f"p50={result['latency_ms']['p50']}ms p99={result['latency_ms']['p99']}ms "
+                  f"{result['throughput_rps']} req/s errors={result['errors']}", flush=True)
+    record['uncovered'] = [f'{method} {rule}' for method, rule in sorted(routes - covered)]
+    return record
+
+
+def dataset_key(args, scale):
+    key = f'{scale[0]}c-{scale[1]}p-{scale[2]}t-{args.days}d-seed{args.seed}'
+    if args.database_url:
+        key += '-' + uuid.uuid5(uuid.NAMESPACE_URL, args.database_url).hex[:8]
+    return key
+
+
+def worker_command(args, mode, target=None):
+    command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], '--worker', mode]
+    if target:
+        command += ['--target', target]
+    return command
+
+
+def prepare_dataset(args, scale, target):
+    """Seed (once per scale) the database ``target`` reads and return the path of a fresh copy to run on"""
+    kind = 'app_sqlite' if target == 'app_sqlite' else 'app'
+    directory = os.path.join(args.data_dir, dataset_key(args, scale), kind)
+    manifest = os.path.join(directory, 'manifest.json')
+    if kind == 'app':
+        seeded = os.path.join(directory, 'app.db')
+        env = {'DATABASE_URL': args.database_url or f'sqlite:///{seeded}'}
+    else:
+        seeded = os.path.join(directory, 'inventory.db')
+        env = {}
+
+    if not os.path.exists(manifest):
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        print(f"Seeding {kind} database: {scale[0]} categories, {scale[1]} products, {scale[2]} transactions",
+              flush=True)
+        started = time.perf_counter()
+        subprocess.run(worker_command(args, 'seed', kind), cwd=directory, env=dict(os.environ, **env), check=True)
+        with open(manifest, 'w') as f:
+            json.dump({'scale': scale, 'seed': args.seed, 'days': args.days,
+                       'seconds': round(time.perf_counter() - started, 1)}, f)
+
+    if args.database_url and kind == 'app':
+        return directory, env  # writes persist; reseed by removing the data directory and the database
+
+    run_dir = os.path.join(args.data_dir, 'run', target)
+    shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(run_dir)
+    shutil.copyfile(seeded, os.path.join(run_dir, os.path.basename(seeded)))
+    if kind == 'app':
+        env = {'DATABASE_URL': f"sqlite:///{os.path.join(run_dir, 'app.db')}"}
+    return run_dir, env
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return {'commit': commit, 'dirty': dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+def run_benchmarks(args, scale):
+    results = {
+        'meta': dict(git_revision(),
+                     started_at=datetime.utcnow().isoformat(),
+                     python=platform.python_version(),
+                     platform=platform.platform(),
+                     cpus=os.cpu_count(),
+                     sqlite=sqlite3.sqlite_version,
+                     database='postgresql' if args.database_url else 'sqlite',
+                     scale={'categories': scale[0], 'products': scale[1], 'transactions': scale[2]},
+                     seed=args.seed,
+                     days=args.days,
+                     requests=args.requests,
+                     warmup=args.warmup,
+                     concurrency=args.concurrency,
+                     cache=args.cache),
+        'targets': [],
+    }
+    for target in args.targets:
+        run_dir, env = prepare_dataset(args, scale, target)
+        output = os.path.join(run_dir, 'result.json')
+        print(f"Benchmarking {target}", flush=True)
+        subprocess.run(worker_command(args, 'run', target) + ['--worker-output', output],
+                       cwd=run_dir, env=dict(os.environ, **env), check=True)
+        with open(output) as f:
+            results['targets'].append(json.load(f))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+def compare(baseline_path, current_path, threshold):
+    """Print per-scenario changes between two result files; returns the number of regressions"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(current_path) as f:
+        current = json.load(f)
+
+    def index(results):
+        return {(target['target'], s['scenario'], s['concurrency']): s
+                for target in results['targets'] for s in target['scenarios']}
+
+    before, after = index(baseline), index(current)
+    print(f"{baseline['meta'].get('commit')} -> {current['meta'].get('commit')} (threshold {threshold:.0%})")
+    if baseline['meta'].get('scale') != current['meta'].get('scale'):
+        print('Warning: the runs used different dataset scales')
+
+    regressions = 0
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        changes = []
+        for metric in ('p50', 'p99'):
+            if old['latency_ms'][metric] and new['latency_ms'][metric] is not None:
+                changes.append((metric, new['latency_ms'][metric] / old['latency_ms'][metric] - 1))
+        if old['throughput_rps'] and new['throughput_rps'] is not None:
+            # Falling throughput is the regression, so flip its sign
+            changes.append(('rps', old['throughput_rps'] / new['throughput_rps'] - 1 if new['throughput_rps'] else 1))
+        regressed = any(change > threshold for _, change in changes) or new['errors'] > old['errors']
+        regressions += regressed
+        summary = '  '.join(f'{metric} {change:+.0%}' for metric, change in changes)
+        print(f"{'REGRESSION' if regressed else 'ok':<10} {key[0]:<10} {key[1]:<32} c={key[2]:<3} {summary}")
+    for key in sorted(before.keys() - after.keys()):
+        print(f"{'missing':<10} {key[0]:<10} {key[1]:<32} c={key[2]}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark every API route on a seeded dataset')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small',
+                        help='dataset preset (small: 10/1k/20k, medium: 50/20k/1M, large: 100/100k/10M)')
+    parser.add_argument('--categories', type=int, help='override the preset category count')
+    parser.add_argument('--products', type=int, help='override the preset product count')
+    parser.add_argument('--transactions', type=int, help='override the preset transaction count')
+    parser.add_argument('--days', type=int, default=365, help='days of history the transactions span')
+    parser.add_argument('--seed', type=int, default=1, help='random seed of the dataset and the requests')
+    parser.add_argument('--targets', default=','.join(TARGETS),
+                        type=lambda value: [t for t in value.split(',') if t],
+                        help=f"comma-separated subset of {', '.join(TARGETS)}")
+    parser.add_argument('--database-url', help='benchmark app and routes on this (empty) PostgreSQL database')
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed requests before each scenario')
+    parser.add_argument('--concurrency', default=[1, 8],
+                        type=lambda value: [int(c) for c in value.split(',')],
+                        help='comma-separated thread counts; 1 is the sequential mode')
+    parser.add_argument('--cache', choices=['cold', 'warm'], default='cold',
+                        help='cold gives every GET a unique URL so cached endpoints run their queries')
+    parser.add_argument('--data-dir', default=os.path.join(ROOT, 'bench_data'),
+                        help='where seeded databases are kept between runs')
+    parser.add_argument('--output', default='bench_results.json', help='JSON results file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='diff two results files instead of running')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown reported as a regression by --compare')
+    # Internal: the driver re-invokes this script per target
+    parser.add_argument('--worker', choices=['seed', 'run'], help=argparse.SUPPRESS)
+    parser.add_argument('--target', help=argparse.SUPPRESS)
+    parser.add_argument('--worker-output', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    unknown = [t for t in args.targets if t not in TARGETS]
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(unknown)}")
+    if args.database_url and not args.database_url.startswith('postgres'):
+        parser.error('--database-url must be a PostgreSQL URL; SQLite databases are managed under --data-dir')
+    args.data_dir = os.path.abspath(args.data_dir)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        return 1 if compare(*args.compare, args.threshold) else 0
+
+    preset = SCALES[args.scale]
+    scale = (args.categories or preset[0], args.products or preset[1], args.transactions or preset[2])
+
+    if args.worker == 'seed':
+        if args.target == 'app':
+            seed_app_database(os.environ['DATABASE_URL'], scale, args.seed, args.days)
+        else:
+            seed_sqlite_app_database(scale, args.seed, args.days)
+        return 0
+    if args.worker == 'run':
+        record = run_target(args, scale)
+        with open(args.worker_output, 'w') as f:
+            json.dump(record, f)
+        return 0
+
+    run_benchmarks(args, scale)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Versioned in-process cache of JSON responses with ETag/304 support
+"""
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, make_response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from db import get_data_version
+import threading
+import time
+import zlib
+
+
+class ResponseCache:
+    """Serialized response bodies keyed by request path and data version.
+
+    The data version lives in the database so every worker sees the same
+    value; each process re-reads it at most once per ``ttl`` seconds, and
+    immediately after committing a write of its own. Within that window a
+    matching ``If-None-Match`` is answered without touching the database.
+    """
+
+    def __init__(self, ttl=1.0, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._bodies = OrderedDict()
+
+    def current_version(self):
+        version = self.fresh_version()
+        if version is None:
+            version = self.update_version(get_data_version())
+        return version
+
+    def fresh_version(self):
+        """The data version if it was read less than ``ttl`` seconds ago, else None"""
+        with self._lock:
+            if self._version is not None and time.monotonic() - self._checked_at < self.ttl:
+                return self._version
+        return None
+
+    def update_version(self, version):
+        """Record a data version just read from the database"""
+        with self._lock:
+            if version != self._version:
+                # Bodies of older versions can never be served again
+                self._bodies.clear()
+            self._version = version
+            self._checked_at = time.monotonic()
+        return version
+
+    def invalidate(self):
+        """Force the next request to re-read the data version"""
+        with self._lock:
+            self._checked_at = 0.0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._bodies.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._bodies.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, version, body):
+        with self._lock:
+            self._bodies[key] = (version, body)
+            self._bodies.move_to_end(key)
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+
+
+response_cache = ResponseCache()
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_write(session):
+    if session.info.pop('data_version_bumped', False):
+        response_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_version_bump(session, previous_transaction):
+    session.info.pop('data_version_bumped', None)
+
+
+def make_etag(version, key):
+    """Strong ETag of a cached response: the data version plus a hash of the request"""
+    return f'v{version}-{zlib.crc32(key.encode("utf-8")):08x}'
+
+
+def cached_json(view):
+    """Serve a GET JSON endpoint from the versioned cache with a strong ETag"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version = response_cache.current_version()
+        key = request.full_path
+        etag = make_etag(version, key)
+
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            body = response_cache.get(key, version)
+            if body is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response_cache.set(key, version, response.get_data())
+            else:
+                response = Response(body, status=200, mimetype='application/json')
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
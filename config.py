@@ -1,8 +1,16 @@
 import os
 from dotenv import load_dotenv
+from sqlalchemy.pool import NullPool
+from pool_metrics import InstrumentedQueuePool
 
 load_dotenv()
 
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).lower() in ('1', 'true', 'yes')
+
 class Config:
     """Base configuration"""
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -14,6 +22,56 @@ class Config:
         'postgresql://localhost/inventory_db'
     )
 
+    # Connection pool profile (each value can be overridden from the environment)
+    DB_POOL_SIZE = _env_int('DB_POOL_SIZE', 5)
+    DB_MAX_OVERFLOW = _env_int('DB_MAX_OVERFLOW', 5)
+    DB_POOL_TIMEOUT = _env_int('DB_POOL_TIMEOUT', 30)       # seconds to wait for a free connection
+    DB_POOL_RECYCLE = _env_int('DB_POOL_RECYCLE', 1800)     # seconds before a connection is replaced
+    DB_POOL_PRE_PING = _env_bool('DB_POOL_PRE_PING', True)
+    DB_STATEMENT_TIMEOUT_MS = _env_int('DB_STATEMENT_TIMEOUT_MS', 30000)
+    # PgBouncer in transaction mode pools server connections itself and rejects
+    # startup options, so the app opens one connection per checkout and the
+    # statement timeout must be set on the database role instead
+    DB_PGBOUNCER = _env_bool('DB_PGBOUNCER', False)
+    # Direct (non-pooled) PostgreSQL URL for the stock event listener. LISTEN
+    # holds its server connection for good, which PgBouncer's transaction mode
+    # cannot do, so with DB_PGBOUNCER the events only cross processes when set
+    DATABASE_LISTEN_URL = os.getenv('DATABASE_LISTEN_URL')
+
+    @classmethod
+    def engine_options(cls):
+        """SQLALCHEMY_ENGINE_OPTIONS for this profile and database URL"""
+        uri = cls.SQLALCHEMY_DATABASE_URI
+        if uri.startswith('sqlite'):
+            # In-memory databases need their single shared connection
+            in_memory = uri == 'sqlite://' or ':memory:' in uri
+            return {} if in_memory else {'poolclass': InstrumentedQueuePool}
+
+        if cls.DB_PGBOUNCER:
+            return {'poolclass': NullPool, 'pool_pre_ping': cls.DB_POOL_PRE_PING}
+
+        options = {
+            'poolclass': InstrumentedQueuePool,
+            'pool_size': cls.DB_POOL_SIZE,
+            'max_overflow': cls.DB_MAX_OVERFLOW,
+            'pool_timeout': cls.DB_POOL_TIMEOUT,
+            'pool_recycle': cls.DB_POOL_RECYCLE,
+            'pool_pre_ping': cls.DB_POOL_PRE_PING,
+        }
+        if uri.startswith('postgres') and cls.DB_STATEMENT_TIMEOUT_MS:
+            options['connect_args'] = {'options': f'-c statement_timeout={cls.DB_STATEMENT_TIMEOUT_MS}'}
+        return options
+
+    @classmethod
+    def listen_url(cls):
+        """URL the stock event listener connects to, None when events cannot cross processes"""
+        uri = cls.DATABASE_LISTEN_URL or cls.SQLALCHEMY_DATABASE_URI
+        if not uri.startswith('postgres'):
+            return None
+        if cls.DB_PGBOUNCER and not cls.DATABASE_LISTEN_URL:
+            return None
+        return uri
+
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
@@ -24,6 +82,14 @@ class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
 
+    # Serverless Postgres drops idle connections after a few minutes, so
+    # recycle well before that and fail slow queries fast
+    DB_POOL_SIZE = _env_int('DB_POOL_SIZE', 10)
+    DB_MAX_OVERFLOW = _env_int('DB_MAX_OVERFLOW', 20)
+    DB_POOL_TIMEOUT = _env_int('DB_POOL_TIMEOUT', 10)
+    DB_POOL_RECYCLE = _env_int('DB_POOL_RECYCLE', 280)
+    DB_STATEMENT_TIMEOUT_MS = _env_int('DB_STATEMENT_TIMEOUT_MS', 15000)
+
 class TestingConfig(Config):
     """Testing configuration"""
     DEBUG = True
@@ -1,12 +1,36 @@
 import json
 import os
 from datetime import datetime
+from contextlib import contextmanager
+import threading
+import time
 import uuid
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
 # Data file path - use /tmp for Vercel, local for development
 DATA_DIR = Path(os.environ.get('DATA_DIR', '.')) / 'data'
+# Compacted snapshot of the whole store
 DATA_FILE = DATA_DIR / 'inventory.json'
+# Append-only journal of mutations since the snapshot, one JSON object per line
+JOURNAL_FILE = DATA_DIR / 'inventory.journal'
+# Held exclusively by whichever process is writing
+LOCK_FILE = DATA_DIR / 'inventory.lock'
+
+# Fold the journal into a new snapshot once it holds this many entries
+COMPACT_EVERY = int(os.environ.get('JOURNAL_COMPACT_EVERY', 1000))
+# fsync every journal write and snapshot before reporting success
+FSYNC = os.environ.get('JOURNAL_FSYNC', 'true').lower() in ('1', 'true', 'yes')
+# Group commit: mutations arriving within this many milliseconds share one
+# locked, fsynced journal write (0 writes each mutation on its own). Only
+# threads of one process are coalesced, so enable it for threaded workers
+# (gthread, or the development server); single-threaded workers still
+# lock and fsync once per mutation and would only wait out the window
+GROUP_COMMIT_MS = int(os.environ.get('JOURNAL_GROUP_COMMIT_MS', 0))
 
 # Ensure directory exists (safe version for serverless)
 def _ensure_data_dir():
@@ -18,51 +42,345 @@ def _ensure_data_dir():
         print(f"Warning: Could not create data directory: {e}")
         return False
 
+def _empty_data():
+    return {
+        'categories': [],
+        'products': [],
+        'inventory': {},
+        'transactions': [],
+        'seq': 0
+    }
+
+def _file_signature(path):
+    """(inode, mtime, size) of a file, or None when it does not exist"""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+class _Store:
+    """In-memory copy of the data files with lookup indexes.
+
+    Records live in dicts keyed by id (insertion ordered, so listings keep
+    their original order), with secondary indexes by category name, SKU and
+    category -> products. The store remembers which snapshot it was built
+    from and how far into the journal it has read, so a refresh costs one
+    ``stat`` when nothing changed and only replays new journal lines when
+    another process appended.
+    """
+
+    def __init__(self):
+        self.categories = {}
+        self.category_ids_by_name = {}
+        self.products = {}
+        self.product_ids_by_sku = {}
+        self.product_ids_by_category = {}
+        self.inventory = {}
+        self.transactions = []
+        self.seq = 0
+        self.journal_entries = 0
+        self.snapshot_signature = None
+        self.journal_offset = 0
+
+    @classmethod
+    def from_data(cls, data):
+        store = cls()
+        for category in data['categories']:
+            store._add_category(category)
+        for product in data['products']:
+            store._add_product(product, data['inventory'].get(product['id']))
+        store.transactions = list(data['transactions'])
+        store.seq = data.get('seq', 0)
+        return store
+
+    def to_data(self):
+        """Copy of the store's records; changing it never touches the store (records are flat dicts)"""
+        return {
+            'categories': [dict(c) for c in self.categories.values()],
+            'products': [dict(p) for p in self.products.values()],
+            'inventory': {product_id: dict(i) for product_id, i in self.inventory.items()},
+            'transactions': [dict(t) for t in self.transactions],
+            'seq': self.seq
+        }
+
+    def _add_category(self, category):
+        self.categories[category['id']] = category
+        self.category_ids_by_name[category['name']] = category['id']
+        self.product_ids_by_category.setdefault(category['id'], {})
+
+    def _add_product(self, product, inventory):
+        self.products[product['id']] = product
+        self.product_ids_by_sku[product['sku']] = product['id']
+        self.product_ids_by_category.setdefault(product['category_id'], {})[product['id']] = None
+        if inventory is not None:
+            self.inventory[product['id']] = inventory
+
+    def apply(self, entry):
+        """Apply one journal entry"""
+        op = entry['op']
+        if op == 'add_category':
+            self._add_category(entry['category'])
+        elif op == 'delete_category':
+            category = self.categories.pop(entry['id'], None)
+            if category:
+                self.category_ids_by_name.pop(category['name'], None)
+                self.product_ids_by_category.pop(entry['id'], None)
+        elif op == 'add_product':
+            self._add_product(entry['product'], entry['inventory'])
+        elif op == 'delete_product':
+            product = self.products.pop(entry['id'], None)
+            if product:
+                self.product_ids_by_sku.pop(product['sku'], None)
+                self.product_ids_by_category.get(product['category_id'], {}).pop(entry['id'], None)
+            self.inventory.pop(entry['id'], None)
+            self.transactions = [t for t in self.transactions if t['product_id'] != entry['id']]
+        elif op == 'add_transaction':
+            transaction = entry['transaction']
+            self.transactions.append(transaction)
+            inventory = self.inventory[transaction['product_id']]
+            inventory['quantity'] = entry['quantity']
+            inventory['last_updated'] = transaction['created_at']
+        self.seq = entry['seq']
+
+    def replay_journal(self, truncate=False):
+        """Apply complete journal lines past ``journal_offset``.
+
+        A final line without its newline is either still being written by
+        another process or was torn by a crash; with ``truncate`` (only
+        safe while holding the write lock) it is cut off so later appends
+        start on a clean line.
+        """
+        if not JOURNAL_FILE.exists():
+            return
+        with open(JOURNAL_FILE, 'rb') as f:
+            f.seek(self.journal_offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                self.journal_offset += len(line)
+                # Entries already folded into the snapshot are skipped
+                if entry['seq'] > self.seq:
+                    self.apply(entry)
+                    self.journal_entries += 1
+        if truncate and self.journal_offset < JOURNAL_FILE.stat().st_size:
+            os.truncate(JOURNAL_FILE, self.journal_offset)
+
+# Process-wide store, rebuilt only when the files change underneath it.
+# Lock order is always _store_lock, then the inter-process file lock.
+_store = None
+_store_lock = threading.RLock()
+
+@contextmanager
+def _file_lock():
+    """Exclusive inter-process lock held for the duration of a write"""
+    _ensure_data_dir()
+    with open(LOCK_FILE, 'a') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _fsync_dir(path):
+    """Make a rename in ``path`` durable"""
+    if not FSYNC or not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _load_store(locked=False):
+    """Build a store from the snapshot and the whole journal"""
+    _ensure_data_dir()
+    signature = _file_signature(DATA_FILE)
+    data = _empty_data()
+    if signature is not None:
+        with open(DATA_FILE, 'r', encoding='utf-8') as f:
+            data.update(json.load(f))
+    store = _Store.from_data(data)
+    store.snapshot_signature = signature
+    store.replay_journal(truncate=locked)
+    return store
+
+def _get_store(locked=False):
+    """Return the cached store, reloading or replaying the journal tail if the files changed.
+
+    Writers pass ``locked=True`` while holding the file lock; a load failure
+    is then raised instead of serving a possibly stale store.
+    """
+    global _store
+    with _store_lock:
+        try:
+            if _store is None or _file_signature(DATA_FILE) != _store.snapshot_signature:
+                _store = _load_store(locked)
+            else:
+                journal = _file_signature(JOURNAL_FILE)
+                journal_size = journal[2] if journal else 0
+                if journal_size > _store.journal_offset:
+                    _store.replay_journal(truncate=locked)
+                elif journal_size < _store.journal_offset:
+                    # Journal was reset without a new snapshot; start over
+                    _store = _load_store(locked)
+        except Exception as e:
+            if locked:
+                _store = None
+                raise
+            print(f"Error loading data: {e}")
+            if _store is None:
+                _store = _Store()
+        return _store
+
+def _write_snapshot(data):
+    """Atomically replace the snapshot and reset the journal; caller holds the file lock"""
+    _ensure_data_dir()
+    snapshot = {key: data[key] for key in ('categories', 'products', 'inventory', 'transactions', 'seq')}
+    tmp_file = DATA_FILE.with_suffix('.json.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+        f.flush()
+        if FSYNC:
+            os.fsync(f.fileno())
+    os.replace(tmp_file, DATA_FILE)
+    _fsync_dir(DATA_DIR)
+    # Safe even if we crash before this: replay skips entries up to data['seq']
+    with open(JOURNAL_FILE, 'w', encoding='utf-8'):
+        pass
+
 def init_data():
     """Initialize data file with empty structure"""
-    if not DATA_FILE.exists():
-        initial_data = {
-            'categories': [],
-            'products': [],
-            'inventory': {},
-            'transactions': []
-        }
-        save_data(initial_data)
+    with _store_lock, _file_lock():
+        if not DATA_FILE.exists():
+            _write_snapshot(_empty_data())
     return load_data()
 
 def load_data():
-    """Load data from JSON file"""
-    try:
-        _ensure_data_dir()
-        if DATA_FILE.exists():
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        else:
-            return {
-                'categories': [],
-                'products': [],
-                'inventory': {},
-                'transactions': []
-            }
-    except Exception as e:
-        print(f"Error loading data: {e}")
-        return {
-            'categories': [],
-            'products': [],
-            'inventory': {},
-            'transactions': []
-        }
+    """Load the snapshot and replay the journal written since it"""
+    return _get_store().to_data()
 
 def save_data(data):
-    """Save data to JSON file"""
+    """Write a full snapshot and reset the journal (compaction)"""
+    global _store
+    with _store_lock:
+        try:
+            with _file_lock():
+                _write_snapshot(data)
+            _store = None
+            return True
+        except Exception as e:
+            print(f"Error saving data: {e}")
+            return False
+
+def _write_batch(prepares):
+    """Validate and journal a batch of mutations with one write; caller holds both locks.
+
+    Each ``prepare(store)`` returns ``(entry, result, error)``; its entry
+    is applied before the next one is validated, so a batch behaves like
+    the same mutations committed one by one. Returns ``(result, error)``
+    per mutation.
+    """
+    global _store
     try:
-        _ensure_data_dir()
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        return True
+        store = _get_store(locked=True)
+        outcomes, lines = [], []
+        for prepare in prepares:
+            # A failing prepare rejects only its own mutation, not the rest of the group
+            try:
+                entry, result, error = prepare(store)
+            except Exception as e:
+                print(f"Error validating data: {e}")
+                outcomes.append((None, 'Invalid data'))
+                continue
+            if entry is not None:
+                entry['seq'] = store.seq + 1
+                store.apply(entry)
+                store.journal_entries += 1
+                lines.append(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+            outcomes.append((result, error))
+
+        if lines:
+            payload = ''.join(lines).encode('utf-8')
+            with open(JOURNAL_FILE, 'ab') as f:
+                f.write(payload)
+                f.flush()
+                if FSYNC:
+                    os.fsync(f.fileno())
+            store.journal_offset += len(payload)
+
+            if store.journal_entries >= COMPACT_EVERY:
+                _write_snapshot(store.to_data())
+                store.snapshot_signature = _file_signature(DATA_FILE)
+                store.journal_offset = 0
+                store.journal_entries = 0
+        return outcomes
     except Exception as e:
         print(f"Error saving data: {e}")
-        return False
+        # The in-memory store may be ahead of what reached the disk
+        _store = None
+        return [(None, 'Could not save data')] * len(prepares)
+
+class _GroupCommit:
+    """Coalesces mutations from concurrent threads into one journal write.
+
+    The first caller of a window becomes its leader: it waits
+    ``GROUP_COMMIT_MS`` for other callers to queue up, then writes the
+    whole batch under the locks with a single fsync and hands every
+    follower its outcome.
+
+    Batches never span processes: each process's leader takes the file lock
+    and fsyncs for its own threads, so several single-threaded workers gain
+    nothing from the window and only pay its latency.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def submit(self, prepare):
+        waiter = {'prepare': prepare, 'done': threading.Event(), 'outcome': (None, 'Could not save data')}
+        with self._lock:
+            self._pending.append(waiter)
+            leader = len(self._pending) == 1
+        if not leader:
+            waiter['done'].wait()
+            return waiter['outcome']
+
+        time.sleep(GROUP_COMMIT_MS / 1000.0)
+        with self._lock:
+            batch, self._pending = self._pending, []
+        try:
+            with _store_lock, _file_lock():
+                outcomes = _write_batch([w['prepare'] for w in batch])
+            for w, outcome in zip(batch, outcomes):
+                w['outcome'] = outcome
+        except Exception as e:
+            print(f"Error saving data: {e}")
+        finally:
+            for w in batch:
+                w['done'].set()
+        return waiter['outcome']
+
+_group_commit = _GroupCommit()
+
+def _mutate(prepare):
+    """Validate ``prepare`` against the latest state and durably journal its entry"""
+    if GROUP_COMMIT_MS > 0:
+        return _group_commit.submit(prepare)
+    with _store_lock:
+        try:
+            with _file_lock():
+                return _write_batch([prepare])[0]
+        except Exception as e:
+            print(f"Error saving data: {e}")
+            return None, 'Could not save data'
 
 def get_all_data():
     """Get all data"""
@@ -70,169 +388,151 @@ def get_all_data():
 
 def add_category(name, description=''):
     """Add a new category"""
-    data = load_data()
-    
-    # Check if category exists
-    if any(cat['name'] == name for cat in data['categories']):
-        return None, 'Category already exists'
-    
-    category = {
-        'id': str(uuid.uuid4()),
-        'name': name,
-        'description': description,
-        'created_at': datetime.utcnow().isoformat(),
-        'updated_at': datetime.utcnow().isoformat()
-    }
-    
-    data['categories'].append(category)
-    save_data(data)
-    return category, None
+    def prepare(store):
+        # Check if category exists
+        if name in store.category_ids_by_name:
+            return None, None, 'Category already exists'
+
+        category = {
+            'id': str(uuid.uuid4()),
+            'name': name,
+            'description': description,
+            'created_at': datetime.utcnow().isoformat(),
+            'updated_at': datetime.utcnow().isoformat()
+        }
+        return {'op': 'add_category', 'category': category}, dict(category), None
+
+    return _mutate(prepare)
 
 def get_categories():
     """Get all categories"""
-    data = load_data()
-    return data['categories']
+    return [dict(c) for c in _get_store().categories.values()]
 
 def delete_category(category_id):
     """Delete a category"""
-    data = load_data()
-    
-    # Check if category has products
-    if any(p['category_id'] == category_id for p in data['products']):
-        return False, 'Cannot delete category with existing products'
-    
-    data['categories'] = [c for c in data['categories'] if c['id'] != category_id]
-    save_data(data)
-    return True, None
+    def prepare(store):
+        # Check if category has products
+        if store.product_ids_by_category.get(category_id):
+            return None, False, 'Cannot delete category with existing products'
+        return {'op': 'delete_category', 'id': category_id}, True, None
+
+    return _mutate(prepare)
 
 def add_product(name, sku, price, category_id, description=''):
     """Add a new product"""
-    data = load_data()
-    
-    # Check if SKU exists
-    if any(p['sku'] == sku for p in data['products']):
-        return None, 'Product with this Product Code already exists'
-    
-    # Check if category exists
-    if not any(c['id'] == category_id for c in data['categories']):
-        return None, 'Category not found'
-    
-    product_id = str(uuid.uuid4())
-    product = {
-        'id': product_id,
-        'name': name,
-        'description': description,
-        'sku': sku,
-        'price': float(price),
-        'category_id': category_id,
-        'created_at': datetime.utcnow().isoformat(),
-        'updated_at': datetime.utcnow().isoformat()
-    }
-    
-    data['products'].append(product)
-    
-    # Create inventory record
-    data['inventory'][product_id] = {
-        'id': str(uuid.uuid4()),
-        'product_id': product_id,
-        'quantity': 0,
-        'last_updated': datetime.utcnow().isoformat()
-    }
-    
-    save_data(data)
-    product['inventory'] = data['inventory'][product_id]
-    return product, None
+    def prepare(store):
+        # Check if SKU exists
+        if sku in store.product_ids_by_sku:
+            return None, None, 'Product with this Product Code already exists'
+
+        # Check if category exists
+        if category_id not in store.categories:
+            return None, None, 'Category not found'
+
+        product_id = str(uuid.uuid4())
+        product = {
+            'id': product_id,
+            'name': name,
+            'description': description,
+            'sku': sku,
+            'price': float(price),
+            'category_id': category_id,
+            'created_at': datetime.utcnow().isoformat(),
+            'updated_at': datetime.utcnow().isoformat()
+        }
+
+        # Create inventory record
+        inventory = {
+            'id': str(uuid.uuid4()),
+            'product_id': product_id,
+            'quantity': 0,
+            'last_updated': datetime.utcnow().isoformat()
+        }
+
+        entry = {'op': 'add_product', 'product': product, 'inventory': inventory}
+        return entry, dict(product, inventory=dict(inventory)), None
+
+    return _mutate(prepare)
 
 def get_products():
     """Get all products with inventory"""
-    data = load_data()
-    products = []
-    for p in data['products']:
-        product = p.copy()
-        product['inventory'] = data['inventory'].get(p['id'], {'quantity': 0})
-        products.append(product)
-    return products
+    store = _get_store()
+    return [
+        dict(p, inventory=dict(store.inventory.get(p['id'], {'quantity': 0})))
+        for p in store.products.values()
+    ]
 
 def delete_product(product_id):
     """Delete a product"""
-    data = load_data()
-    
-    # Delete product transactions
-    data['transactions'] = [t for t in data['transactions'] if t['product_id'] != product_id]
-    
-    # Delete product inventory
-    if product_id in data['inventory']:
-        del data['inventory'][product_id]
-    
-    # Delete product
-    data['products'] = [p for p in data['products'] if p['id'] != product_id]
-    
-    save_data(data)
-    return True, None
+    # Deletes the product with its inventory and transactions
+    return _mutate(lambda store: ({'op': 'delete_product', 'id': product_id}, True, None))
 
 def add_transaction(product_id, transaction_type, quantity, reason='', notes=''):
     """Add a new transaction"""
-    data = load_data()
-    
-    # Check if product exists
-    if not any(p['id'] == product_id for p in data['products']):
-        return None, 'Product not found'
-    
-    # Validate transaction type
-    if transaction_type not in ['ENTRY', 'EXIT']:
-        return None, 'Invalid transaction type'
-    
-    # Validate quantity
-    if quantity <= 0:
-        return None, 'Quantity must be greater than 0'
-    
-    # Check inventory for EXIT
-    current_qty = data['inventory'][product_id]['quantity']
-    if transaction_type == 'EXIT' and current_qty < quantity:
-        return None, f'Insufficient inventory. Available: {current_qty}'
-    
-    transaction = {
-        'id': str(uuid.uuid4()),
-        'product_id': product_id,
-        'type': transaction_type,
-        'quantity': quantity,
-        'reason': reason,
-        'notes': notes,
-        'created_at': datetime.utcnow().isoformat(),
-        'updated_at': datetime.utcnow().isoformat()
-    }
-    
-    # Update inventory
-    if transaction_type == 'ENTRY':
-        data['inventory'][product_id]['quantity'] += quantity
-    else:
-        data['inventory'][product_id]['quantity'] -= quantity
-    
-    data['inventory'][product_id]['last_updated'] = datetime.utcnow().isoformat()
-    data['transactions'].append(transaction)
-    
-    save_data(data)
-    return transaction, None
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        return None, 'Invalid quantity value'
+
+    def prepare(store):
+        # Check if product exists
+        if product_id not in store.products:
+            return None, None, 'Product not found'
+
+        # Validate transaction type
+        if transaction_type not in ['ENTRY', 'EXIT']:
+            return None, None, 'Invalid transaction type'
+
+        # Validate quantity
+        if quantity <= 0:
+            return None, None, 'Quantity must be greater than 0'
+
+        # Check inventory for EXIT against the latest committed stock
+        current_qty = store.inventory[product_id]['quantity']
+        if transaction_type == 'EXIT' and current_qty < quantity:
+            return None, None, f'Insufficient inventory. Available: {current_qty}'
+
+        transaction = {
+            'id': str(uuid.uuid4()),
+            'product_id': product_id,
+            'type': transaction_type,
+            'quantity': quantity,
+            'reason': reason,
+            'notes': notes,
+            'created_at': datetime.utcnow().isoformat(),
+            'updated_at': datetime.utcnow().isoformat()
+        }
+
+        # Journal the resulting stock level so replay does not depend on history
+        new_qty = current_qty + quantity if transaction_type == 'ENTRY' else current_qty - quantity
+
+        entry = {'op': 'add_transaction', 'transaction': transaction, 'quantity': new_qty}
+        return entry, dict(transaction), None
+
+    return _mutate(prepare)
 
 def get_transactions():
     """Get all transactions"""
-    data = load_data()
-    return sorted(data['transactions'], key=lambda x: x['created_at'], reverse=True)
+    store = _get_store()
+    return sorted((dict(t) for t in store.transactions), key=lambda x: x['created_at'], reverse=True)
 
 def get_inventory_stats():
     """Get inventory statistics"""
-    data = load_data()
-    
-    total_products = len(data['products'])
-    total_quantity = sum(inv['quantity'] for inv in data['inventory'].values())
-    total_price = sum(p['price'] * data['inventory'][p['id']]['quantity'] for p in data['products'])
-    
-    # Build categories with products
+    store = _get_store()
+
+    def quantity_of(product_id):
+        return store.inventory.get(product_id, {'quantity': 0})['quantity']
+
+    total_products = len(store.products)
+    total_quantity = sum(inv['quantity'] for inv in store.inventory.values())
+    total_price = sum(p['price'] * quantity_of(p['id']) for p in store.products.values())
+
+    # Build categories with products from the category -> products index
     categories_data = []
-    for cat in data['categories']:
-        cat_products = [p for p in data['products'] if p['category_id'] == cat['id']]
-        cat_total_qty = sum(data['inventory'][p['id']]['quantity'] for p in cat_products)
-        
+    for cat in store.categories.values():
+        cat_products = [store.products[pid] for pid in store.product_ids_by_category.get(cat['id'], {})]
+        cat_total_qty = sum(quantity_of(p['id']) for p in cat_products)
+
         categories_data.append({
             'id': cat['id'],
             'name': cat['name'],
@@ -244,12 +544,12 @@ def get_inventory_stats():
                     'id': p['id'],
                     'name': p['name'],
                     'price': p['price'],
-                    'quantity': data['inventory'][p['id']]['quantity']
+                    'quantity': quantity_of(p['id'])
                 }
                 for p in cat_products
             ]
         })
-    
+
     return {
         'total_products': total_products,
         'total_quantity': total_quantity,
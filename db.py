@@ -2,7 +2,8 @@
 Database models and configuration for Neon PostgreSQL
 """
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import date, datetime, timedelta
 import uuid
 import os
 
@@ -34,6 +35,11 @@ class Category(db.Model):
 class Product(db.Model):
     """Product model"""
     __tablename__ = 'products'
+    __table_args__ = (
+        # Listing order, and per-category lookups in the same order
+        db.Index('ix_products_created_at_id', 'created_at', 'id'),
+        db.Index('ix_products_category_created_at_id', 'category_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     name = db.Column(db.String(255), nullable=False)
@@ -61,13 +67,40 @@ class Product(db.Model):
             'inventory': self.inventory.to_dict() if self.inventory else {'quantity': 0}
         }
 
+# Reorder point given to products that do not set their own
+DEFAULT_REORDER_POINT = 10
+
+def _below_reorder_default(context):
+    params = context.get_current_parameters()
+    quantity = params.get('quantity') or 0
+    reorder_point = params.get('reorder_point')
+    return quantity < (DEFAULT_REORDER_POINT if reorder_point is None else reorder_point)
+
+def parse_reorder_point(value):
+    """Validate a reorder point from a request payload"""
+    try:
+        reorder_point = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid reorder point')
+    if reorder_point < 0:
+        raise ValueError('Reorder point cannot be negative')
+    return reorder_point
+
 class Inventory(db.Model):
     """Inventory model"""
     __tablename__ = 'inventory'
+    __table_args__ = (
+        # The below-reorder set: a partial index holding only flagged rows on PostgreSQL
+        db.Index('ix_inventory_below_reorder_product', 'below_reorder', 'product_id',
+                 postgresql_where=db.text('below_reorder')),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False, unique=True)
     quantity = db.Column(db.Integer, default=0)
+    reorder_point = db.Column(db.Integer, nullable=False, default=DEFAULT_REORDER_POINT)
+    # quantity < reorder_point, rewritten by every statement that changes either
+    below_reorder = db.Column(db.Boolean, nullable=False, default=_below_reorder_default)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def to_dict(self):
@@ -75,12 +108,19 @@ class Inventory(db.Model):
             'id': self.id,
             'product_id': self.product_id,
             'quantity': self.quantity,
+            'reorder_point': self.reorder_point,
             'last_updated': self.last_updated.isoformat() if self.last_updated else None
         }
 
 class Transaction(db.Model):
     """Transaction model (ENTRY/EXIT)"""
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Keyset pagination on (created_at, id), optionally narrowed by product or type
+        db.Index('ix_transactions_created_at_id', 'created_at', 'id'),
+        db.Index('ix_transactions_product_created_at_id', 'product_id', 'created_at', 'id'),
+        db.Index('ix_transactions_type_created_at_id', 'type', 'created_at', 'id'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
@@ -104,13 +144,689 @@ class Transaction(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
-def init_db(app):
-    """Initialize database safely"""
-    try:
-        with app.app_context():
-            db.create_all()
-            print("Database tables created successfully")
-            return True
-    except Exception as e:
-        print(f"Error initializing database: {e}")
+# Query builders shared by the endpoints, so the statements they run are the
+# ones tests/test_query_plans.py checks against the indexes above
+def product_listing_query(columns, as_of=None, with_inventory=False):
+    """Products in listing order (``created_at``), optionally as they stood at ``as_of``.
+
+    ``with_inventory`` adds ``quantity`` and ``last_updated`` from an outer
+    join on the product's stock row (ignored with ``as_of``, whose stock is
+    rebuilt from checkpoints instead).
+    """
+    query = db.select(*columns)
+    if as_of is not None:
+        query = query.where(Product.created_at <= as_of)
+    elif with_inventory:
+        query = (query.add_columns(db.func.coalesce(Inventory.quantity, 0).label('quantity'),
+                                   Inventory.last_updated.label('last_updated'))
+                 .outerjoin(Inventory, Inventory.product_id == Product.id))
+    return query.order_by(Product.created_at)
+
+def transaction_page_query(columns, conditions=(), limit=None, product_columns=None):
+    """Transactions matching ``conditions``, newest first in ``(created_at, id)`` keyset order.
+
+    ``product_columns`` are added from an outer join on each transaction's
+    product and its stock row.
+    """
+    query = db.select(*columns)
+    if product_columns:
+        query = (query.add_columns(*product_columns)
+                 .outerjoin(Product, Product.id == Transaction.product_id)
+                 .outerjoin(Inventory, Inventory.product_id == Transaction.product_id))
+    query = query.where(*conditions).order_by(Transaction.created_at.desc(), Transaction.id.desc())
+    if limit:
+        query = query.limit(limit)
+    return query
+
+EXPORT_COLUMNS = ['id', 'created_at', 'product_id', 'sku', 'product_name', 'type', 'quantity', 'reason', 'notes']
+
+def transaction_export_query(conditions=()):
+    """Ledger rows matching ``conditions``, oldest first, with each product's SKU and name (``EXPORT_COLUMNS``)"""
+    return (db.select(Transaction.id, Transaction.created_at, Transaction.product_id, Product.sku,
+                      Product.name, Transaction.type, Transaction.quantity, Transaction.reason,
+                      Transaction.notes)
+            .join(Product, Product.id == Transaction.product_id)
+            .where(*conditions)
+            .order_by(Transaction.created_at, Transaction.id))
+
+def product_stock_query():
+    """``(id, name, price, category_id, quantity)`` of every product in listing order"""
+    return (db.select(Product.id, Product.name, Product.price, Product.category_id,
+                      db.func.coalesce(Inventory.quantity, 0))
+            .outerjoin(Inventory, Inventory.product_id == Product.id)
+            .order_by(Product.created_at))
+
+def category_products_query(category_id):
+    """Id of one product in the category, to tell whether it has any"""
+    return db.select(Product.id).where(Product.category_id == category_id).limit(1)
+
+def product_by_sku_query(sku):
+    """Id of the product with ``sku``, if any"""
+    return db.select(Product.id).where(Product.sku == sku)
+
+def stock_query(product_id):
+    """Quantity of a product's stock row"""
+    return db.select(Inventory.quantity).where(Inventory.product_id == product_id)
+
+# Helpers below run in the caller's session: ``db.session`` by default, or the
+# session passed in (the async app hands over its AsyncSession's sync facade)
+def create_stock_rows(product_ids, session=None):
+    """Give products without a stock row an empty one, in the caller's session.
+
+    Rows another writer creates first are left alone, so concurrent
+    postings for the same product both go on to their conditional UPDATE.
+    """
+    session = session or db.session
+    table = Inventory.__table__
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        stmt = (postgresql if dialect == 'postgresql' else sqlite).insert(table)
+        session.execute(stmt.on_conflict_do_nothing(index_elements=[table.c.product_id]),
+                        [{'product_id': product_id, 'quantity': 0} for product_id in product_ids])
+        return
+    existing = set(session.execute(db.select(table.c.product_id).where(table.c.product_id.in_(product_ids))).scalars())
+    missing = [{'product_id': product_id, 'quantity': 0} for product_id in product_ids if product_id not in existing]
+    if missing:
+        session.execute(table.insert(), missing)
+
+def adjust_stock(product_id, delta, session=None):
+    """Atomically add ``delta`` to a product's stock in the current transaction.
+
+    Issues a single conditional ``UPDATE inventory SET quantity = quantity + :delta``
+    guarded by ``quantity >= -delta`` for removals, so concurrent postings never
+    lose an update or drive stock negative. An addition to a product without
+    a stock row creates the row first; returns False only when a removal
+    finds too little stock (or none at all).
+    """
+    session = session or db.session
+    table = Inventory.__table__
+    stmt = table.update().where(table.c.product_id == product_id)
+    if delta < 0:
+        stmt = stmt.where(table.c.quantity >= -delta)
+    stmt = stmt.values(quantity=table.c.quantity + delta,
+                       below_reorder=table.c.quantity + delta < table.c.reorder_point,
+                       last_updated=datetime.utcnow())
+    if session.execute(stmt).rowcount == 1:
+        return True
+    if delta <= 0:
         return False
+    create_stock_rows([product_id], session=session)
+    return session.execute(stmt).rowcount == 1
+
+def adjust_stock_many(deltas, session=None):
+    """Apply net stock deltas for many products in one conditional UPDATE.
+
+    ``deltas`` maps product id to the quantity to add. Products without a
+    stock row must be given one first (``create_stock_rows``). Every row must
+    stay non-negative; returns False if any product matched no row, in which
+    case the caller must roll back.
+    """
+    session = session or db.session
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return True
+    table = Inventory.__table__
+    delta_expr = db.case(deltas, value=table.c.product_id, else_=0)
+    result = session.execute(
+        table.update()
+        .where(table.c.product_id.in_(list(deltas)))
+        .where(table.c.quantity + delta_expr >= 0)
+        .values(quantity=table.c.quantity + delta_expr,
+                below_reorder=table.c.quantity + delta_expr < table.c.reorder_point,
+                last_updated=datetime.utcnow())
+    )
+    return result.rowcount == len(deltas)
+
+def set_reorder_point(product_id, reorder_point, session=None):
+    """Change a product's reorder point and re-evaluate its below-reorder flag"""
+    session = session or db.session
+    table = Inventory.__table__
+    result = session.execute(
+        table.update()
+        .where(table.c.product_id == product_id)
+        .values(reorder_point=reorder_point, below_reorder=table.c.quantity < reorder_point)
+    )
+    return result.rowcount == 1
+
+def low_stock_query(after=None, limit=None):
+    """Products below their reorder point, read from the below-reorder index.
+
+    Ordered by product id for keyset pagination; ``after`` is the last
+    product id of the previous page.
+    """
+    query = (db.select(Product.id, Product.name, Product.sku, Product.price,
+                       Inventory.quantity, Inventory.reorder_point, Category.name.label('category'))
+             .join(Product, Product.id == Inventory.product_id)
+             .outerjoin(Category, Category.id == Product.category_id)
+             .where(Inventory.below_reorder)
+             .order_by(Inventory.product_id))
+    if after:
+        query = query.where(Inventory.product_id > after)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+def get_stock(product_id, session=None, for_update=False):
+    """Current stock of a product straight from the database.
+
+    ``for_update`` locks the stock row until the caller commits, so no
+    posting can change the quantity a rollup delta is computed from.
+    """
+    session = session or db.session
+    query = stock_query(product_id)
+    if for_update:
+        query = query.with_for_update()
+    quantity = session.execute(query).scalar()
+    return quantity or 0
+
+# Key of the rollup row holding catalog-wide totals
+ROLLUP_GLOBAL_KEY = '__all__'
+
+class CategoryStockRollup(db.Model):
+    """Per-category stock totals (plus one global row), kept in step with every write"""
+    __tablename__ = 'category_stock_rollup'
+    
+    category_id = db.Column(db.String(36), primary_key=True)  # category id or ROLLUP_GLOBAL_KEY
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+    total_quantity = db.Column(db.Integer, nullable=False, default=0)
+    total_value = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'product_count': self.product_count,
+            'total_quantity': self.total_quantity,
+            'total_value': round(self.total_value, 2)
+        }
+
+def rollup_stats_query():
+    """Every rollup row (the global one included) with its category's name and description"""
+    return (db.select(CategoryStockRollup, Category.name, Category.description)
+            .outerjoin(Category, Category.id == CategoryStockRollup.category_id))
+
+def apply_rollup_delta(category_id, products=0, quantity=0, value=0.0, session=None):
+    """Add deltas to a category's rollup row and the global row.
+
+    Runs as relative UPDATEs inside the caller's session so the rollup commits
+    (or rolls back) together with the write that caused it. The category row is
+    always locked before the global row to keep lock order consistent.
+    """
+    session = session or db.session
+    table = CategoryStockRollup.__table__
+    for key in (category_id, ROLLUP_GLOBAL_KEY):
+        session.execute(
+            table.update()
+            .where(table.c.category_id == key)
+            .values(product_count=table.c.product_count + products,
+                    total_quantity=table.c.total_quantity + quantity,
+                    total_value=table.c.total_value + value,
+                    updated_at=datetime.utcnow())
+        )
+
+def rebuild_category_rollup():
+    """Recompute the whole rollup table from products and inventory (repair path)"""
+    table = CategoryStockRollup.__table__
+    quantity = db.func.coalesce(Inventory.quantity, 0)
+    rows = (db.session.query(Category.id,
+                             db.func.count(Product.id),
+                             db.func.coalesce(db.func.sum(quantity), 0),
+                             db.func.coalesce(db.func.sum(Product.price * quantity), 0.0))
+            .outerjoin(Product, Product.category_id == Category.id)
+            .outerjoin(Inventory, Inventory.product_id == Product.id)
+            .group_by(Category.id)
+            .all())
+    now = datetime.utcnow()
+    records = [
+        {'category_id': cat_id, 'product_count': count, 'total_quantity': int(qty),
+         'total_value': float(value), 'updated_at': now}
+        for cat_id, count, qty, value in rows
+    ]
+    records.append({
+        'category_id': ROLLUP_GLOBAL_KEY,
+        'product_count': sum(r['product_count'] for r in records),
+        'total_quantity': sum(r['total_quantity'] for r in records),
+        'total_value': sum(r['total_value'] for r in records),
+        'updated_at': now
+    })
+    db.session.execute(table.delete())
+    db.session.execute(table.insert(), records)
+    bump_data_version()
+    db.session.commit()
+    return len(records) - 1
+
+def inventory_stats(include_products, session=None):
+    """Inventory statistics per category from the stock rollup, optionally with each product's stock"""
+    session = session or db.session
+    # Categories with their rollup rows, plus the global row, in one indexed read
+    rows = session.execute(rollup_stats_query()).all()
+    totals = CategoryStockRollup(product_count=0, total_quantity=0, total_value=0.0)
+    category_rows = []
+    for rollup, name, description in sorted(rows, key=lambda row: row[1] or ''):
+        if rollup.category_id == ROLLUP_GLOBAL_KEY:
+            totals = rollup
+        else:
+            category_rows.append((rollup, name, description))
+    
+    # One flat query for the optional product detail
+    products_by_category = {}
+    if include_products:
+        for product_id, name, price, category_id, qty in session.execute(product_stock_query()):
+            products_by_category.setdefault(category_id, []).append({
+                'id': product_id,
+                'name': name,
+                'price': price,
+                'quantity': qty
+            })
+    
+    categories_data = []
+    for rollup, name, description in category_rows:
+        category_data = {
+            'id': rollup.category_id,
+            'name': name,
+            'description': description,
+            'product_count': rollup.product_count,
+            'total_quantity': rollup.total_quantity,
+            'total_value': round(rollup.total_value, 2)
+        }
+        if include_products:
+            category_data['products'] = products_by_category.get(rollup.category_id, [])
+        categories_data.append(category_data)
+    
+    return {
+        'total_products': totals.product_count,
+        'total_quantity': totals.total_quantity,
+        'total_price': round(totals.total_value, 2),
+        'categories': categories_data
+    }
+
+def inventory_summary(session=None):
+    """Headline totals from the global rollup row"""
+    session = session or db.session
+    totals = session.get(CategoryStockRollup, ROLLUP_GLOBAL_KEY)
+    if totals is None:
+        totals = CategoryStockRollup(product_count=0, total_quantity=0, total_value=0.0)
+    categories_count = session.scalar(
+        db.select(db.func.count()).select_from(CategoryStockRollup)
+        .where(CategoryStockRollup.category_id != ROLLUP_GLOBAL_KEY))
+    return {
+        'total_products': totals.product_count,
+        'total_items_in_stock': totals.total_quantity,
+        'total_inventory_value': round(totals.total_value, 2),
+        'categories_count': categories_count
+    }
+
+# Counters kept per (day, product) in the movement rollup
+MOVEMENT_COUNTERS = ['entry_quantity', 'entry_count', 'exit_quantity', 'exit_count']
+
+class DailyMovement(db.Model):
+    """Per-product ENTRY/EXIT totals for one UTC day, maintained with every posted transaction.
+
+    Rows carry the product's current category, like the ``as_of`` views:
+    moving a product re-tags its history (``retag_daily_movements``), so the
+    incremental path and ``rebuild_daily_movements`` always agree.
+    """
+    __tablename__ = 'daily_movements'
+    __table_args__ = (
+        db.Index('ix_daily_movements_product_day', 'product_id', 'day'),
+        db.Index('ix_daily_movements_category_day', 'category_id', 'day'),
+    )
+    
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.String(36), primary_key=True)
+    category_id = db.Column(db.String(36), nullable=False)  # the product's current category
+    entry_quantity = db.Column(db.Integer, nullable=False, default=0)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+    exit_quantity = db.Column(db.Integer, nullable=False, default=0)
+    exit_count = db.Column(db.Integer, nullable=False, default=0)
+
+def record_movements(movements, session=None):
+    """Add ``(created_at, product_id, category_id, type, quantity)`` movements to the daily rollup.
+
+    Movements are summed per (day, product) first and written as one upsert
+    in the caller's session, so the rollup commits with the transactions.
+    """
+    session = session or db.session
+    totals = {}
+    for created_at, product_id, category_id, transaction_type, quantity in movements:
+        key = (created_at.date(), product_id)
+        row = totals.get(key)
+        if row is None:
+            row = totals[key] = dict({counter: 0 for counter in MOVEMENT_COUNTERS},
+                                     day=key[0], product_id=product_id, category_id=category_id)
+        prefix = 'entry' if transaction_type == 'ENTRY' else 'exit'
+        row[f'{prefix}_quantity'] += quantity
+        row[f'{prefix}_count'] += 1
+    # Sorted so concurrent writers lock rows in the same order
+    rows = [totals[key] for key in sorted(totals)]
+    if not rows:
+        return
+    
+    table = DailyMovement.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        stmt = (postgresql if dialect == 'postgresql' else sqlite).insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.day, table.c.product_id],
+            set_=dict({counter: table.c[counter] + stmt.excluded[counter] for counter in MOVEMENT_COUNTERS},
+                      category_id=stmt.excluded.category_id)
+        )
+        session.execute(stmt, rows)
+        return
+    for row in rows:
+        result = session.execute(
+            table.update()
+            .where(table.c.day == row['day'], table.c.product_id == row['product_id'])
+            .values(dict({counter: table.c[counter] + row[counter] for counter in MOVEMENT_COUNTERS},
+                         category_id=row['category_id']))
+        )
+        if result.rowcount == 0:
+            session.execute(table.insert(), row)
+
+def retag_daily_movements(product_id, category_id, session=None):
+    """Move a product's movement history to ``category_id``, in the caller's session"""
+    session = session or db.session
+    session.execute(db.update(DailyMovement)
+                    .where(DailyMovement.product_id == product_id)
+                    .values(category_id=category_id))
+
+def rebuild_daily_movements():
+    """Recompute the movement rollup from the transaction ledger (backfill and repair path).
+
+    History is tagged with each product's current category, the same rule
+    the incremental path keeps through ``retag_daily_movements``.
+    """
+    day = db.func.date(Transaction.created_at)
+    rows = (db.session.query(day, Transaction.product_id, Product.category_id, Transaction.type,
+                             db.func.sum(Transaction.quantity), db.func.count(Transaction.id))
+            .join(Product, Product.id == Transaction.product_id)
+            .group_by(day, Transaction.product_id, Product.category_id, Transaction.type)
+            .all())
+    totals = {}
+    for moved_on, product_id, category_id, transaction_type, quantity, count in rows:
+        # SQLite returns the date as text
+        moved_on = date.fromisoformat(moved_on) if isinstance(moved_on, str) else moved_on
+        row = totals.get((moved_on, product_id))
+        if row is None:
+            row = totals[(moved_on, product_id)] = dict({counter: 0 for counter in MOVEMENT_COUNTERS},
+                                                       day=moved_on, product_id=product_id,
+                                                       category_id=category_id)
+        prefix = 'entry' if transaction_type == 'ENTRY' else 'exit'
+        row[f'{prefix}_quantity'] = int(quantity)
+        row[f'{prefix}_count'] = count
+    table = DailyMovement.__table__
+    db.session.execute(table.delete())
+    if totals:
+        db.session.execute(table.insert(), list(totals.values()))
+    bump_data_version()
+    db.session.commit()
+    return len(totals)
+
+def daily_movement_totals(start=None, end=None, category_id=None, product_id=None, by=None, session=None):
+    """Movement counters summed per day (and per ``by``: 'category' or 'product') from the rollup.
+
+    ``start`` is inclusive and ``end`` exclusive, both dates.
+    """
+    session = session or db.session
+    columns = [DailyMovement.day]
+    if by:
+        columns.append(DailyMovement.category_id if by == 'category' else DailyMovement.product_id)
+    query = db.select(*columns, *[db.func.sum(getattr(DailyMovement, c)).label(c) for c in MOVEMENT_COUNTERS])
+    if start:
+        query = query.where(DailyMovement.day >= start)
+    if end:
+        query = query.where(DailyMovement.day < end)
+    if category_id:
+        query = query.where(DailyMovement.category_id == category_id)
+    if product_id:
+        query = query.where(DailyMovement.product_id == product_id)
+    return session.execute(query.group_by(*columns).order_by(*columns)).all()
+
+MOVEMENT_BUCKETS = ['day', 'week', 'month']
+
+def bucket_start(day, bucket):
+    """First day of the bucket containing ``day`` (weeks start on Monday)"""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+# Checkpoints stop this far behind the clock so transactions still in flight
+# (created_at already set, not yet committed) land after the checkpoint
+CHECKPOINT_LAG = timedelta(seconds=int(os.environ.get('CHECKPOINT_LAG_SECONDS', 300)))
+
+class StockCheckpoint(db.Model):
+    """Stock of every product with non-zero stock at one instant, written by periodic checkpoint runs"""
+    __tablename__ = 'stock_checkpoints'
+    
+    taken_at = db.Column(db.DateTime, primary_key=True)
+    product_id = db.Column(db.String(36), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False)
+
+def signed_quantity():
+    """ENTRY quantities count up, EXIT quantities down"""
+    return db.case((Transaction.type == 'EXIT', -Transaction.quantity), else_=Transaction.quantity)
+
+def latest_checkpoint_query(as_of=None):
+    """Time of the newest checkpoint run at or before ``as_of`` (or at all)"""
+    query = db.select(db.func.max(StockCheckpoint.taken_at))
+    if as_of is not None:
+        query = query.where(StockCheckpoint.taken_at <= as_of)
+    return query
+
+def latest_checkpoint_time(as_of=None, session=None):
+    """Time of the newest checkpoint run at or before ``as_of`` (or at all), None if there is none"""
+    session = session or db.session
+    return session.execute(latest_checkpoint_query(as_of)).scalar()
+
+def checkpoint_stock_query(checkpoint_at, product_ids=None):
+    """``(product_id, quantity)`` rows of the checkpoint run taken at ``checkpoint_at``"""
+    query = (db.select(StockCheckpoint.product_id, StockCheckpoint.quantity)
+             .where(StockCheckpoint.taken_at == checkpoint_at))
+    if product_ids is not None:
+        query = query.where(StockCheckpoint.product_id.in_(product_ids))
+    return query
+
+def ledger_delta_query(as_of, since=None, product_ids=None):
+    """Net stock change per product from the ledger, after ``since`` (if given) up to ``as_of``"""
+    query = (db.select(Transaction.product_id, db.func.sum(signed_quantity()))
+             .where(Transaction.created_at <= as_of)
+             .group_by(Transaction.product_id))
+    if since is not None:
+        query = query.where(Transaction.created_at > since)
+    if product_ids is not None:
+        query = query.where(Transaction.product_id.in_(product_ids))
+    return query
+
+def categories_as_of_query(as_of):
+    """``(id, name, description)`` of the categories that existed at ``as_of``, by name"""
+    return (db.select(Category.id, Category.name, Category.description)
+            .where(Category.created_at <= as_of)
+            .order_by(Category.name))
+
+def stock_as_of(as_of, product_ids=None, session=None):
+    """``{product_id: quantity}`` at ``as_of``, for products that had stock.
+
+    Starts from the newest checkpoint run at or before ``as_of`` and adds the
+    transactions between it and ``as_of``, so the ledger read is bounded by
+    the checkpoint interval. Before the first checkpoint the whole ledger up
+    to ``as_of`` is summed.
+    """
+    session = session or db.session
+    checkpoint_at = latest_checkpoint_time(as_of, session=session)
+    stock = {}
+    if checkpoint_at is not None:
+        stock.update(session.execute(checkpoint_stock_query(checkpoint_at, product_ids)).all())
+    for product_id, delta in session.execute(ledger_delta_query(as_of, checkpoint_at, product_ids)).all():
+        stock[product_id] = stock.get(product_id, 0) + int(delta)
+    return stock
+
+def inventory_stats_as_of(as_of, include_products, session=None):
+    """Inventory statistics at ``as_of``, rebuilt from the nearest stock checkpoint"""
+    session = session or db.session
+    stock = stock_as_of(as_of, session=session)
+    product_rows = session.execute(
+        product_listing_query([Product.id, Product.name, Product.price, Product.category_id], as_of=as_of)
+    ).all()
+    products_by_category = {}
+    for product_id, name, price, category_id in product_rows:
+        products_by_category.setdefault(category_id, []).append({
+            'id': product_id,
+            'name': name,
+            'price': price,
+            'quantity': stock.get(product_id, 0)
+        })
+    
+    categories_data = []
+    for cat_id, name, description in session.execute(categories_as_of_query(as_of)):
+        products = products_by_category.get(cat_id, [])
+        category_data = {
+            'id': cat_id,
+            'name': name,
+            'description': description,
+            'product_count': len(products),
+            'total_quantity': sum(p['quantity'] for p in products),
+            'total_value': round(sum(p['quantity'] * p['price'] for p in products), 2)
+        }
+        if include_products:
+            category_data['products'] = products
+        categories_data.append(category_data)
+    
+    return {
+        'as_of': as_of.isoformat(),
+        'total_products': len(product_rows),
+        'total_quantity': sum(c['total_quantity'] for c in categories_data),
+        'total_price': round(sum(c['total_value'] for c in categories_data), 2),
+        'categories': categories_data
+    }
+
+def take_stock_checkpoint(taken_at=None):
+    """Write a checkpoint run at ``taken_at`` (default: now minus ``CHECKPOINT_LAG``).
+
+    Quantities are derived from the previous run plus the ledger, not read
+    from ``inventory``, so a checkpoint always agrees with the transactions
+    it summarizes. Returns the number of rows written.
+    """
+    taken_at = taken_at or datetime.utcnow() - CHECKPOINT_LAG
+    # Runs only move forward
+    latest = latest_checkpoint_time()
+    if latest is not None and latest >= taken_at:
+        return 0
+    existing = set(db.session.execute(db.select(Product.id)).scalars())
+    rows = [
+        {'taken_at': taken_at, 'product_id': product_id, 'quantity': quantity}
+        for product_id, quantity in stock_as_of(taken_at).items()
+        if quantity and product_id in existing
+    ]
+    if rows:
+        db.session.execute(StockCheckpoint.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+class DataVersion(db.Model):
+    """Single-row counter bumped by every write, used to version cached responses"""
+    __tablename__ = 'data_version'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=1)
+
+def bump_data_version(session=None):
+    """Increment the data version inside the caller's transaction; call it right before commit.
+
+    Every write locks the single ``data_version`` row until it commits, so
+    writers serialize on it for that long; like the ``__all__`` rollup row
+    and the change feed's ``change_sequence`` row, it caps write throughput
+    at one commit at a time on PostgreSQL. Pending ORM changes are flushed
+    first so the lock is only held for the commit itself.
+    """
+    session = session or db.session
+    session.flush()
+    table = DataVersion.__table__
+    session.execute(table.update().where(table.c.id == 1).values(version=table.c.version + 1))
+    session.info['data_version_bumped'] = True
+
+def get_data_version(session=None):
+    """Current data version straight from the database"""
+    session = session or db.session
+    return session.execute(db.select(DataVersion.version).where(DataVersion.id == 1)).scalar() or 0
+
+# Tables whose row changes are recorded in the change feed
+CHANGE_TABLES = ['categories', 'products', 'inventory', 'transactions']
+
+class ChangeSequence(db.Model):
+    """Single-row counter handing out change feed sequence numbers"""
+    __tablename__ = 'change_sequence'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    seq = db.Column(db.BigInteger, nullable=False, default=0)
+    # Tombstones at or below this sequence number have been pruned
+    pruned_through = db.Column(db.BigInteger, nullable=False, default=0)
+
+class ChangeLog(db.Model):
+    """Latest change of every row of the tracked tables, written by database triggers.
+
+    Each insert, update or delete takes the next number from
+    ``change_sequence``; the counter row stays locked until the writing
+    transaction commits, so sequence numbers become visible in order and a
+    reader never skips a change committed after it read a later one.
+    """
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        db.Index('ix_change_log_seq', 'seq', unique=True),
+        # Feeds narrowed to some tables read each table's changes in order
+        db.Index('ix_change_log_table_seq', 'table_name', 'seq'),
+    )
+    
+    table_name = db.Column(db.String(32), primary_key=True)
+    row_id = db.Column(db.String(36), primary_key=True)
+    seq = db.Column(db.BigInteger, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+def change_feed_query(since, table_name=None):
+    """Change log rows after ``since`` in sequence order, optionally for one table"""
+    stmt = db.select(ChangeLog).where(ChangeLog.seq > since)
+    if table_name is not None:
+        stmt = stmt.where(ChangeLog.table_name == table_name)
+    return stmt.order_by(ChangeLog.seq)
+
+def changes_since(since, limit, tables=None, session=None):
+    """Return ``(changes, has_more)`` after ``since``, optionally only for the ``tables`` listed.
+
+    A narrowed feed reads each table through its own index range and merges
+    the results, so skipping a large table (the ledger) costs nothing.
+    """
+    session = session or db.session
+    if tables is None:
+        rows = session.execute(change_feed_query(since).limit(limit + 1)).scalars().all()
+    else:
+        rows = sorted(
+            (row for table_name in tables
+             for row in session.execute(change_feed_query(since, table_name).limit(limit + 1)).scalars()),
+            key=lambda row: row.seq
+        )
+    return rows[:limit], len(rows) > limit
+
+def change_feed_state(session=None):
+    """``(latest sequence number, pruned_through)`` of the change feed"""
+    session = session or db.session
+    row = session.get(ChangeSequence, 1)
+    return (row.seq, row.pruned_through) if row else (0, 0)
+
+def prune_tombstones(before):
+    """Drop delete markers older than ``before``; clients behind them must resync in full"""
+    table = ChangeLog.__table__
+    condition = db.and_(table.c.deleted, table.c.changed_at < before)
+    pruned_through = db.session.execute(db.select(db.func.max(table.c.seq)).where(condition)).scalar()
+    if pruned_through is None:
+        return 0
+    result = db.session.execute(table.delete().where(condition))
+    sequence = ChangeSequence.__table__
+    db.session.execute(sequence.update().where(sequence.c.id == 1)
+                       .values(pruned_through=db.case((sequence.c.pruned_through < pruned_through, pruned_through),
+                                                      else_=sequence.c.pruned_through)))
+    db.session.commit()
+    return result.rowcount
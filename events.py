@@ -0,0 +1,201 @@
+"""
+Fan-out of committed stock and catalog changes to Server-Sent Events streams
+"""
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from db import db
+import asyncio
+import json
+import os
+import queue
+import select
+import threading
+import time
+
+# PostgreSQL channel carrying events between worker processes
+NOTIFY_CHANNEL = 'stock_events'
+# Events a slow subscriber may fall behind before it is told to resync
+SUBSCRIBER_QUEUE_SIZE = 1000
+# Seconds between keepalive comments on an idle stream
+KEEPALIVE_SECONDS = 15
+# Milliseconds an EventSource waits before reconnecting a dropped stream
+STREAM_RETRY_MS = 3000
+# Where dashboards open the stream; point it at the `stream` process when it
+# is served apart from the threaded web workers (see Procfile)
+STREAM_URL = os.environ.get('STREAM_URL', '/api/stream/stock')
+
+
+class StockEventHub:
+    """Hands every committed change to all stream subscribers of this process.
+
+    Each event is serialized once and put on one bounded queue per
+    subscriber, so a change costs the same however many dashboards are
+    connected. A subscriber that falls ``SUBSCRIBER_QUEUE_SIZE`` events behind
+    has its backlog replaced by a single ``resync`` event.
+
+    On PostgreSQL events travel through ``NOTIFY`` so a write in one worker
+    reaches the streams held by every other worker; a listener thread is
+    started in a process the first time a stream subscribes there. It needs
+    a direct server connection: behind PgBouncer (``DB_PGBOUNCER``) that is
+    ``DATABASE_LISTEN_URL``. Without one, and on other backends, there is no
+    cross-process channel: events only reach streams held by the process
+    that made the write, so there the app must run as a single process
+    serving both writes and streams (the development server, or one worker)
+    and the separate `stream` process is not usable.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # queue -> event loop feeding it (None for thread queues)
+        self._sequence = 0
+        self._listener = None
+        self._listen_url = None
+
+    def configure(self, config):
+        """Relay events between processes through ``config.listen_url()``, if there is one"""
+        url = config.listen_url()
+        if url is None and config.DB_PGBOUNCER and config.SQLALCHEMY_DATABASE_URI.startswith('postgres'):
+            print('Warning: DB_PGBOUNCER is set without DATABASE_LISTEN_URL; '
+                  'stock events only reach streams in the process that made the change')
+        self._listen_url = make_url(url).set(drivername='postgresql') if url else None
+
+    @property
+    def relays(self):
+        """Whether events are sent through PostgreSQL to every process"""
+        return self._listen_url is not None
+
+    def subscribe(self, limit=None):
+        """Subscribe from a thread; returns None when ``limit`` subscribers are already connected"""
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            self._subscribers[subscriber] = None
+        return subscriber
+
+    def subscribe_async(self):
+        """Subscribe from a coroutine: events arrive on an ``asyncio.Queue`` via the running loop"""
+        subscriber = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[subscriber] = asyncio.get_running_loop()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.pop(subscriber, None)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event_type, data):
+        """Send one event to every current subscriber"""
+        with self._lock:
+            if not self._subscribers:
+                return
+            self._sequence += 1
+            message = format_event(self._sequence, event_type, data)
+            resync = format_event(self._sequence, 'resync', {})
+            for subscriber, loop in self._subscribers.items():
+                if loop is None:
+                    _offer(subscriber, message, resync)
+                    continue
+                try:
+                    loop.call_soon_threadsafe(_offer, subscriber, message, resync)
+                except RuntimeError:
+                    pass  # loop closed; its stream is gone
+
+    def listen(self):
+        """Relay PostgreSQL notifications to this process's subscribers (started once per process)"""
+        if not self.relays:
+            return
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen, daemon=True, name='stock-event-listener')
+            self._listener.start()
+
+    def _listen(self):
+        # A dedicated connection outside any pool; LISTEN needs it for as long as the process lives
+        engine = create_engine(self._listen_url, poolclass=NullPool)
+        cargs, cparams = engine.dialect.create_connect_args(engine.url)
+        while True:
+            connection = None
+            try:
+                connection = engine.dialect.dbapi.connect(*cargs, **cparams)
+                connection.autocommit = True
+                connection.cursor().execute(f'LISTEN {NOTIFY_CHANNEL}')
+                while True:
+                    if select.select([connection], [], [], KEEPALIVE_SECONDS) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        event_type, data = json.loads(notification.payload)
+                        self.publish(event_type, data)
+            except Exception as e:
+                print(f"Error: stock event listener: {e}")
+                # Events may have been missed while disconnected
+                self.publish('resync', {})
+                time.sleep(1)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+
+def _offer(subscriber, message, resync):
+    """Queue a message, or replace the backlog of a subscriber that fell behind with ``resync``"""
+    try:
+        subscriber.put_nowait(message)
+    except (queue.Full, asyncio.QueueFull):
+        try:
+            while True:
+                subscriber.get_nowait()
+        except (queue.Empty, asyncio.QueueEmpty):
+            pass
+        subscriber.put_nowait(resync)
+
+
+def format_event(event_id, event_type, data):
+    """One Server-Sent Events frame"""
+    return f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+stock_events = StockEventHub()
+
+
+def queue_event(event_type, data, session=None):
+    """Publish an event once the session (default ``db.session``) commits; dropped on rollback"""
+    (session or db.session).info.setdefault('stream_events', []).append((event_type, data))
+
+
+@event.listens_for(Session, 'before_commit')
+def _notify_before_commit(session):
+    # NOTIFY is transactional: PostgreSQL delivers it only if this commit succeeds
+    events = session.info.get('stream_events')
+    if events and stock_events.relays and session.get_bind().dialect.name == 'postgresql':
+        for event_type, data in events:
+            session.execute(text('SELECT pg_notify(:channel, :payload)'),
+                            {'channel': NOTIFY_CHANNEL, 'payload': json.dumps([event_type, data])})
+        session.info['stream_events_notified'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_after_commit(session):
+    events = session.info.pop('stream_events', None)
+    if session.info.pop('stream_events_notified', False):
+        return  # every process, this one included, receives them through its listener
+    for event_type, data in events or ():
+        stock_events.publish(event_type, data)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_events(session, previous_transaction):
+    session.info.pop('stream_events', None)
+    session.info.pop('stream_events_notified', None)
@@ -0,0 +1,220 @@
+"""
+Streaming bulk import of products from CSV or NDJSON
+"""
+from db import db, Category, Product, Inventory, CategoryStockRollup, apply_rollup_delta, bump_data_version
+from events import queue_event
+from datetime import datetime
+import csv
+import io
+import json
+import uuid
+
+# Rows validated and written per database round trip
+CHUNK_SIZE = 500
+# Per-row errors kept in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = ['csv', 'ndjson']
+
+
+def iter_records(stream, fmt):
+    """Yield ``(line_number, record)`` pairs from a binary or text stream"""
+    if isinstance(stream, io.TextIOBase):
+        text = stream
+    else:
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(text, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+
+def detect_format(filename=None, content_type=None):
+    """Guess the import format from a file name or content type"""
+    name = (filename or '').lower()
+    content_type = (content_type or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'ndjson'
+    return 'csv'
+
+
+class ProductImporter:
+    """Upserts products on ``sku`` chunk by chunk, keeping memory flat"""
+
+    def __init__(self, create_categories=False, chunk_size=CHUNK_SIZE, session=None):
+        self.session = session or db.session
+        self.create_categories = create_categories
+        self.chunk_size = chunk_size
+        self.report = {'processed': 0, 'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+        # Category name -> id, loaded once and extended as categories are created
+        self._categories = dict(self.session.query(Category.name, Category.id).all())
+        self._category_ids = set(self._categories.values())
+
+    def run(self, records):
+        """Import every ``(line_number, record)`` pair and return the report"""
+        chunk = []
+        for line_number, record in records:
+            chunk.append((line_number, record))
+            if len(chunk) >= self.chunk_size:
+                self._import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._import_chunk(chunk)
+        return self.report
+
+    def _error(self, line_number, message):
+        self.report['failed'] += 1
+        if len(self.report['errors']) < MAX_REPORTED_ERRORS:
+            self.report['errors'].append({'line': line_number, 'error': message})
+
+    def _resolve_category(self, record):
+        if record.get('category_id'):
+            return record['category_id'] if record['category_id'] in self._category_ids else None
+        name = (record.get('category') or '').strip()
+        if not name:
+            return None
+        if name not in self._categories and self.create_categories:
+            category = Category(id=str(uuid.uuid4()), name=name, description='')
+            self.session.add(category)
+            self.session.add(CategoryStockRollup(category_id=category.id))
+            self.session.flush()
+            self._categories[name] = category.id
+            self._category_ids.add(category.id)
+        return self._categories.get(name)
+
+    def _validate(self, chunk, rejected):
+        """Return ``{sku: (line_number, row)}`` for the valid records of a chunk.
+
+        Lines reported as errors are added to ``rejected``.
+        """
+        rows = {}
+
+        def reject(line_number, message):
+            rejected.add(line_number)
+            self._error(line_number, message)
+
+        for line_number, record in chunk:
+            if not isinstance(record, dict):
+                reject(line_number, 'Invalid record')
+                continue
+            name = (record.get('name') or '').strip()
+            sku = (str(record.get('sku') or '')).strip()
+            if not name or not sku or record.get('price') in (None, ''):
+                reject(line_number, 'Missing required fields')
+                continue
+            try:
+                price = float(record['price'])
+            except (TypeError, ValueError):
+                reject(line_number, 'Invalid price value')
+                continue
+            category_id = self._resolve_category(record)
+            if not category_id:
+                reject(line_number, 'Category not found')
+                continue
+            # The last occurrence of a SKU within a chunk wins; earlier ones are reported
+            if sku in rows:
+                reject(rows[sku][0], f'Duplicate SKU {sku}, superseded by line {line_number}')
+            rows[sku] = (line_number, {
+                'name': name,
+                'sku': sku,
+                'price': price,
+                'category_id': category_id,
+                'description': record.get('description') or ''
+            })
+        return rows
+
+    def _import_chunk(self, chunk):
+        self.report['processed'] += len(chunk)
+        rejected = set()
+        try:
+            rows = self._validate(chunk, rejected)
+            created = updated = 0
+            if rows:
+                created, updated = self._write(rows)
+                queue_event('products_imported', {'created': created, 'updated': updated}, session=self.session)
+            bump_data_version(session=self.session)
+            self.session.commit()  # also commits categories created while validating
+            self.report['created'] += created
+            self.report['updated'] += updated
+        except Exception as e:
+            self.session.rollback()
+            # Categories created in this chunk were rolled back with it
+            self._categories = dict(self.session.query(Category.name, Category.id).all())
+            self._category_ids = set(self._categories.values())
+            for line_number, record in chunk:
+                if line_number not in rejected:
+                    self._error(line_number, str(e))
+
+    def _write(self, rows):
+        """Upsert validated rows; returns ``(created, updated)``"""
+        # One SELECT tells which SKUs already exist, with what is needed for the rollup
+        existing = {
+            row.sku: row
+            for row in self.session.query(Product.id, Product.sku, Product.category_id, Product.price,
+                                        db.func.coalesce(Inventory.quantity, 0).label('quantity'))
+            .outerjoin(Inventory, Inventory.product_id == Product.id)
+            .filter(Product.sku.in_(list(rows)))
+        }
+
+        now = datetime.utcnow()
+        new_products, new_inventory, updates = [], [], []
+        rollup_deltas = {}
+
+        def add_delta(category_id, products=0, quantity=0, value=0.0):
+            current = rollup_deltas.get(category_id, (0, 0, 0.0))
+            rollup_deltas[category_id] = (current[0] + products, current[1] + quantity, current[2] + value)
+
+        for sku, (line_number, row) in rows.items():
+            old = existing.get(sku)
+            if old is None:
+                product_id = str(uuid.uuid4())
+                new_products.append(dict(row, id=product_id, created_at=now, updated_at=now))
+                new_inventory.append({'id': str(uuid.uuid4()), 'product_id': product_id,
+                                      'quantity': 0, 'last_updated': now})
+                add_delta(row['category_id'], products=1)
+            else:
+                updates.append(dict(row, b_id=old.id, updated_at=now))
+                if row['category_id'] != old.category_id:
+                    add_delta(old.category_id, products=-1, quantity=-old.quantity,
+                              value=-old.quantity * old.price)
+                    add_delta(row['category_id'], products=1, quantity=old.quantity,
+                              value=old.quantity * row['price'])
+                elif row['price'] != old.price:
+                    add_delta(row['category_id'], value=old.quantity * (row['price'] - old.price))
+
+        # Multi-row INSERTs for new products and their inventory, executemany for updates
+        if new_products:
+            self.session.execute(Product.__table__.insert(), new_products)
+            self.session.execute(Inventory.__table__.insert(), new_inventory)
+        if updates:
+            table = Product.__table__
+            self.session.execute(
+                table.update().where(table.c.id == db.bindparam('b_id')),
+                updates
+            )
+        for category_id in sorted(rollup_deltas):
+            products, quantity, value = rollup_deltas[category_id]
+            apply_rollup_delta(category_id, products=products, quantity=quantity, value=value,
+                               session=self.session)
+        return len(new_products), len(updates)
+
+
+def import_products(stream, fmt, create_categories=False, chunk_size=CHUNK_SIZE, session=None):
+    """Import products from a CSV or NDJSON stream and return a summary report"""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unsupported format: {fmt}. Use csv or ndjson')
+    importer = ProductImporter(create_categories=create_categories, chunk_size=chunk_size, session=session)
+    return importer.run(iter_records(stream, fmt))
@@ -0,0 +1,204 @@
+"""
+Versioned schema migrations, applied once at startup or from the CLI
+"""
+from db import (db, CategoryStockRollup, ChangeLog, ChangeSequence, DailyMovement, DataVersion, Inventory, Product,
+                StockCheckpoint, Transaction, CHANGE_TABLES, DEFAULT_REORDER_POINT, rebuild_category_rollup,
+                rebuild_daily_movements, take_stock_checkpoint)
+from datetime import datetime
+
+# Arbitrary key of the PostgreSQL advisory lock that serializes concurrent migrators
+MIGRATION_LOCK_KEY = 72710516
+
+schema_migrations = db.Table(
+    'schema_migrations',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('name', db.String(255), nullable=False),
+    db.Column('applied_at', db.DateTime, default=datetime.utcnow)
+)
+
+# (version, name, function), in the order they must be applied
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """Register a migration; functions run inside the app context and must be idempotent"""
+    def register(fn):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def create_indexes(table):
+    """Create any of a table's declared indexes that do not exist yet"""
+    for index in table.indexes:
+        index.create(db.engine, checkfirst=True)
+
+
+def add_column(table, name, default):
+    """Add a declared column to an existing table, filling current rows with ``default``"""
+    if name in {column['name'] for column in db.inspect(db.engine).get_columns(table.name)}:
+        return
+    column = table.c[name]
+    dialect = db.engine.dialect
+    literal = db.literal(default, column.type).compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+    null = '' if column.nullable else ' NOT NULL'
+    db.session.execute(db.text(
+        f'ALTER TABLE {table.name} ADD COLUMN {name} {column.type.compile(dialect)}{null} DEFAULT {literal}'))
+
+
+@migration(1, 'base schema')
+def _create_base_schema():
+    db.create_all()
+
+
+@migration(2, 'transaction keyset indexes')
+def _create_transaction_indexes():
+    create_indexes(Transaction.__table__)
+
+
+@migration(3, 'data version counter')
+def _create_data_version():
+    DataVersion.__table__.create(db.engine, checkfirst=True)
+    if db.session.get(DataVersion, 1) is None:
+        db.session.add(DataVersion(id=1, version=1))
+
+
+@migration(4, 'category stock rollup')
+def _create_category_stock_rollup():
+    CategoryStockRollup.__table__.create(db.engine, checkfirst=True)
+    rebuild_category_rollup()
+
+
+@migration(5, 'product listing indexes')
+def _create_product_indexes():
+    create_indexes(Product.__table__)
+
+
+@migration(6, 'inventory reorder points')
+def _add_reorder_points():
+    table = Inventory.__table__
+    add_column(table, 'reorder_point', DEFAULT_REORDER_POINT)
+    add_column(table, 'below_reorder', False)
+    db.session.execute(table.update().values(below_reorder=table.c.quantity < table.c.reorder_point))
+    db.session.commit()
+    create_indexes(table)
+
+
+@migration(7, 'daily movement rollup')
+def _create_daily_movements():
+    DailyMovement.__table__.create(db.engine, checkfirst=True)
+    rebuild_daily_movements()
+
+
+@migration(8, 'stock checkpoints')
+def _create_stock_checkpoints():
+    StockCheckpoint.__table__.create(db.engine, checkfirst=True)
+    take_stock_checkpoint()
+
+
+@migration(9, 'product search indexes')
+def _create_search_indexes():
+    # Other databases search without dedicated indexes
+    if db.engine.dialect.name != 'postgresql':
+        return
+    db.session.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    # Fuzzy and substring name matching
+    db.session.execute(db.text(
+        'CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (name gin_trgm_ops)'))
+    # SKU prefix LIKE, whatever the database collation
+    db.session.execute(db.text(
+        'CREATE INDEX IF NOT EXISTS ix_products_sku_pattern ON products (sku text_pattern_ops)'))
+
+
+def create_change_triggers():
+    """Record every insert, update and delete on the tracked tables in ``change_log``"""
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text("""
+            CREATE OR REPLACE FUNCTION record_change() RETURNS trigger AS $$
+            DECLARE
+                next_seq BIGINT;
+                changed_row RECORD;
+            BEGIN
+                UPDATE change_sequence SET seq = seq + 1 WHERE id = 1 RETURNING seq INTO next_seq;
+                IF TG_OP = 'DELETE' THEN changed_row := OLD; ELSE changed_row := NEW; END IF;
+                INSERT INTO change_log (table_name, row_id, seq, deleted, changed_at)
+                VALUES (TG_TABLE_NAME, changed_row.id, next_seq, TG_OP = 'DELETE', now() AT TIME ZONE 'utc')
+                ON CONFLICT (table_name, row_id) DO UPDATE
+                    SET seq = EXCLUDED.seq, deleted = EXCLUDED.deleted, changed_at = EXCLUDED.changed_at;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql"""))
+        for table in CHANGE_TABLES:
+            db.session.execute(db.text(f'DROP TRIGGER IF EXISTS record_change ON {table}'))
+            db.session.execute(db.text(
+                f'CREATE TRIGGER record_change AFTER INSERT OR UPDATE OR DELETE ON {table} '
+                f'FOR EACH ROW EXECUTE FUNCTION record_change()'))
+        return
+    
+    for table in CHANGE_TABLES:
+        for operation, ref, deleted in (('INSERT', 'NEW', 0), ('UPDATE', 'NEW', 0), ('DELETE', 'OLD', 1)):
+            db.session.execute(db.text(f"""
+                CREATE TRIGGER IF NOT EXISTS record_change_{table}_{operation.lower()}
+                AFTER {operation} ON {table} BEGIN
+                    UPDATE change_sequence SET seq = seq + 1 WHERE id = 1;
+                    INSERT OR REPLACE INTO change_log (table_name, row_id, seq, deleted, changed_at)
+                    SELECT '{table}', {ref}.id, seq, {deleted}, CURRENT_TIMESTAMP FROM change_sequence WHERE id = 1;
+                END"""))
+
+
+@migration(10, 'change feed')
+def _create_change_feed():
+    ChangeSequence.__table__.create(db.engine, checkfirst=True)
+    ChangeLog.__table__.create(db.engine, checkfirst=True)
+    if db.session.get(ChangeSequence, 1) is not None:
+        return
+    if db.engine.dialect.name == 'postgresql':
+        # No writes may slip between the backfill and the triggers
+        db.session.execute(db.text(f"LOCK TABLE {', '.join(CHANGE_TABLES)} IN SHARE ROW EXCLUSIVE MODE"))
+    
+    # Every existing row is one change, so a client syncing from 0 receives the full data set
+    seq = 0
+    now = datetime.utcnow()
+    for table in CHANGE_TABLES:
+        db.session.execute(db.text(
+            f'INSERT INTO change_log (table_name, row_id, seq, deleted, changed_at) '
+            f'SELECT :table, id, :offset + ROW_NUMBER() OVER (ORDER BY id), :deleted, :now FROM {table}'),
+            {'table': table, 'offset': seq, 'deleted': False, 'now': now})
+        seq = db.session.execute(db.select(db.func.coalesce(db.func.max(ChangeLog.seq), 0))).scalar()
+    db.session.add(ChangeSequence(id=1, seq=seq, pruned_through=0))
+    db.session.flush()
+    create_change_triggers()
+
+
+def pending_migrations():
+    """Migrations not yet recorded in ``schema_migrations``"""
+    schema_migrations.create(db.engine, checkfirst=True)
+    applied = set(db.session.execute(db.select(schema_migrations.c.version)).scalars())
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def migrate():
+    """Apply pending migrations in order, each committed with its version row.
+
+    Must run inside an app context. Returns the names of the applied migrations.
+    """
+    applied = []
+    with db.engine.connect() as lock_conn:
+        use_lock = db.engine.dialect.name == 'postgresql'
+        if use_lock:
+            lock_conn.execute(db.text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+        try:
+            for version, name, fn in pending_migrations():
+                fn()
+                db.session.execute(schema_migrations.insert().values(
+                    version=version, name=name, applied_at=datetime.utcnow()))
+                db.session.commit()
+                applied.append(name)
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            if use_lock:
+                lock_conn.execute(db.text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+    return applied
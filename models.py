@@ -22,13 +22,17 @@ class Category(db.Model):
             'description': self.description,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
-            'product_count': len(self.products)
+            'product_count': self.product_count
         }
 
 
 class Product(db.Model):
     """Product Model"""
     __tablename__ = 'products'
+    __table_args__ = (
+        db.Index('ix_products_created_at_id', 'created_at', 'id'),
+        db.Index('ix_products_category_created_at_id', 'category_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     name = db.Column(db.String(255), nullable=False)
@@ -58,13 +62,38 @@ class Product(db.Model):
         }
 
 
+# Counted in the same SELECT as the category instead of loading every product
+Category.product_count = db.column_property(
+    db.select(db.func.count(Product.id))
+    .where(Product.category_id == Category.id)
+    .correlate_except(Product)
+    .scalar_subquery()
+)
+
+
+DEFAULT_REORDER_POINT = 10
+
+
+def _below_reorder_default(context):
+    params = context.get_current_parameters()
+    quantity = params.get('quantity') or 0
+    reorder_point = params.get('reorder_point')
+    return quantity < (DEFAULT_REORDER_POINT if reorder_point is None else reorder_point)
+
+
 class Inventory(db.Model):
     """Inventory Stock Model"""
     __tablename__ = 'inventory'
+    __table_args__ = (
+        db.Index('ix_inventory_below_reorder_product', 'below_reorder', 'product_id',
+                 postgresql_where=db.text('below_reorder')),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     product_id = db.Column(db.String(36), db.ForeignKey('products.id'), unique=True, nullable=False)
     quantity = db.Column(db.Integer, default=0)
+    reorder_point = db.Column(db.Integer, nullable=False, default=DEFAULT_REORDER_POINT)
+    below_reorder = db.Column(db.Boolean, nullable=False, default=_below_reorder_default)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def to_dict(self):
@@ -72,6 +101,7 @@ class Inventory(db.Model):
             'id': self.id,
             'product_id': self.product_id,
             'quantity': self.quantity,
+            'reorder_point': self.reorder_point,
             'last_updated': self.last_updated.isoformat()
         }
 
@@ -79,6 +109,11 @@ class Inventory(db.Model):
 class Transaction(db.Model):
     """Transaction Model (Entry/Exit)"""
     __tablename__ = 'transactions'
+    __table_args__ = (
+        db.Index('ix_transactions_created_at_id', 'created_at', 'id'),
+        db.Index('ix_transactions_product_created_at_id', 'product_id', 'created_at', 'id'),
+        db.Index('ix_transactions_type_created_at_id', 'type', 'created_at', 'id'),
+    )
     
     # Transaction types
     ENTRY = 'ENTRY'
@@ -0,0 +1,95 @@
+"""
+Keyset (cursor) pagination helpers shared by the list endpoints
+"""
+from datetime import datetime, timedelta
+import base64
+import json
+
+from sqlalchemy import tuple_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def parse_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    """Parse the ``limit`` query parameter, clamped to ``maximum``"""
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be a positive integer') from None
+    if limit <= 0:
+        raise ValueError('limit must be a positive integer')
+    return min(limit, maximum)
+
+
+def encode_cursor(created_at, row_id):
+    """Build an opaque cursor from the last row's sort key"""
+    key = [created_at.isoformat(), row_id]
+    raw = json.dumps(key, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the ``(created_at, id)`` sort key stored in a cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at), row_id
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def parse_datetime(value, end_of_day=False):
+    """Parse an ISO date or datetime query parameter.
+
+    A bare date used as an upper bound (``end_of_day=True``) covers the whole day.
+    """
+    if value in (None, ''):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError as e:
+        raise ValueError(f'Invalid date: {value}') from e
+    if parsed.tzinfo is not None:
+        parsed = parsed.replace(tzinfo=None) - parsed.utcoffset()
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def parse_as_of(value):
+    """Parse an ``as_of`` query parameter; a bare date means the end of that day"""
+    as_of = parse_datetime(value, end_of_day=True)
+    if as_of is not None and len(value) == 10:
+        as_of -= timedelta(microseconds=1)
+    return as_of
+
+
+def transaction_filters(model, args):
+    """Build SQL filter conditions for a transactions query from request args.
+
+    Supports ``product_id``, ``type``, ``from`` (inclusive) and ``to`` (exclusive,
+    or the whole day when a bare date is given).
+    """
+    conditions = []
+    if args.get('product_id'):
+        conditions.append(model.product_id == args['product_id'])
+    if args.get('type'):
+        if args['type'] not in ('ENTRY', 'EXIT'):
+            raise ValueError('Invalid transaction type')
+        conditions.append(model.type == args['type'])
+    start = parse_datetime(args.get('from'))
+    if start is not None:
+        conditions.append(model.created_at >= start)
+    end = parse_datetime(args.get('to'), end_of_day=True)
+    if end is not None:
+        conditions.append(model.created_at < end)
+    return conditions
+
+
+def keyset_condition(model, cursor):
+    """Condition selecting rows strictly after ``cursor`` in ``(created_at, id)`` DESC order"""
+    created_at, row_id = decode_cursor(cursor)
+    return tuple_(model.created_at, model.id) < tuple_(created_at, row_id)
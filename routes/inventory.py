@@ -1,53 +1,63 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, request, jsonify
 from app import db
 from models import Product, Inventory, Category, Transaction
+from pagination import parse_limit
 
 inventory_bp = Blueprint('inventory', __name__, url_prefix='/api/inventory')
 
 @inventory_bp.route('/stats', methods=['GET'])
 def get_inventory_stats():
-    """Get comprehensive inventory statistics"""
+    """Get comprehensive inventory statistics (``include_products=false`` skips product detail)"""
     try:
-        # Get total products
-        total_products = Product.query.count()
+        include_products = request.args.get('include_products', 'true').lower() not in ('0', 'false', 'no')
+        quantity = db.func.coalesce(Inventory.quantity, 0)
         
-        # Get all inventory records
-        inventories = Inventory.query.all()
-        total_quantity = sum(inv.quantity for inv in inventories)
+        # Per-category count, quantity and valuation in a single GROUP BY
+        category_rows = (db.session.query(
+                             Category.id,
+                             Category.name,
+                             Category.description,
+                             db.func.count(Product.id),
+                             db.func.coalesce(db.func.sum(quantity), 0),
+                             db.func.coalesce(db.func.sum(Product.price * quantity), 0.0))
+                         .outerjoin(Product, Product.category_id == Category.id)
+                         .outerjoin(Inventory, Inventory.product_id == Product.id)
+                         .group_by(Category.id, Category.name, Category.description)
+                         .order_by(Category.name)
+                         .all())
         
-        # Get all products with their inventory and prices
-        products = Product.query.all()
-        total_price = sum(p.price * (p.inventory.quantity if p.inventory else 0) for p in products)
+        products_by_category = {}
+        if include_products:
+            product_rows = (db.session.query(Product.id, Product.name, Product.price, Product.category_id, quantity)
+                            .outerjoin(Inventory, Inventory.product_id == Product.id)
+                            .order_by(Product.created_at)
+                            .all())
+            for product_id, name, price, category_id, qty in product_rows:
+                products_by_category.setdefault(category_id, []).append({
+                    'id': product_id,
+                    'name': name,
+                    'price': price,
+                    'quantity': qty,
+                })
         
-        # Get categories with their products
-        categories = Category.query.all()
         categories_data = []
-        
-        for cat in categories:
-            cat_products = Product.query.filter_by(category_id=cat.id).all()
-            cat_total_quantity = sum(p.inventory.quantity if p.inventory else 0 for p in cat_products)
-            
-            categories_data.append({
-                'id': cat.id,
-                'name': cat.name,
-                'description': cat.description,
-                'product_count': len(cat_products),
-                'total_quantity': cat_total_quantity,
-                'products': [
-                    {
-                        'id': p.id,
-                        'name': p.name,
-                        'price': p.price,
-                        'quantity': p.inventory.quantity if p.inventory else 0,
-                    }
-                    for p in cat_products
-                ]
-            })
+        for cat_id, name, description, product_count, cat_quantity, cat_value in category_rows:
+            category_data = {
+                'id': cat_id,
+                'name': name,
+                'description': description,
+                'product_count': product_count,
+                'total_quantity': int(cat_quantity),
+                'total_value': round(float(cat_value), 2),
+            }
+            if include_products:
+                category_data['products'] = products_by_category.get(cat_id, [])
+            categories_data.append(category_data)
         
         return jsonify({
-            'total_products': total_products,
-            'total_quantity': total_quantity,
-            'total_price': round(total_price, 2),
+            'total_products': sum(c['product_count'] for c in categories_data),
+            'total_quantity': sum(c['total_quantity'] for c in categories_data),
+            'total_price': round(sum(float(row[5]) for row in category_rows), 2),
             'categories': categories_data
         }), 200
     except Exception as e:
@@ -57,16 +67,18 @@ def get_inventory_stats():
 def get_inventory_summary():
     """Get quick inventory summary"""
     try:
-        inventories = Inventory.query.all()
-        total_items = sum(inv.quantity for inv in inventories)
-        
-        products = Product.query.all()
-        total_value = sum(p.price * (p.inventory.quantity if p.inventory else 0) for p in products)
+        quantity = db.func.coalesce(Inventory.quantity, 0)
+        total_products, total_items, total_value = (db.session.query(
+                db.func.count(Product.id),
+                db.func.coalesce(db.func.sum(quantity), 0),
+                db.func.coalesce(db.func.sum(Product.price * quantity), 0.0))
+            .outerjoin(Inventory, Inventory.product_id == Product.id)
+            .one())
         
         return jsonify({
-            'total_products': Product.query.count(),
-            'total_items_in_stock': total_items,
-            'total_inventory_value': round(total_value, 2),
+            'total_products': total_products,
+            'total_items_in_stock': int(total_items),
+            'total_inventory_value': round(float(total_value), 2),
             'categories_count': Category.query.count()
         }), 200
     except Exception as e:
@@ -89,29 +101,61 @@ def get_transactions_summary():
 
 @inventory_bp.route('/low-stock', methods=['GET'])
 def get_low_stock_products():
-    """Get products with low stock (quantity < 10)"""
+    """Get a page of products below their reorder point (or an explicit ``threshold``)"""
     try:
-        threshold = request.args.get('threshold', 10, type=int)
+        threshold = None
+        if request.args.get('threshold') not in (None, ''):
+            try:
+                threshold = int(request.args['threshold'])
+            except ValueError:
+                return jsonify({'error': 'threshold must be an integer'}), 400
+        limit = parse_limit(request.args.get('limit'))
         
-        low_stock = []
-        products = Product.query.all()
+        columns = (Product.id, Product.name, Product.sku, Product.price,
+                   db.func.coalesce(Inventory.quantity, 0), Inventory.reorder_point, Category.name)
+        if threshold is not None:
+            # An ad-hoc threshold is evaluated in SQL; products without an inventory row count as 0
+            query = (db.session.query(*columns).select_from(Product)
+                     .outerjoin(Inventory, Inventory.product_id == Product.id)
+                     .outerjoin(Category, Category.id == Product.category_id)
+                     .filter(db.func.coalesce(Inventory.quantity, 0) < threshold)
+                     .order_by(Product.id))
+            if request.args.get('cursor'):
+                query = query.filter(Product.id > request.args['cursor'])
+        else:
+            # The flagged set is served from its index
+            query = (db.session.query(*columns).select_from(Inventory)
+                     .join(Product, Product.id == Inventory.product_id)
+                     .outerjoin(Category, Category.id == Product.category_id)
+                     .filter(Inventory.below_reorder)
+                     .order_by(Inventory.product_id))
+            if request.args.get('cursor'):
+                query = query.filter(Inventory.product_id > request.args['cursor'])
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
         
-        for p in products:
-            quantity = p.inventory.quantity if p.inventory else 0
-            if quantity < threshold:
-                low_stock.append({
-                    'id': p.id,
-                    'name': p.name,
-                    'sku': p.sku,
-                    'quantity': quantity,
-                    'price': p.price,
-                    'category': p.category.name if p.category else ''
-                })
+        low_stock = [
+            {
+                'id': product_id,
+                'name': name,
+                'sku': sku,
+                'quantity': quantity,
+                'reorder_point': reorder_point,
+                'price': price,
+                'category': category or ''
+            }
+            for product_id, name, sku, price, quantity, reorder_point, category in rows
+        ]
         
         return jsonify({
             'threshold': threshold,
             'count': len(low_stock),
-            'products': low_stock
+            'products': low_stock,
+            'next_cursor': low_stock[-1]['id'] if has_more else None,
+            'has_more': has_more
         }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1,15 +1,33 @@
 from flask import Blueprint, request, jsonify
 from app import db
 from models import Product, Inventory, Category
+from serializers import PRODUCT_FIELDS, parse_fields, project, row_to_dict
 
 products_bp = Blueprint('products', __name__, url_prefix='/api/products')
 
 @products_bp.route('', methods=['GET'])
 def get_products():
-    """Get all products"""
+    """Get all products (``fields=`` selects a sparse fieldset)"""
     try:
-        products = Product.query.all()
-        return jsonify([p.to_dict() for p in products]), 200
+        try:
+            fields = parse_fields(request.args.get('fields'), PRODUCT_FIELDS, extra=['inventory'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        query = db.select(*project(Product, fields))
+        if 'inventory' in fields:
+            query = (query.add_columns(db.func.coalesce(Inventory.quantity, 0).label('quantity'),
+                                       Inventory.last_updated.label('last_updated'))
+                     .outerjoin(Inventory, Inventory.product_id == Product.id))
+        rows = db.session.execute(query.order_by(Product.created_at)).all()
+        
+        products = []
+        for row in rows:
+            product = row_to_dict(row, fields)
+            if 'inventory' in fields:
+                product['inventory'] = row_to_dict(row, ['quantity', 'last_updated'])
+            products.append(product)
+        return jsonify(products), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1,15 +1,55 @@
 from flask import Blueprint, request, jsonify
 from app import db
 from models import Transaction, Product, Inventory
+from pagination import parse_limit, encode_cursor, keyset_condition, transaction_filters
+from serializers import PRODUCT_FIELDS, TRANSACTION_FIELDS, parse_fields, parse_expand, project, row_to_dict
 
 transactions_bp = Blueprint('transactions', __name__, url_prefix='/api/transactions')
 
 @transactions_bp.route('', methods=['GET'])
 def get_transactions():
-    """Get all transactions"""
+    """Get a page of transactions, newest first (supports ``fields=`` and ``expand=product``)"""
     try:
-        transactions = Transaction.query.order_by(Transaction.created_at.desc()).all()
-        return jsonify([t.to_dict() for t in transactions]), 200
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            fields = parse_fields(request.args.get('fields'), TRANSACTION_FIELDS)
+            expand = parse_expand(request.args.get('expand'), ['product'])
+            conditions = transaction_filters(Transaction, request.args)
+            if request.args.get('cursor'):
+                conditions.append(keyset_condition(Transaction, request.args['cursor']))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        query = db.select(*project(Transaction, fields),
+                          Transaction.id.label('_cursor_id'),
+                          Transaction.created_at.label('_cursor_created_at'))
+        if 'product' in expand:
+            query = (query.add_columns(*project(Product, PRODUCT_FIELDS, prefix='product_'))
+                     .outerjoin(Product, Product.id == Transaction.product_id))
+        
+        rows = db.session.execute(
+            query.where(*conditions)
+            .order_by(Transaction.created_at.desc(), Transaction.id.desc())
+            .limit(limit + 1)
+        ).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_cursor(rows[-1]._cursor_created_at, rows[-1]._cursor_id)
+        
+        transactions = []
+        for row in rows:
+            transaction = row_to_dict(row, fields)
+            if 'product' in expand:
+                transaction['product'] = row_to_dict(row, PRODUCT_FIELDS, prefix='product_')
+            transactions.append(transaction)
+        
+        return jsonify({
+            'transactions': transactions,
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -33,21 +73,28 @@ def create_transaction():
         if not product:
             return jsonify({'error': 'Product not found'}), 404
         
-        # Check if inventory exists
-        inventory = Inventory.query.filter_by(product_id=data['product_id']).first()
-        if not inventory:
-            # Create inventory if it doesn't exist
-            inventory = Inventory(product_id=data['product_id'], quantity=0)
-            db.session.add(inventory)
-        
         # Validate quantity
         quantity = int(data['quantity'])
         if quantity <= 0:
             return jsonify({'error': 'Quantity must be greater than 0'}), 400
         
-        # For EXIT, check if enough inventory exists
-        if data['type'] == 'EXIT' and inventory.quantity < quantity:
-            return jsonify({'error': f'Insufficient inventory. Available: {inventory.quantity}'}), 400
+        # Update inventory with one conditional UPDATE; the row count decides success
+        delta = quantity if data['type'] == 'ENTRY' else -quantity
+        inventory = Inventory.__table__
+        stmt = inventory.update().where(inventory.c.product_id == data['product_id'])
+        if delta < 0:
+            stmt = stmt.where(inventory.c.quantity >= quantity)
+        result = db.session.execute(stmt.values(quantity=inventory.c.quantity + delta,
+                                                below_reorder=inventory.c.quantity + delta < inventory.c.reorder_point))
+        if result.rowcount != 1:
+            current = Inventory.query.filter_by(product_id=data['product_id']).first()
+            if current is None and delta > 0:
+                # Create inventory if it doesn't exist
+                db.session.add(Inventory(product_id=data['product_id'], quantity=quantity))
+            else:
+                db.session.rollback()
+                available = current.quantity if current else 0
+                return jsonify({'error': f'Insufficient inventory. Available: {available}'}), 400
         
         # Create transaction
         transaction = Transaction(
@@ -58,12 +105,6 @@ def create_transaction():
             notes=data.get('notes', '')
         )
         
-        # Update inventory
-        if data['type'] == 'ENTRY':
-            inventory.quantity += quantity
-        else:  # EXIT
-            inventory.quantity -= quantity
-        
         db.session.add(transaction)
         db.session.commit()
         
@@ -93,14 +134,15 @@ def delete_transaction(transaction_id):
         if not transaction:
             return jsonify({'error': 'Transaction not found'}), 404
         
-        # Reverse inventory change
-        inventory = Inventory.query.filter_by(product_id=transaction.product_id).first()
-        if inventory:
-            if transaction.type == 'ENTRY':
-                inventory.quantity -= transaction.quantity
-            else:  # EXIT
-                inventory.quantity += transaction.quantity
-            inventory.quantity = max(0, inventory.quantity)
+        # Reverse inventory change in SQL, flooring at zero
+        delta = -transaction.quantity if transaction.type == 'ENTRY' else transaction.quantity
+        inventory = Inventory.__table__
+        new_quantity = db.case((inventory.c.quantity + delta < 0, 0), else_=inventory.c.quantity + delta)
+        db.session.execute(
+            inventory.update()
+            .where(inventory.c.product_id == transaction.product_id)
+            .values(quantity=new_quantity, below_reorder=new_quantity < inventory.c.reorder_point)
+        )
         
         db.session.delete(transaction)
         db.session.commit()
@@ -0,0 +1,56 @@
+"""
+Product search by SKU prefix and fuzzy name match
+"""
+from db import db, Product, Inventory
+
+SEARCH_LIMIT = 20
+MAX_QUERY_LENGTH = 100
+
+
+def escape_like(value):
+    """Escape LIKE wildcards so user input matches literally (escape character ``\\``)"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_query(q, session=None):
+    """Ranked product search: SKU prefix matches first, then names by similarity.
+
+    On PostgreSQL names match through ``pg_trgm`` (the ``%`` similarity
+    operator or a substring), served by the trigram GIN index, and rank by
+    ``similarity()``. Other databases fall back to a case-insensitive
+    substring match ranking names that start with the query first.
+    """
+    escaped = escape_like(q)
+    sku_match = Product.sku.like(escaped + '%', escape='\\')
+    contains = Product.name.ilike(f'%{escaped}%', escape='\\')
+    if (session or db.session).get_bind().dialect.name == 'postgresql':
+        name_match = db.or_(Product.name.bool_op('%')(q), contains)
+        score = db.func.similarity(Product.name, q)
+    else:
+        name_match = contains
+        score = db.case((Product.name.ilike(escaped + '%', escape='\\'), 1.0), else_=0.5)
+
+    return (db.select(Product.id, Product.name, Product.sku, Product.price, Product.description,
+                      Product.category_id, db.func.coalesce(Inventory.quantity, 0).label('quantity'))
+            .outerjoin(Inventory, Inventory.product_id == Product.id)
+            .where(db.or_(sku_match, name_match))
+            .order_by(db.case((sku_match, 0), else_=1), score.desc(), Product.name, Product.id))
+
+
+def search_products(q, limit=SEARCH_LIMIT, offset=0, session=None):
+    """Return ``(products, has_more)`` for one page of search results"""
+    session = session or db.session
+    rows = session.execute(search_query(q, session).limit(limit + 1).offset(offset)).all()
+    products = [
+        {
+            'id': row.id,
+            'name': row.name,
+            'sku': row.sku,
+            'price': row.price,
+            'description': row.description,
+            'category_id': row.category_id,
+            'inventory': {'quantity': row.quantity}
+        }
+        for row in rows[:limit]
+    ]
+    return products, len(rows) > limit
@@ -0,0 +1,53 @@
+"""
+Lean JSON serialization of projected column rows for the list endpoints
+"""
+from datetime import datetime
+
+CATEGORY_FIELDS = ['id', 'name', 'description', 'created_at', 'updated_at']
+PRODUCT_FIELDS = ['id', 'name', 'sku', 'price', 'description', 'category_id', 'created_at', 'updated_at']
+TRANSACTION_FIELDS = ['id', 'product_id', 'type', 'quantity', 'reason', 'notes', 'created_at', 'updated_at']
+INVENTORY_FIELDS = ['id', 'product_id', 'quantity', 'reorder_point', 'last_updated']
+
+
+def parse_fields(value, available, extra=()):
+    """Parse a ``fields=a,b,c`` sparse fieldset; all fields when omitted.
+
+    ``extra`` lists computed fields (not model columns) that may also be requested.
+    """
+    allowed = list(available) + list(extra)
+    if not value:
+        return allowed
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def parse_expand(value, allowed):
+    """Parse an ``expand=a,b`` list of related objects to embed"""
+    if not value:
+        return set()
+    expand = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = expand - set(allowed)
+    if unknown:
+        raise ValueError(f"Cannot expand: {', '.join(sorted(unknown))}")
+    return expand
+
+
+def project(model, fields, prefix=''):
+    """Labelled columns of ``model`` for the requested model fields (computed fields are skipped)"""
+    columns = model.__table__.c
+    return [getattr(model, field).label(prefix + field) for field in fields if field in columns]
+
+
+def serialize_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def row_to_dict(row, fields, prefix=''):
+    """Build a response dict from a row's labelled columns"""
+    mapping = row._mapping
+    return {field: serialize_value(mapping[prefix + field]) for field in fields if prefix + field in mapping}
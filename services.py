@@ -0,0 +1,402 @@
+"""
+Request-independent parts of the API shared by app.py and app_async.py.
+
+Handlers parse the request, call these helpers (the async app through
+``run_sync``) and turn the result into a response. Helpers run in the
+caller's session: ``db.session`` by default, or the session passed in.
+"""
+from db import (db, Category, Product, Inventory, Transaction, CategoryStockRollup, adjust_stock_many,
+                create_stock_rows, apply_rollup_delta, bump_data_version, record_movements, daily_movement_totals,
+                MOVEMENT_BUCKETS, MOVEMENT_COUNTERS, bucket_start, stock_as_of, low_stock_query,
+                product_listing_query, transaction_page_query, EXPORT_COLUMNS, CHANGE_TABLES, changes_since,
+                change_feed_state)
+from pagination import parse_limit, parse_datetime, encode_cursor, keyset_condition, transaction_filters
+from serializers import (CATEGORY_FIELDS, INVENTORY_FIELDS, PRODUCT_FIELDS, TRANSACTION_FIELDS, parse_fields,
+                         parse_expand, project, row_to_dict, serialize_value)
+from events import queue_event
+from datetime import datetime, timedelta
+import csv
+import io
+import json
+import uuid
+
+# Largest number of movements accepted by POST /api/transactions/batch
+MAX_BATCH_SIZE = 1000
+# Rows fetched per server-side cursor round trip when exporting the ledger
+EXPORT_CHUNK_SIZE = 1000
+# Page size of the change feed (default and maximum)
+CHANGES_LIMIT = 500
+MAX_CHANGES_LIMIT = 5000
+
+# Model and serialized fields of each table in the change feed
+CHANGE_MODELS = {
+    'categories': (Category, CATEGORY_FIELDS),
+    'products': (Product, PRODUCT_FIELDS),
+    'inventory': (Inventory, INVENTORY_FIELDS),
+    'transactions': (Transaction, TRANSACTION_FIELDS)
+}
+
+
+def category_listing(fields, session=None):
+    """Categories by name, projected to ``fields`` (``product_count`` comes from the rollup)"""
+    session = session or db.session
+    query = db.select(*project(Category, fields))
+    if 'product_count' in fields:
+        query = (query.add_columns(db.func.coalesce(CategoryStockRollup.product_count, 0).label('product_count'))
+                 .outerjoin(CategoryStockRollup, CategoryStockRollup.category_id == Category.id))
+    return [row_to_dict(row, fields) for row in session.execute(query.order_by(Category.name))]
+
+
+def product_listing(fields, as_of=None, session=None):
+    """Products in listing order, projected to ``fields``; with ``as_of``, as they stood then"""
+    session = session or db.session
+    columns = project(Product, fields)
+    if as_of is not None:
+        columns.append(Product.id.label('_id'))
+    rows = session.execute(product_listing_query(columns, as_of, with_inventory='inventory' in fields)).all()
+    stock = stock_as_of(as_of, session=session) if as_of is not None and 'inventory' in fields else {}
+
+    products = []
+    for row in rows:
+        product = row_to_dict(row, fields)
+        if 'inventory' in fields:
+            if as_of is not None:
+                product['inventory'] = {'quantity': stock.get(row._id, 0), 'as_of': as_of.isoformat()}
+            else:
+                product['inventory'] = row_to_dict(row, ['quantity', 'last_updated'])
+        products.append(product)
+    return products
+
+
+def parse_transaction_page_args(args):
+    """``(limit, fields, expand, conditions)`` of a transactions list request; raises ValueError"""
+    limit = parse_limit(args.get('limit'))
+    fields = parse_fields(args.get('fields'), TRANSACTION_FIELDS)
+    expand = parse_expand(args.get('expand'), ['product'])
+    conditions = transaction_filters(Transaction, args)
+    if args.get('cursor'):
+        conditions.append(keyset_condition(Transaction, args['cursor']))
+    return limit, fields, expand, conditions
+
+
+def transaction_page(limit, fields, expand, conditions, session=None):
+    """One page of transactions, newest first, with the cursor of the next page"""
+    session = session or db.session
+    # Project only the requested columns, plus the sort key for the cursor
+    columns = [*project(Transaction, fields),
+               Transaction.id.label('_cursor_id'),
+               Transaction.created_at.label('_cursor_created_at')]
+    product_columns = None
+    if 'product' in expand:
+        product_columns = [*project(Product, PRODUCT_FIELDS, prefix='product_'),
+                           db.func.coalesce(Inventory.quantity, 0).label('product_quantity')]
+
+    # Fetch one extra row to know whether another page exists
+    rows = session.execute(transaction_page_query(columns, conditions, limit + 1, product_columns)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(rows[-1]._cursor_created_at, rows[-1]._cursor_id)
+
+    transactions = []
+    for row in rows:
+        transaction = row_to_dict(row, fields)
+        if 'product' in expand:
+            product = row_to_dict(row, PRODUCT_FIELDS, prefix='product_')
+            product['inventory'] = {'quantity': row.product_quantity}
+            transaction['product'] = product if product['id'] else None
+        transactions.append(transaction)
+
+    return {
+        'transactions': transactions,
+        'next_cursor': next_cursor,
+        'has_more': has_more
+    }
+
+
+def low_stock_page(cursor, limit, session=None):
+    """One page of products below their reorder point, ordered by product id"""
+    session = session or db.session
+    rows = session.execute(low_stock_query(cursor, limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'products': [dict(row._mapping) for row in rows],
+        'next_cursor': rows[-1].id if has_more else None,
+        'has_more': has_more
+    }
+
+
+class ExportFormatter:
+    """Turns rows of ``transaction_export_query`` into NDJSON or CSV text, one chunk per call"""
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def header(self):
+        if self.fmt == 'csv':
+            self.writer.writerow(EXPORT_COLUMNS)
+        return self._flush()
+
+    def format(self, rows):
+        for row in rows:
+            values = list(row)
+            values[1] = values[1].isoformat() if values[1] else None
+            if self.fmt == 'csv':
+                self.writer.writerow(values)
+            else:
+                self.buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, values)), ensure_ascii=False))
+                self.buffer.write('\n')
+        return self._flush()
+
+    def _flush(self):
+        chunk = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return chunk
+
+
+def queue_stock_event(product_id, category_id, quantity, delta, value_delta, session=None):
+    """Announce a product's new stock level and its category's deltas once the write commits"""
+    queue_event('stock', {
+        'product_id': product_id,
+        'quantity': quantity,
+        'category_id': category_id,
+        'category_delta': {'quantity': delta, 'value': round(value_delta, 2)}
+    }, session=session)
+
+
+def post_transaction_batch(data, default_mode='atomic', session=None):
+    """Validate and post a batch request body; returns ``(body, status)``.
+
+    ``data`` is a list of movements or ``{"transactions": [...], "mode": ...}``;
+    ``mode=atomic`` rejects the whole batch if any item is invalid,
+    ``mode=partial`` posts the valid items and reports per-item errors.
+    Commits on success.
+    """
+    session = session or db.session
+    if isinstance(data, dict):
+        items = data.get('transactions')
+        mode = data.get('mode', default_mode)
+    else:
+        items = data
+        mode = default_mode
+
+    if not isinstance(items, list) or not items:
+        return {'error': 'A non-empty list of transactions is required'}, 400
+    if len(items) > MAX_BATCH_SIZE:
+        return {'error': f'Batch too large. Maximum: {MAX_BATCH_SIZE}'}, 400
+    if mode not in ['atomic', 'partial']:
+        return {'error': 'Invalid mode. Use atomic or partial'}, 400
+
+    # Ids key the product lookup below, so anything but a non-empty string is rejected up front
+    invalid_ids = [{'index': index, 'error': 'product_id must be a non-empty string'}
+                   for index, item in enumerate(items)
+                   if isinstance(item, dict) and 'product_id' in item
+                   and not (isinstance(item['product_id'], str) and item['product_id'])]
+    if invalid_ids:
+        return {'error': 'Batch rejected', 'errors': invalid_ids}, 400
+
+    # Fetch every referenced product with its stock in one query; products
+    # without a stock row have none yet (``stocked`` is None)
+    product_ids = {item.get('product_id') for item in items if isinstance(item, dict)}
+    products = {
+        row.id: row
+        for row in session.execute(
+            db.select(Product.id, Product.category_id, Product.price, Inventory.quantity,
+                      Inventory.product_id.label('stocked'))
+            .outerjoin(Inventory, Inventory.product_id == Product.id)
+            .where(Product.id.in_(product_ids))
+        )
+    }
+
+    # Validate in order against a running balance per product
+    errors = []
+    accepted = []
+    balances = {product_id: row.quantity or 0 for product_id, row in products.items()}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not all(field in item for field in ['product_id', 'type', 'quantity']):
+            errors.append({'index': index, 'error': 'Missing required fields'})
+            continue
+        if item['product_id'] not in products:
+            errors.append({'index': index, 'error': 'Product not found'})
+            continue
+        if item['type'] not in ['ENTRY', 'EXIT']:
+            errors.append({'index': index, 'error': 'Invalid transaction type'})
+            continue
+        try:
+            quantity = int(item['quantity'])
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'error': 'Invalid quantity value'})
+            continue
+        if quantity <= 0:
+            errors.append({'index': index, 'error': 'Quantity must be greater than 0'})
+            continue
+        delta = quantity if item['type'] == 'ENTRY' else -quantity
+        if balances[item['product_id']] + delta < 0:
+            errors.append({'index': index,
+                           'error': f"Insufficient inventory. Available: {balances[item['product_id']]}"})
+            continue
+        balances[item['product_id']] += delta
+        accepted.append((item, quantity, delta))
+
+    if errors and mode == 'atomic':
+        return {'error': 'Batch rejected', 'errors': errors}, 400
+    if not accepted:
+        return {'created': 0, 'transactions': [], 'errors': errors}, 400
+
+    # Net quantity change per product and per category
+    stock_deltas = {}
+    rollup_deltas = {}
+    for item, quantity, delta in accepted:
+        product = products[item['product_id']]
+        stock_deltas[product.id] = stock_deltas.get(product.id, 0) + delta
+        cat_quantity, cat_value = rollup_deltas.get(product.category_id, (0, 0.0))
+        rollup_deltas[product.category_id] = (cat_quantity + delta, cat_value + delta * product.price)
+
+    create_stock_rows([product_id for product_id, delta in stock_deltas.items()
+                       if delta > 0 and products[product_id].stocked is None], session=session)
+    if not adjust_stock_many(stock_deltas, session=session):
+        # Stock moved underneath us since validation; let the client retry
+        session.rollback()
+        return {'error': 'Inventory changed concurrently, please retry'}, 409
+    for category_id in sorted(rollup_deltas):
+        cat_quantity, cat_value = rollup_deltas[category_id]
+        apply_rollup_delta(category_id, quantity=cat_quantity, value=cat_value, session=session)
+
+    # One multi-row INSERT for the whole batch
+    now = datetime.utcnow()
+    rows = [{
+        'id': str(uuid.uuid4()),
+        'product_id': item['product_id'],
+        'type': item['type'],
+        'quantity': quantity,
+        'reason': item.get('reason', ''),
+        'notes': item.get('notes', ''),
+        'created_at': now,
+        'updated_at': now
+    } for item, quantity, delta in accepted]
+    session.execute(Transaction.__table__.insert(), rows)
+    record_movements([(now, item['product_id'], products[item['product_id']].category_id, item['type'], quantity)
+                      for item, quantity, delta in accepted], session=session)
+    new_stock = dict(session.execute(
+        db.select(Inventory.product_id, Inventory.quantity).where(Inventory.product_id.in_(list(stock_deltas)))
+    ).all())
+    for product_id in sorted(product_id for product_id, delta in stock_deltas.items() if delta):
+        product = products[product_id]
+        queue_stock_event(product_id, product.category_id, new_stock.get(product_id, 0),
+                          stock_deltas[product_id], stock_deltas[product_id] * product.price, session=session)
+    bump_data_version(session=session)
+    session.commit()
+
+    created = [dict(row, created_at=now.isoformat(), updated_at=now.isoformat()) for row in rows]
+    return {'created': len(created), 'transactions': created, 'errors': errors}, 201
+
+
+def parse_movement_args(args):
+    """Keyword arguments of ``movement_report`` from a movements request; raises ValueError"""
+    bucket = args.get('bucket', 'day')
+    if bucket not in MOVEMENT_BUCKETS:
+        raise ValueError('Invalid bucket. Use day, week or month')
+    by = args.get('by')
+    if by not in (None, 'category', 'product'):
+        raise ValueError('Invalid by. Use category or product')
+    start = parse_datetime(args.get('from'))
+    end = parse_datetime(args.get('to'), end_of_day=True)
+
+    # The rollup's resolution is one day, so partial days count whole
+    start_day = start.date() if start else None
+    end_day = None
+    if end:
+        end_day = end.date() if end.time() == datetime.min.time() else end.date() + timedelta(days=1)
+    return {'bucket': bucket, 'by': by, 'start_day': start_day, 'end_day': end_day,
+            'category_id': args.get('category_id'), 'product_id': args.get('product_id')}
+
+
+def fold_movements(rows, bucket, by=None):
+    """Fold ``daily_movement_totals`` rows (in day order) into one total per bucket (and ``by`` key)"""
+    buckets = {}
+    for row in rows:
+        period = bucket_start(row.day, bucket)
+        key = (period, row[1]) if by else (period,)
+        totals = buckets.get(key)
+        if totals is None:
+            totals = buckets[key] = {'period': period.isoformat()}
+            if by:
+                totals[f'{by}_id'] = row[1]
+            totals.update({counter: 0 for counter in MOVEMENT_COUNTERS})
+        for counter in MOVEMENT_COUNTERS:
+            totals[counter] += int(getattr(row, counter) or 0)
+    return [buckets[key] for key in sorted(buckets)]
+
+
+def movement_report(bucket='day', by=None, start_day=None, end_day=None, category_id=None, product_id=None,
+                    session=None):
+    """ENTRY/EXIT totals per bucket between ``start_day`` (inclusive) and ``end_day`` (exclusive)"""
+    rows = daily_movement_totals(start_day, end_day, category_id, product_id, by, session=session)
+    return {
+        'bucket': bucket,
+        'from': start_day.isoformat() if start_day else None,
+        'to': (end_day - timedelta(days=1)).isoformat() if end_day else None,
+        'movements': fold_movements(rows, bucket, by)
+    }
+
+
+def parse_changes_args(args):
+    """``(since, limit, tables)`` of a change feed request; raises ValueError"""
+    since = args.get('since', '0')
+    if not since.isdigit():
+        raise ValueError('since must be a non-negative integer')
+    limit = parse_limit(args.get('limit'), default=CHANGES_LIMIT, maximum=MAX_CHANGES_LIMIT)
+    tables = None
+    if args.get('tables'):
+        tables = [name.strip() for name in args['tables'].split(',') if name.strip()]
+        unknown = [name for name in tables if name not in CHANGE_TABLES]
+        if unknown:
+            raise ValueError(f"Unknown tables: {', '.join(unknown)}")
+    return int(since), limit, tables
+
+
+def change_feed_page(since, limit, tables=None, session=None):
+    """One page of the change feed with each changed row's current data; returns ``(body, status)``"""
+    session = session or db.session
+    latest, pruned_through = change_feed_state(session=session)
+    if 0 < since < pruned_through:
+        return {'error': 'Cursor expired, sync again from since=0', 'pruned_through': pruned_through}, 410
+
+    changes, has_more = changes_since(since, limit, tables, session=session)
+
+    # Current data of the changed rows, one query per table
+    ids_by_table = {}
+    for change in changes:
+        if not change.deleted:
+            ids_by_table.setdefault(change.table_name, []).append(change.row_id)
+    rows = {}
+    for table_name, ids in ids_by_table.items():
+        model, fields = CHANGE_MODELS[table_name]
+        for row in session.execute(db.select(*project(model, fields)).where(model.id.in_(ids))):
+            rows[(table_name, row.id)] = row_to_dict(row, fields)
+
+    items = []
+    for change in changes:
+        item = {
+            'seq': change.seq,
+            'table': change.table_name,
+            'id': change.row_id,
+            'deleted': change.deleted,
+            'changed_at': serialize_value(change.changed_at)
+        }
+        if not change.deleted:
+            item['data'] = rows.get((change.table_name, change.row_id))
+            if item['data'] is None:
+                continue  # deleted since; its tombstone comes later in the feed
+        items.append(item)
+
+    return {
+        'changes': items,
+        'next_since': changes[-1].seq if changes else max(since, latest),
+        'has_more': has_more
+    }, 200
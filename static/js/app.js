@@ -37,6 +37,7 @@ function loadDashboard() {
     axios.get('/api/inventory/stats')
         .then(response => {
             const data = response.data;
+            dashboardTotals = { quantity: data.total_quantity, value: data.total_price };
             document.getElementById('totalProducts').textContent = data.total_products;
             document.getElementById('totalQuantity').textContent = data.total_quantity;
             document.getElementById('totalPrice').textContent = data.total_price.toFixed(2) + ' FCFA';
@@ -49,7 +50,8 @@ function loadDashboard() {
             } else {
                 data.categories.forEach(category => {
                     html += `
-                        <div class="category-section">
+                        <div class="category-section" data-category-id="${category.id}"
+                             data-product-count="${category.product_count}" data-total-quantity="${category.total_quantity}">
                             <h4>${category.name}</h4>
                             <p class="category-meta">${category.product_count} produits | ${category.total_quantity} articles en stock</p>
                             <table class="table">
@@ -66,11 +68,11 @@ function loadDashboard() {
                     category.products.forEach(product => {
                         const value = (product.price * product.quantity).toFixed(2);
                         html += `
-                            <tr>
+                            <tr data-product-id="${product.id}" data-price="${product.price}">
                                 <td>${product.name}</td>
                                 <td>${product.price.toFixed(2)} FCFA</td>
-                                <td>${product.quantity}</td>
-                                <td>${value} FCFA</td>
+                                <td class="stock-quantity">${product.quantity}</td>
+                                <td class="stock-value">${value} FCFA</td>
                             </tr>
                         `;
                     });
@@ -89,6 +91,57 @@ function loadDashboard() {
         });
 }
 
+// Live dashboard updates from the stock event stream
+let dashboardTotals = null;
+let stockStream = null;
+let dashboardReloadTimer = null;
+
+function connectStockStream() {
+    if (!window.EventSource || stockStream) return;
+    stockStream = new EventSource(window.STREAM_URL || '/api/stream/stock');
+    // Changes made while (re)connecting were not streamed to us
+    stockStream.onopen = scheduleDashboardReload;
+    // A refused stream (e.g. 503 from a busy worker) is not retried by the browser
+    stockStream.onerror = () => {
+        if (stockStream.readyState !== EventSource.CLOSED) return;
+        stockStream = null;
+        setTimeout(connectStockStream, 30000);
+    };
+    stockStream.addEventListener('stock', event => applyStockEvent(JSON.parse(event.data)));
+    ['product_created', 'product_updated', 'product_deleted', 'products_imported', 'category_created',
+     'category_deleted', 'resync']
+        .forEach(type => stockStream.addEventListener(type, scheduleDashboardReload));
+}
+
+function scheduleDashboardReload() {
+    // Coalesce bursts of catalog changes into one reload
+    clearTimeout(dashboardReloadTimer);
+    dashboardReloadTimer = setTimeout(loadDashboard, 250);
+}
+
+function applyStockEvent(change) {
+    const row = document.querySelector(`#inventoryByCategory tr[data-product-id="${change.product_id}"]`);
+    const section = document.querySelector(`#inventoryByCategory .category-section[data-category-id="${change.category_id}"]`);
+    if (!row || !section || !dashboardTotals) {
+        scheduleDashboardReload();
+        return;
+    }
+
+    const price = parseFloat(row.dataset.price);
+    row.querySelector('.stock-quantity').textContent = change.quantity;
+    row.querySelector('.stock-value').textContent = (price * change.quantity).toFixed(2) + ' FCFA';
+
+    const categoryQuantity = parseInt(section.dataset.totalQuantity, 10) + change.category_delta.quantity;
+    section.dataset.totalQuantity = categoryQuantity;
+    section.querySelector('.category-meta').textContent =
+        `${section.dataset.productCount} produits | ${categoryQuantity} articles en stock`;
+
+    dashboardTotals.quantity += change.category_delta.quantity;
+    dashboardTotals.value += change.category_delta.value;
+    document.getElementById('totalQuantity').textContent = dashboardTotals.quantity;
+    document.getElementById('totalPrice').textContent = dashboardTotals.value.toFixed(2) + ' FCFA';
+}
+
 function refreshDashboard(event) {
     if (event) event.preventDefault();
     loadDashboard();
@@ -97,7 +150,7 @@ function refreshDashboard(event) {
 
 // Product Functions
 function loadCategoriesForProduct() {
-    axios.get('/api/categories')
+    axios.get('/api/categories', { params: { fields: 'id,name' } })
         .then(response => {
             const select = document.getElementById('productCategory');
             select.innerHTML = '<option value="">Select a category</option>';
@@ -131,13 +184,26 @@ function addProduct(event) {
         });
 }
 
+// Every product, following next_cursor when the server pages the listing
+function fetchAllProducts(params = {}, cursor = null, products = []) {
+    return axios.get('/api/products', { params: { ...params, limit: 500, ...(cursor ? { cursor } : {}) } })
+        .then(response => {
+            const page = response.data;
+            if (Array.isArray(page)) {
+                return products.concat(page);
+            }
+            products = products.concat(page.products);
+            return page.has_more ? fetchAllProducts(params, page.next_cursor, products) : products;
+        });
+}
+
 // Transaction Functions
 function loadProductsForTransaction() {
-    axios.get('/api/products')
-        .then(response => {
+    fetchAllProducts({ fields: 'id,name,price' })
+        .then(products => {
             const select = document.getElementById('transactionProduct');
             select.innerHTML = '<option value="">Select a product</option>';
-            response.data.forEach(product => {
+            products.forEach(product => {
                 select.innerHTML += `<option value="${product.id}">${product.name} (${product.price.toFixed(2)} FCFA)</option>`;
             });
         })
@@ -169,14 +235,15 @@ function recordTransaction(event) {
 }
 
 function loadRecentTransactions() {
-    axios.get('/api/transactions')
+    axios.get('/api/transactions', { params: { limit: 10, expand: 'product', fields: 'id,type,quantity,reason,created_at' } })
         .then(response => {
+            const transactions = response.data.transactions;
             let html = '';
-            if (response.data.length === 0) {
+            if (transactions.length === 0) {
                 html = '<p class="empty-state">Aucune transaction enregistrée.</p>';
             } else {
                 html = '<table class="table"><thead><tr><th>Date</th><th>Produit</th><th>Type</th><th>Quantité</th><th>Raison</th></tr></thead><tbody>';
-                response.data.slice(0, 10).forEach(transaction => {
+                transactions.forEach(transaction => {
                     const date = new Date(transaction.created_at).toLocaleDateString('fr-FR');
                     html += `
                         <tr>
@@ -263,37 +330,67 @@ function deleteCategory(categoryId) {
 }
 
 function loadProductsList() {
-    axios.get('/api/products')
-        .then(response => {
-            let html = '';
-            if (response.data.length === 0) {
-                html = '<p class="empty-state">Aucun produit créé. Ajoutez-en un dans l\'onglet "Ajouter un produit".</p>';
+    const query = document.getElementById('productSearch')?.value.trim();
+    if (query) {
+        searchProducts(query);
+        return;
+    }
+    fetchAllProducts()
+        .then(products => {
+            if (products.length === 0) {
+                document.getElementById('productsList').innerHTML =
+                    '<p class="empty-state">Aucun produit créé. Ajoutez-en un dans l\'onglet "Ajouter un produit".</p>';
             } else {
-                html = '<div class="products-grid">';
-                response.data.forEach(product => {
-                    const quantity = product.inventory?.quantity || 0;
-                    const totalValue = (product.price * quantity).toFixed(2);
-                    html += `
-                        <div class="product-card">
-                            <div class="product-header">
-                                <h4>${product.name}</h4>
-                                <button class="btn btn-danger" onclick="deleteProduct('${product.id}')">Supprimer</button>
-                            </div>
-                            <p class="product-info"><strong>Code :</strong> ${product.sku}</p>
-                            <p class="product-info"><strong>Prix :</strong> ${product.price.toFixed(2)} FCFA</p>
-                            <p class="product-info"><strong>Stock :</strong> ${quantity} unités</p>
-                            <p class="product-info"><strong>Valeur :</strong> ${totalValue} FCFA</p>
-                            <p class="product-description">${product.description || 'Aucune description'}</p>
-                        </div>
-                    `;
-                });
-                html += '</div>';
+                renderProductCards(products);
             }
-            document.getElementById('productsList').innerHTML = html;
         })
         .catch(error => console.error('Erreur lors du chargement des produits:', error));
 }
 
+let productSearchTimer = null;
+
+function onProductSearch() {
+    // Wait for a pause in typing before querying
+    clearTimeout(productSearchTimer);
+    productSearchTimer = setTimeout(loadProductsList, 250);
+}
+
+function searchProducts(query) {
+    axios.get('/api/products/search', { params: { q: query, limit: 50 } })
+        .then(response => {
+            if (response.data.products.length === 0) {
+                document.getElementById('productsList').innerHTML =
+                    '<p class="empty-state">Aucun produit ne correspond à la recherche.</p>';
+            } else {
+                renderProductCards(response.data.products);
+            }
+        })
+        .catch(error => console.error('Erreur lors de la recherche des produits:', error));
+}
+
+function renderProductCards(products) {
+    let html = '<div class="products-grid">';
+    products.forEach(product => {
+        const quantity = product.inventory?.quantity || 0;
+        const totalValue = (product.price * quantity).toFixed(2);
+        html += `
+            <div class="product-card">
+                <div class="product-header">
+                    <h4>${product.name}</h4>
+                    <button class="btn btn-danger" onclick="deleteProduct('${product.id}')">Supprimer</button>
+                </div>
+                <p class="product-info"><strong>Code :</strong> ${product.sku}</p>
+                <p class="product-info"><strong>Prix :</strong> ${product.price.toFixed(2)} FCFA</p>
+                <p class="product-info"><strong>Stock :</strong> ${quantity} unités</p>
+                <p class="product-info"><strong>Valeur :</strong> ${totalValue} FCFA</p>
+                <p class="product-description">${product.description || 'Aucune description'}</p>
+            </div>
+        `;
+    });
+    html += '</div>';
+    document.getElementById('productsList').innerHTML = html;
+}
+
 function deleteProduct(productId) {
     if (confirm('Êtes-vous sûr de vouloir supprimer ce produit ? Cela supprimera également toutes ses transactions.')) {
         axios.delete(`/api/products/${productId}`)
@@ -327,6 +424,7 @@ document.addEventListener('DOMContentLoaded', () => {
     document.querySelector('.nav-link').classList.add('active');
     loadDashboard();
     loadCategoriesForProduct();
+    connectStockStream();
 });
 
 // Add CSS for badges and categories grid
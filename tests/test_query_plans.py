@@ -0,0 +1,230 @@
+"""
+EXPLAIN QUERY PLAN checks for the hot queries on a seeded SQLite database.
+
+A query fails when SQLite plans a full table scan (``SCAN <table>``
+without an index) or sorts through a temporary B-tree instead of reading
+an index in order.
+"""
+from datetime import datetime, timedelta
+import importlib
+import re
+import sqlite3
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, func, select
+
+from db import (db, Category, Inventory, Product, Transaction, categories_as_of_query, category_products_query,
+                change_feed_query, checkpoint_stock_query, latest_checkpoint_query, ledger_delta_query,
+                low_stock_query, product_by_sku_query, product_listing_query, product_stock_query,
+                rollup_stats_query, stock_query, transaction_export_query, transaction_page_query)
+
+CATEGORIES = 5
+PRODUCTS = 200
+TRANSACTIONS = 2000
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+def assert_indexed(plan):
+    details = [row[-1] for row in plan]
+    for detail in details:
+        assert not FULL_SCAN.match(detail), f'full scan: {details}'
+        assert 'TEMP B-TREE' not in detail, f'sort without index: {details}'
+
+
+def seed_rows():
+    start = datetime(2024, 1, 1)
+    categories = [{'id': str(uuid.uuid4()), 'name': f'Category {i}', 'description': '',
+                   'created_at': start, 'updated_at': start} for i in range(CATEGORIES)]
+    products = [{'id': str(uuid.uuid4()), 'name': f'Product {i}', 'sku': f'SKU-{i:05d}', 'price': 1.0 + i,
+                 'description': '', 'category_id': categories[i % CATEGORIES]['id'],
+                 'created_at': start + timedelta(minutes=i), 'updated_at': start}
+                for i in range(PRODUCTS)]
+    inventory = [{'id': str(uuid.uuid4()), 'product_id': p['id'], 'quantity': 10, 'last_updated': start}
+                 for p in products]
+    transactions = [{'id': str(uuid.uuid4()), 'product_id': products[i % PRODUCTS]['id'],
+                     'type': 'ENTRY' if i % 3 else 'EXIT', 'quantity': 1, 'reason': '', 'notes': '',
+                     'created_at': start + timedelta(seconds=i), 'updated_at': start}
+                    for i in range(TRANSACTIONS)]
+    return categories, products, inventory, transactions
+
+
+@pytest.fixture(scope='module')
+def engine():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    categories, products, inventory, transactions = seed_rows()
+    with engine.begin() as conn:
+        conn.execute(Category.__table__.insert(), categories)
+        conn.execute(Product.__table__.insert(), products)
+        conn.execute(Inventory.__table__.insert(), inventory)
+        conn.execute(Transaction.__table__.insert(), transactions)
+    return engine
+
+
+def explain(engine, stmt):
+    compiled = stmt.compile(dialect=engine.dialect, compile_kwargs={'render_postcompile': True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    params = tuple(p.isoformat(' ') if isinstance(p, datetime) else p for p in params)
+    with engine.connect() as conn:
+        return conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).all()
+
+
+CURSOR = (datetime(2024, 1, 1, 0, 10), 'ffffffff')
+
+AS_OF = datetime(2024, 1, 1, 0, 20)
+PRODUCT_COLUMNS = [Product.id, Product.name, Product.price, Product.category_id]
+TRANSACTION_COLUMNS = [Transaction.id, Transaction.created_at]
+EXPAND_COLUMNS = [Product.sku, func.coalesce(Inventory.quantity, 0)]
+
+ORM_QUERIES = {
+    'transactions page': transaction_page_query(TRANSACTION_COLUMNS, limit=51),
+    'transactions next page': transaction_page_query(
+        TRANSACTION_COLUMNS, [db.tuple_(Transaction.created_at, Transaction.id) < db.tuple_(*CURSOR)], 51),
+    'transactions page with products': transaction_page_query(TRANSACTION_COLUMNS, limit=51,
+                                                              product_columns=EXPAND_COLUMNS),
+    'product history': transaction_page_query(TRANSACTION_COLUMNS, [Transaction.product_id == 'p'], 51),
+    'transactions by type': transaction_page_query(TRANSACTION_COLUMNS, [Transaction.type == 'EXIT'], 51),
+    'transactions in date range': transaction_page_query(
+        TRANSACTION_COLUMNS,
+        [Transaction.created_at >= datetime(2024, 1, 1), Transaction.created_at < datetime(2024, 1, 2)], 51),
+    'count by type': select(func.count()).select_from(Transaction).where(Transaction.type == 'ENTRY'),
+    'products listing': product_listing_query(PRODUCT_COLUMNS),
+    'products listing with stock': product_listing_query(PRODUCT_COLUMNS, with_inventory=True),
+    'products as of': product_listing_query(PRODUCT_COLUMNS, as_of=AS_OF),
+    'category has products': category_products_query('c'),
+    'product by sku': product_by_sku_query('SKU-00001'),
+    'stock of product': stock_query('p'),
+    'low stock page': low_stock_query(limit=51),
+    'low stock next page': low_stock_query(after='p', limit=51),
+    'change feed page': change_feed_query(100).limit(501),
+    'change feed of one table': change_feed_query(100, 'products').limit(501),
+    'export': transaction_export_query(),
+    'export of one product': transaction_export_query([Transaction.product_id == 'p']),
+    'export in date range': transaction_export_query([Transaction.created_at >= datetime(2024, 1, 1)]),
+    'stats product detail': product_stock_query(),
+    'latest checkpoint': latest_checkpoint_query(AS_OF),
+    'checkpoint stock': checkpoint_stock_query(AS_OF),
+    'checkpoint stock of products': checkpoint_stock_query(AS_OF, ['p', 'q']),
+    'categories as of': categories_as_of_query(AS_OF),
+}
+
+
+@pytest.mark.parametrize('name', sorted(ORM_QUERIES))
+def test_orm_query_uses_index(engine, name):
+    assert_indexed(explain(engine, ORM_QUERIES[name]))
+
+
+def test_stats_rollup_reads_categories_by_key(engine):
+    # The rollup holds one row per category plus the global row and is read whole
+    details = [row[-1] for row in explain(engine, rollup_stats_query())]
+    assert details[0] == 'SCAN category_stock_rollup', details
+    assert all(detail.startswith('SEARCH categories USING INDEX') for detail in details[1:]), details
+
+
+@pytest.mark.parametrize('product_ids', [None, ['p', 'q']], ids=['all products', 'some products'])
+def test_as_of_ledger_reads_only_since_checkpoint(engine, product_ids):
+    # Grouping is unindexed, but only over the rows between the checkpoint and as_of
+    plan = [row for row in explain(engine, ledger_delta_query(AS_OF, CURSOR[0], product_ids))
+            if row[-1] != 'USE TEMP B-TREE FOR GROUP BY']
+    assert_indexed(plan)
+    assert any('created_at>? AND created_at<?' in row[-1] for row in plan), plan
+
+
+@pytest.fixture(scope='module')
+def sqlite_app(tmp_path_factory):
+    # app_sqlite creates inventory.db in the working directory on import
+    workdir = tmp_path_factory.mktemp('app_sqlite')
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(workdir)
+        app_sqlite = importlib.import_module('app_sqlite')
+        conn = app_sqlite.get_db_connection()
+        categories, products, inventory, transactions = seed_rows()
+        for table, rows in (('categories', categories), ('products', products),
+                            ('inventory', inventory), ('transactions', transactions)):
+            rows = [{k: v.isoformat() if isinstance(v, datetime) else v for k, v in row.items()} for row in rows]
+            columns = list(rows[0])
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [tuple(row[c] for c in columns) for row in rows])
+        conn.commit()
+        yield app_sqlite, conn
+
+
+class RecordingCursor:
+    """Stands in for a cursor and records the plan of the statement it is given"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.plan = None
+
+    def execute(self, sql, params=()):
+        self.plan = self.conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'limit': 50},
+    {'category_id': 'c', 'limit': 50},
+    {'limit': 50, 'after': CURSOR},
+    {'fields': ['id', 'name']},
+], ids=['all', 'page', 'category page', 'next page', 'projection'])
+def test_sqlite_product_listing_uses_index(sqlite_app, kwargs):
+    app_sqlite, conn = sqlite_app
+    cursor = RecordingCursor(conn)
+    app_sqlite.fetch_products(cursor, **kwargs)
+    assert_indexed(cursor.plan)
+
+
+def test_full_scan_is_detected():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE t (a, b)')
+    with pytest.raises(AssertionError):
+        assert_indexed(conn.execute('EXPLAIN QUERY PLAN SELECT * FROM t WHERE a = 1').fetchall())
+    with pytest.raises(AssertionError):
+        assert_indexed(conn.execute('EXPLAIN QUERY PLAN SELECT * FROM t ORDER BY b').fetchall())
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'after': CURSOR},
+    {'product_id': 'p'},
+    {'transaction_type': 'EXIT'},
+    {'start': datetime(2024, 1, 1), 'end': datetime(2024, 1, 2)},
+], ids=['page', 'next page', 'product history', 'by type', 'date range'])
+def test_sqlite_transactions_page_uses_index(sqlite_app, kwargs):
+    app_sqlite, conn = sqlite_app
+    cursor = RecordingCursor(conn)
+    app_sqlite.fetch_transactions(cursor, 50, **kwargs)
+    assert_indexed(cursor.plan)
+
+
+@pytest.mark.parametrize('helper, args', [
+    ('category_has_products', ('c',)),
+    ('fetch_stock', ('p',)),
+], ids=['category has products', 'stock of product'])
+def test_sqlite_lookup_uses_index(sqlite_app, helper, args):
+    app_sqlite, conn = sqlite_app
+    cursor = RecordingCursor(conn)
+    getattr(app_sqlite, helper)(cursor, *args)
+    assert_indexed(cursor.plan)
+
+
+@pytest.mark.parametrize('q', ['SKU-001', 'pr', 'product 1'], ids=['sku prefix', 'short name prefix', 'trigram'])
+def test_sqlite_search_reads_indexes(sqlite_app, q):
+    # Matches are collected into ``m`` and ranked by sorting, but only the
+    # candidates the indexes found; every table read must use an index
+    app_sqlite, conn = sqlite_app
+    cursor = RecordingCursor(conn)
+    app_sqlite.fetch_search_results(cursor, q, 20)
+    plan = [row for row in cursor.plan
+            if row[-1] not in ('SCAN m', 'USE TEMP B-TREE FOR ORDER BY') and not row[-1].startswith('SCAN (subquery')]
+    assert_indexed(plan)
+    assert any(row[-1].startswith('SEARCH products USING COVERING INDEX') for row in plan), plan